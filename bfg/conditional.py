@@ -0,0 +1,115 @@
+"""
+Conditional GET for public reference data
+
+Locations, routes and fares change rarely but are downloaded in full on
+every app launch. ConditionalGetMixin answers list and retrieve requests
+with an ETag and Last-Modified derived from a version stamp of the models
+behind the response (latest updated_at and row count of each), and returns
+304 Not Modified for a matching If-None-Match or If-Modified-Since before
+the queryset is evaluated or anything is serialized.
+
+Stamps are read from the database on every request, one aggregate per
+model, so every worker sees a write the moment it commits, whichever
+process made it. A deletion only lowers the row count, which
+If-Modified-Since cannot see; the apps' signal handlers therefore record
+the time of each write in the "shared" cache (invalidate_stamp) and
+that time counts as a change too.
+"""
+import hashlib
+import time
+from typing import Optional, Sequence, Tuple, Type
+
+from django.core.cache import caches
+from django.db.models import Count, Max, Model
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+
+STAMP_PREFIX = 'conditional-stamp:v2'
+
+
+def _changed_key(model: Type[Model]) -> str:
+    return f"{STAMP_PREFIX}:{model._meta.label_lower}:changed"
+
+
+def model_stamp(model: Type[Model]) -> Tuple[float, int]:
+    """(last change as a POSIX timestamp, row count) of a model with updated_at"""
+    totals = model._default_manager.aggregate(last=Max('updated_at'), count=Count('pk'))
+    last = totals['last'].timestamp() if totals['last'] else 0.0
+    # A deletion lowers the count but leaves max(updated_at) alone
+    changed = caches['shared'].get(_changed_key(model), 0.0)
+    return max(last, changed), totals['count']
+
+
+def invalidate_stamp(model: Type[Model]) -> None:
+    """Record that one of a model's rows was saved or deleted just now"""
+    caches['shared'].set(_changed_key(model), time.time(), timeout=None)
+
+
+def not_modified(request, etag: str, last_modified: Optional[float] = None) -> bool:
+    """
+    Whether the client's copy is current: If-None-Match when sent (weak
+    comparison), otherwise If-Modified-Since against last_modified
+    """
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        etags = {tag[2:] if tag.startswith('W/') else tag for tag in parse_etags(if_none_match)}
+        return '*' in etags or etag in etags
+    if last_modified is not None:
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return since is not None and int(last_modified) <= since
+    return False
+
+
+def conditional_response(
+    request,
+    etag: str,
+    render,
+    last_modified: Optional[float] = None,
+    max_age: int = 0
+):
+    """
+    304 if the client's copy is current, else render(); either way with
+    validators and a public Cache-Control of max_age seconds
+    """
+    if not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    else:
+        response = render()
+        if response.status_code >= 300:
+            return response
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=max_age)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin: conditional list and retrieve from model version stamps
+
+    conditional_models lists every model whose rows end up in the response
+    (nested serializers included); it defaults to the queryset's model.
+    Clients revalidate every time unless conditional_max_age is raised.
+    """
+    conditional_models: Sequence[Type[Model]] = ()
+    conditional_max_age = 0
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(request, super().retrieve, *args, **kwargs)
+
+    def conditional(self, request, handler, *args, **kwargs):
+        stamps = [model_stamp(model) for model in self.conditional_models or (self.queryset.model,)]
+        # Filters, pagination and the renderer all change the body
+        version = repr((stamps, request.get_full_path(), request.accepted_media_type))
+        etag = f'"{hashlib.sha1(version.encode()).hexdigest()}"'
+        return conditional_response(
+            request, etag, lambda: handler(request, *args, **kwargs),
+            last_modified=max(last for last, _ in stamps),
+            max_age=self.conditional_max_age
+        )
@@ -78,6 +78,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "bfg.wsgi.application"
 
+# Serve /v2/routes/calculate/ with the async view (enable when running bfg.asgi
+# under uvicorn workers, see start.sh)
+ASYNC_ROUTE_CALCULATION = config('ASYNC_ROUTE_CALCULATION', default=False, cast=bool)
+
 # Database - PostgreSQL
 # Support both DATABASE_URL (Railway/production) and individual parameters (local)
 # SECURITY: No default value - must be set in .env file
@@ -257,6 +261,113 @@ CORS_PREFLIGHT_MAX_AGE = 3600
 GOOGLE_MAPS_API_KEY = config('GOOGLE_MAPS_API_KEY', default='')
 # Server-side key (for Distance Matrix, Directions APIs - no referrer restrictions)
 GOOGLE_MAPS_SERVER_API_KEY = config('GOOGLE_MAPS_SERVER_API_KEY', default='')
+GOOGLE_MAPS_BASE_URL = config('GOOGLE_MAPS_BASE_URL', default='https://maps.googleapis.com')
+
+# Shared Google Maps client: per-call timeouts and an overall deadline (seconds)
+GOOGLE_MAPS_CONNECT_TIMEOUT = config('GOOGLE_MAPS_CONNECT_TIMEOUT', default=2.0, cast=float)
+GOOGLE_MAPS_READ_TIMEOUT = config('GOOGLE_MAPS_READ_TIMEOUT', default=4.0, cast=float)
+GOOGLE_MAPS_DEADLINE = config('GOOGLE_MAPS_DEADLINE', default=5.0, cast=float)
+GOOGLE_MAPS_POOL_SIZE = config('GOOGLE_MAPS_POOL_SIZE', default=10, cast=int)
+# Threads available to async views for concurrent Google calls (per worker)
+GOOGLE_MAPS_ASYNC_THREADS = config('GOOGLE_MAPS_ASYNC_THREADS', default=64, cast=int)
+# Fall back to GPS without calling Google after this many consecutive failures
+GOOGLE_MAPS_BREAKER_THRESHOLD = config('GOOGLE_MAPS_BREAKER_THRESHOLD', default=5, cast=int)
+GOOGLE_MAPS_BREAKER_RESET_SECONDS = config('GOOGLE_MAPS_BREAKER_RESET_SECONDS', default=30.0, cast=float)
+
+# Caches
+# The "shared" alias carries only the version tokens that tell every gunicorn
+# worker and management command to rebuild its in-memory tables after a write
+# (bfg/versions.py), and the change times behind conditional GETs
+# (bfg/conditional.py). It must be shared by all processes: DatabaseCache (its
+# table is made by createcachetable, which start.sh runs) or Redis. With
+# DatabaseCache every token check is one small SELECT (the in-memory tables
+# check at most once a second per worker); Redis avoids the database round trip.
+# The "default" cache holds throttling counters and responses built from the
+# in-memory tables (snapshots, tiles, simplified boundaries). Their keys carry
+# the version tokens, so the per-process LocMemCache stays correct without a
+# round trip per request; throttle rates then apply per worker. Point
+# CACHE_BACKEND at Redis to share them.
+# The "routes" alias holds Google Directions results keyed on snapped coordinates.
+# LocMemCache evicts least recently used entries past MAX_ENTRIES; use
+# django.core.cache.backends.db.DatabaseCache (run createcachetable) or Redis
+# to keep cached routes across restarts and share them between workers.
+CACHE_BACKEND = config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+SHARED_CACHE_BACKEND = config('SHARED_CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache')
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": config('CACHE_LOCATION', default='bfg_default'),
+        # Redis evicts by its own policy and rejects MAX_ENTRIES
+        "OPTIONS": {} if 'redis' in CACHE_BACKEND.lower() else {
+            "MAX_ENTRIES": config('CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    },
+    "shared": {
+        "BACKEND": SHARED_CACHE_BACKEND,
+        "LOCATION": config('SHARED_CACHE_LOCATION', default='bfg_cache'),
+        "OPTIONS": {} if 'redis' in SHARED_CACHE_BACKEND.lower() else {
+            "MAX_ENTRIES": config('SHARED_CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    },
+    "routes": {
+        "BACKEND": config('ROUTE_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": config('ROUTE_CACHE_LOCATION', default='route_cache'),
+        "TIMEOUT": config('ROUTE_CACHE_TTL', default=7 * 24 * 3600, cast=int),  # seconds
+        "OPTIONS": {
+            "MAX_ENTRIES": config('ROUTE_CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    },
+}
+
+# Grid size (metres) that origin/destination are snapped to before cache lookup
+ROUTE_CACHE_GRID_METERS = config('ROUTE_CACHE_GRID_METERS', default=25, cast=float)
+
+# Identical route lookups in flight are always coalesced within a process. With a
+# shared backend (DatabaseCache/Redis) also hold a lock in the routes cache so
+# other workers wait for the result instead of calling Google themselves.
+ROUTE_CACHE_LOCK_ACROSS_WORKERS = config('ROUTE_CACHE_LOCK_ACROSS_WORKERS', default=False, cast=bool)
+# How long (seconds) a fill lock is held at most, and how long waiters wait for it
+ROUTE_CACHE_LOCK_TIMEOUT = config('ROUTE_CACHE_LOCK_TIMEOUT', default=6.0, cast=float)
+
+# GPS fallback: grid (metres) that calibrate_road_multipliers fits road/straight-line
+# ratios on, and the fewest Google Maps quotes a cell or cell pair needs to get its own
+ROAD_MULTIPLIER_CELL_METERS = config('ROAD_MULTIPLIER_CELL_METERS', default=2000, cast=int)
+ROAD_MULTIPLIER_MIN_SAMPLES = config('ROAD_MULTIPLIER_MIN_SAMPLES', default=5, cast=int)
+
+# Offline road network (GeoJSON, OSM XML or an .npz from build_road_graph) used for
+# quotes between Google Maps and the GPS estimate; empty disables it. Points
+# further than ROAD_GRAPH_MAX_SNAP_METERS from any road fall back to GPS.
+ROAD_GRAPH_PATH = config('ROAD_GRAPH_PATH', default='')
+ROAD_GRAPH_MAX_SNAP_METERS = config('ROAD_GRAPH_MAX_SNAP_METERS', default=300.0, cast=float)
+
+# Nearest-location index: grid (metres) that Locations are bucketed on, and how far
+# (metres) a quote endpoint may be from a Location to be tagged with it
+LOCATION_INDEX_CELL_METERS = config('LOCATION_INDEX_CELL_METERS', default=1000, cast=int)
+LOCATION_MATCH_MAX_METERS = config('LOCATION_MATCH_MAX_METERS', default=500.0, cast=float)
+
+# Vector tiles of locations: MBTiles file written by generate_vector_tiles, how
+# long (seconds) clients may cache a tile, and the highest zoom level built on
+# demand when the file does not cover it (clients overzoom beyond it)
+VECTOR_TILES_PATH = config('VECTOR_TILES_PATH', default=str(BASE_DIR / 'tiles' / 'locations.mbtiles'))
+VECTOR_TILES_MAX_AGE = config('VECTOR_TILES_MAX_AGE', default=7 * 24 * 3600, cast=int)
+VECTOR_TILES_ON_DEMAND_MAX_ZOOM = config('VECTOR_TILES_ON_DEMAND_MAX_ZOOM', default=16, cast=int)
+
+# Quote history: every quote served by /v2/routes/calculate/ is recorded as a
+# FareCalculation by a background writer, one bulk insert per FLUSH_ROWS quotes or
+# FLUSH_MS milliseconds. Batches that cannot be written are spooled to SPOOL_DIR
+# until the flush_quote_history command loads them.
+QUOTE_HISTORY_ENABLED = config('QUOTE_HISTORY_ENABLED', default=True, cast=bool)
+QUOTE_HISTORY_FLUSH_ROWS = config('QUOTE_HISTORY_FLUSH_ROWS', default=500, cast=int)
+QUOTE_HISTORY_FLUSH_MS = config('QUOTE_HISTORY_FLUSH_MS', default=1000, cast=int)
+QUOTE_HISTORY_SPOOL_DIR = config('QUOTE_HISTORY_SPOOL_DIR', default=str(BASE_DIR / 'spool' / 'quote_history'))
+
+# History partitions: FareCalculation and DiscountUsageLog are split into monthly
+# partitions (PostgreSQL) by the partition_history command, which keeps AHEAD months
+# ready and archives partitions older than RETENTION_MONTHS (0 keeps everything) to
+# gzipped CSV files in ARCHIVE_DIR.
+HISTORY_PARTITIONS_AHEAD = config('HISTORY_PARTITIONS_AHEAD', default=3, cast=int)
+HISTORY_RETENTION_MONTHS = config('HISTORY_RETENTION_MONTHS', default=12, cast=int)
+HISTORY_ARCHIVE_DIR = config('HISTORY_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'history'))
 
 # File Upload Settings
 MAX_UPLOAD_SIZE = 5242880  # 5MB
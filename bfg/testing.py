@@ -0,0 +1,50 @@
+"""
+Helpers shared by the apps' tests
+"""
+from typing import Callable, Dict, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+# The shared cache is a database table out of the box, so its reads would
+# show up in assertNumQueries, and SQLite locks it for other threads once the
+# test transaction has written to it. Tests that count ORM queries or run
+# work in threads use per-process caches instead:
+# @override_settings(CACHES=LOCAL_CACHES)
+LOCAL_CACHES = dict(settings.CACHES, default={
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'tests',
+}, shared={
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'tests-shared',
+})
+
+
+class ListQueryCountMixin:
+    """
+    For TestCases of list endpoints: the number of queries of a page must
+    not grow with the rows on it (no query per row in the serializers)
+    """
+
+    def list_queries(self, path: str) -> Tuple[Dict, int]:
+        """(JSON body, number of queries) of a GET to path"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def assertListQueries(self, path: str, add_rows: Callable[[int], None], expected: int,
+                          small: int = 2, large: int = 20) -> Dict:
+        """
+        Load path with small rows, then with large more through add_rows(n),
+        and check both cost the expected queries; returns the larger page
+        """
+        add_rows(small)
+        _, small_queries = self.list_queries(path)
+        add_rows(large)
+        page, large_queries = self.list_queries(path)
+        self.assertEqual(large_queries, small_queries, path)
+        self.assertEqual(large_queries, expected, path)
+        return page
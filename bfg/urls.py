@@ -17,9 +17,12 @@ from users.views import (
     DiscountUsageLogViewSet, IncidentViewSet, FareCalculationViewSet
 )
 from users import auth_views
-from locations.views import LocationViewSet
-from routes.views import RouteViewSet, calculate_route
-from fares.views import FareViewSet
+from locations.views import LocationViewSet, vector_tile
+from routes.views import (
+    RouteViewSet, calculate_route, calculate_route_async, calculate_fares_batch,
+    route_cache_stats
+)
+from fares.views import FareViewSet, snapshot, sync
 
 # Create router for ViewSets
 router = DefaultRouter()
@@ -45,6 +48,8 @@ def api_root(request):
             'locations': '/v2/locations/',
             'routes': '/v2/routes/',
             'fares': '/v2/fares/',
+            'snapshot': '/v2/snapshot/',
+            'sync': '/v2/sync/',
             'users': '/v2/users/',
             'vehicles': '/v2/vehicles/',
             'admin': '/admin/',
@@ -74,8 +79,22 @@ urlpatterns = [
     path('v2/auth/profile/', auth_views.update_user_profile, name='update-profile'),
     path('v2/auth/token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
     
-    # Route calculation endpoint
-    path('v2/routes/calculate/', calculate_route, name='calculate-route'),
+    # Route calculation endpoint (async-native view when running under ASGI workers)
+    path(
+        'v2/routes/calculate/',
+        calculate_route_async if settings.ASYNC_ROUTE_CALCULATION else calculate_route,
+        name='calculate-route'
+    ),
+    path('v2/routes/calculate/async/', calculate_route_async, name='calculate-route-async'),
+    path('v2/routes/calculate/batch/', calculate_fares_batch, name='calculate-fares-batch'),
+    path('v2/routes/cache-stats/', route_cache_stats, name='route-cache-stats'),
+    
+    # Vector tiles of location boundaries and points
+    path('v2/tiles/<int:z>/<int:x>/<int:y>.mvt', vector_tile, name='vector-tile'),
+    
+    # Offline bundle of locations, routes, fares and fare rules
+    path('v2/snapshot/', snapshot, name='snapshot'),
+    path('v2/sync/', sync, name='sync'),
     
     # API routes from router
     path('v2/', include(router.urls)),
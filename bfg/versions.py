@@ -0,0 +1,96 @@
+"""
+Version tokens of data derived from the database
+
+Lookup tables built in memory (fare schedule, spatial index, boundaries,
+autocomplete, road multipliers) and responses cached from them are tagged
+with a token kept in the "shared" cache. Whoever changes the underlying
+rows replaces the token; every process compares it with the token its copy
+was built at. This only works across gunicorn workers and management
+commands when that cache is shared (DatabaseCache or Redis, see CACHES in
+settings.py).
+
+Tokens are random rather than counters, so a token evicted from the cache
+is replaced by a new one: holders of the old token rebuild once instead of
+mistaking a restarted count for their own.
+
+VersionedValue holds one such in-memory copy and rebuilds it when the token
+changes.
+"""
+import threading
+import time
+import uuid
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+from django.core.cache import caches
+
+T = TypeVar('T')
+
+
+def _new_token() -> str:
+    return uuid.uuid4().hex
+
+
+def shared_version(key: str) -> str:
+    """Current token under key, created if missing"""
+    cache = caches['shared']
+    version = cache.get(key)
+    if version is None:
+        # Two processes may race here; add() lets the first one win
+        cache.add(key, _new_token(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_shared_version(key: str) -> None:
+    """Replace the token under key, so every process rebuilds"""
+    caches['shared'].set(key, _new_token(), timeout=None)
+
+
+class VersionedValue(Generic[T]):
+    """
+    Process-local copy of build(), rebuilt when the token under key changes
+
+    local, if given, returns process-local parts of the version (such as a
+    setting the copy was built for); a change there rebuilds immediately.
+    """
+
+    # Lookups run per request or per quote; poll the token at most this
+    # often instead of on every lookup
+    CHECK_SECONDS = 1.0
+
+    def __init__(
+        self,
+        key: str,
+        build: Callable[[], T],
+        local: Optional[Callable[[], Hashable]] = None
+    ):
+        self.key = key
+        self._build = build
+        self._local = local or (lambda: None)
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def get(self) -> T:
+        value = self._value
+        local = self._local()
+        if (value is not None and self._version[1] == local
+                and time.monotonic() - self._checked_at < self.CHECK_SECONDS):
+            return value
+
+        version = (shared_version(self.key), local)
+        if value is None or version != self._version:
+            with self._lock:
+                if self._value is None or version != self._version:
+                    self._value = self._build()
+                    self._version = version
+                value = self._value
+        self._checked_at = time.monotonic()
+        return value
+
+    def invalidate(self) -> None:
+        """Drop this process' copy and tell other processes to rebuild"""
+        with self._lock:
+            self._value = None
+        bump_shared_version(self.key)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Fare
+from .models import Fare, ReferenceChange, RoadMultiplier
 
 
 @admin.register(Fare)
@@ -14,3 +14,31 @@ class FareAdmin(admin.ModelAdmin):
     ordering = ['-effective_date']
     raw_id_fields = ['route']
     readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(RoadMultiplier)
+class RoadMultiplierAdmin(admin.ModelAdmin):
+    """Admin for fitted GPS road multipliers"""
+    list_display = [
+        'scope', 'cell_meters', 'lat_cell', 'lng_cell',
+        'other_lat_cell', 'other_lng_cell', 'multiplier', 'samples', 'fitted_at'
+    ]
+    list_filter = ['scope', 'cell_meters']
+    readonly_fields = ['fitted_at']
+
+
+@admin.register(ReferenceChange)
+class ReferenceChangeAdmin(admin.ModelAdmin):
+    """Read-only view of the reference data change log"""
+    list_display = ['id', 'kind', 'object_id', 'action', 'changed_at']
+    list_filter = ['kind', 'action']
+    search_fields = ['object_id']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
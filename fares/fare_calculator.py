@@ -3,12 +3,22 @@ Fare calculation service - replicates the Next.js fare calculation logic
 Based on Municipal Ordinance 105 Series of 2023
 """
 from decimal import Decimal, ROUND_HALF_UP
+import asyncio
+import inspect
 import math
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from asgiref.sync import sync_to_async
 from django.conf import settings
 import googlemaps
+import numpy as np
 from datetime import datetime
 
+from locations.models import LocationDistance
+from .maps_client import CircuitOpenError, get_breaker, get_maps_client, get_maps_executor
+from .road_graph import road_graph_distance
+from .road_multipliers import road_multipliers
+from .route_cache import route_cache
+
 
 class FareCalculator:
     """
@@ -24,6 +34,9 @@ class FareCalculator:
     BASE_DISTANCE_KM = Decimal('3.00')
     ADDITIONAL_RATE_PER_KM = Decimal('3.00')
     DISCOUNT_RATE = Decimal('0.20')  # 20%
+    DISCOUNTED_PASSENGER_TYPES = ('SENIOR', 'PWD', 'STUDENT')
+    # Longer than any trip on Earth; keeps calculate_fares within int64
+    MAX_BATCH_DISTANCE_KM = 40075.0
     
     @staticmethod
     def round_to_nearest_half(amount: Decimal) -> Decimal:
@@ -86,16 +99,188 @@ class FareCalculator:
             }
         }
 
+    @classmethod
+    def calculate_fares(
+        cls,
+        distances: Sequence[float],
+        passenger_types: Union[str, Sequence[str], None] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        Vectorized calculate_fare over arrays of distances
+
+        Money is kept as integers (centavos, and micro-pesos while applying
+        the discount) so every fare is exact; converting to float at the end
+        gives results bit-identical to float(calculate_fare(...)[...]) for
+        every distance up to MAX_BATCH_DISTANCE_KM.
+
+        Args:
+            distances: Distances in kilometers
+            passenger_types: One passenger type for every distance, or a
+                sequence of passenger types of the same length
+
+        Returns:
+            Dict of float arrays: fare, original_fare, discount_applied
+
+        Raises:
+            ValueError: A distance is negative, not finite or beyond
+                MAX_BATCH_DISTANCE_KM
+        """
+        distance = np.asarray(distances, dtype=np.float64)
+        # NaN fails both comparisons, so test for the good range
+        if not np.all((distance >= 0) & (distance <= cls.MAX_BATCH_DISTANCE_KM)):
+            raise ValueError(
+                f"distances must be finite, between 0 and {cls.MAX_BATCH_DISTANCE_KM:g} km"
+            )
+        if passenger_types is None or isinstance(passenger_types, str):
+            discounted = np.full(distance.shape, passenger_types in cls.DISCOUNTED_PASSENGER_TYPES)
+        else:
+            discounted = np.isin(np.asarray(passenger_types), cls.DISCOUNTED_PASSENGER_TYPES)
+            if discounted.shape != distance.shape:
+                raise ValueError("passenger_types must match distances in length")
+
+        base_fare = int(cls.BASE_FARE * 100)
+        rate_per_km = int(cls.ADDITIONAL_RATE_PER_KM * 100)
+        discount_bp = int(cls.DISCOUNT_RATE * 10000)
+
+        # Every started kilometer beyond the base distance is charged
+        additional_km = np.ceil(
+            np.maximum(distance - float(cls.BASE_DISTANCE_KM), 0.0)
+        ).astype(np.int64)
+        original = cls._round_centavos_to_half(base_fare + additional_km * rate_per_km)
+
+        # Micro-pesos: centavos x basis points
+        discount = np.where(discounted, original * discount_bp, 0)
+        final_micro = original * 10000 - discount
+        final = np.where(
+            discounted,
+            (2 * final_micro + 500000) // 1000000 * 50,
+            original
+        )
+
+        return {
+            'fare': final / 100,
+            'original_fare': original / 100,
+            'discount_applied': discount / 1000000,
+        }
+
+    @staticmethod
+    def _round_centavos_to_half(centavos: np.ndarray) -> np.ndarray:
+        """Integer equivalent of round_to_nearest_half for non-negative centavos"""
+        return (2 * centavos + 50) // 100 * 50
+
+
+class CentavoFareCalculator:
+    """
+    Integer-only fast path for the Ordinance 105 rules
+
+    Money is kept in centavos and distance in whole metres, so a quote is a
+    handful of int operations. Results match FareCalculator exactly; see
+    the equivalence test in fares/tests.py.
+    """
+
+    BASE_FARE = int(FareCalculator.BASE_FARE * 100)
+    BASE_DISTANCE_M = int(FareCalculator.BASE_DISTANCE_KM * 1000)
+    ADDITIONAL_RATE_PER_KM = int(FareCalculator.ADDITIONAL_RATE_PER_KM * 100)
+    DISCOUNT_PERCENT = int(FareCalculator.DISCOUNT_RATE * 100)
+
+    @staticmethod
+    def round_to_nearest_half(centavos: int) -> int:
+        """Round non-negative centavos to nearest 50 (half up)"""
+        return (2 * centavos + 50) // 100 * 50
+
+    @classmethod
+    def calculate_fare(cls, distance_m: int, discounted: bool = False) -> Tuple[int, int, int, int]:
+        """
+        Calculate fare in centavos
+
+        Args:
+            distance_m: Distance in whole metres
+            discounted: Whether the 20% passenger discount applies
+
+        Returns:
+            Tuple of (fare, original_fare, discount_applied, additional_km)
+        """
+        if distance_m <= cls.BASE_DISTANCE_M:
+            additional_km = 0
+        else:
+            # Every started kilometer beyond the base distance is charged
+            additional_km = (distance_m - cls.BASE_DISTANCE_M + 999) // 1000
+
+        original_fare = cls.round_to_nearest_half(
+            cls.BASE_FARE + additional_km * cls.ADDITIONAL_RATE_PER_KM
+        )
+
+        if not discounted:
+            return original_fare, original_fare, 0, additional_km
+
+        # A multiple of 50 centavos times a whole even percent is whole centavos
+        discount = original_fare * cls.DISCOUNT_PERCENT // 100
+        return cls.round_to_nearest_half(original_fare - discount), original_fare, discount, additional_km
+
+    @classmethod
+    def fare_breakdown(cls, distance_m: int, discounted: bool = False) -> Dict:
+        """Fare dict as returned by calculate_route_with_fare (floats)"""
+        fare, original_fare, discount, additional_km = cls.calculate_fare(distance_m, discounted)
+        additional_m = max(distance_m - cls.BASE_DISTANCE_M, 0)
+        return {
+            'fare': fare / 100,
+            'original_fare': original_fare / 100,
+            'discount_applied': discount / 100,
+            'breakdown': {
+                'base_fare': cls.BASE_FARE / 100,
+                'base_distance_km': cls.BASE_DISTANCE_M / 1000,
+                'additional_distance_km': additional_m / 1000,
+                'additional_fare': additional_km * cls.ADDITIONAL_RATE_PER_KM / 100,
+                'distance_km': distance_m / 1000,
+            }
+        }
+
 
 class GoogleMapsService:
     """Service for Google Maps API integration"""
+
+    # Distance Matrix limits: at most 25 origins or 25 destinations per
+    # request, and at most 100 elements (origins x destinations) in total
+    MAX_MATRIX_DIMENSION = 25
+    MAX_MATRIX_ELEMENTS = 100
+
+    def __init__(self, client: Optional[googlemaps.Client] = None):
+        # Shared, connection-pooled client (see maps_client.py)
+        self.client = client or get_maps_client()
+        self.breaker = get_breaker()
+    
+    def _call(self, method, **kwargs):
+        """Call the client through the circuit breaker"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("Google Maps circuit breaker is open")
+        try:
+            result = method(**kwargs)
+        except Exception as e:
+            if self.is_upstream_failure(e):
+                self.breaker.record_failure()
+            else:
+                # Not Google's fault (a bad request); also ends a trial call
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
     
-    def __init__(self):
-        # Use server API key (no referrer restrictions) for server-side APIs
-        api_key = settings.GOOGLE_MAPS_SERVER_API_KEY or settings.GOOGLE_MAPS_API_KEY
-        if not api_key:
-            raise ValueError("GOOGLE_MAPS_SERVER_API_KEY not configured in settings")
-        self.client = googlemaps.Client(key=api_key)  # type: ignore
+    @staticmethod
+    def is_upstream_failure(error: Exception) -> bool:
+        """
+        Whether an error means Google is unhealthy (counted by the breaker)
+
+        Timeouts, transport errors, HTTP 5xx and rate limiting are; API
+        errors about the request (NOT_FOUND, ZERO_RESULTS, INVALID_REQUEST,
+        MAX_ROUTE_LENGTH_EXCEEDED, ...) are not, so unroutable points sent
+        by callers cannot open the breaker for everyone.
+        """
+        if isinstance(error, googlemaps.exceptions.HTTPError):
+            return error.status_code >= 500
+        if isinstance(error, googlemaps.exceptions.ApiError):
+            # UNKNOWN_ERROR is Google's status for a server-side error
+            return error.status in ('OVER_QUERY_LIMIT', 'UNKNOWN_ERROR')
+        return isinstance(error, (googlemaps.exceptions.Timeout, googlemaps.exceptions.TransportError))
     
     def get_route_distance(
         self,
@@ -113,7 +298,8 @@ class GoogleMapsService:
             Dict with distance, duration, and route info or None if failed
         """
         try:
-            result = self.client.distance_matrix(  # type: ignore
+            result = self._call(
+                self.client.distance_matrix,  # type: ignore
                 origins=[origin],
                 destinations=[destination],
                 mode='driving',
@@ -147,7 +333,52 @@ class GoogleMapsService:
         except Exception as e:
             print(f"Google Maps API error: {e}")
             return None
-    
+
+    def get_distance_matrix(
+        self,
+        origins: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]]
+    ) -> Optional[List[List[Optional[Dict]]]]:
+        """
+        Get distances for every origin/destination pair in one Distance Matrix call
+
+        Callers are responsible for keeping the request within the API limits
+        (see MAX_MATRIX_DIMENSION and MAX_MATRIX_ELEMENTS).
+
+        Args:
+            origins: List of (latitude, longitude) tuples
+            destinations: List of (latitude, longitude) tuples
+
+        Returns:
+            Grid indexed [origin][destination] of dicts with distance meters and
+            duration seconds (None for pairs without a route), or None if failed
+        """
+        try:
+            result = self._call(
+                self.client.distance_matrix,  # type: ignore
+                origins=origins,
+                destinations=destinations,
+                mode='driving',
+                units='metric'
+            )
+
+            if result['status'] != 'OK':
+                return None
+
+            return [
+                [
+                    {
+                        'meters': element['distance']['value'],
+                        'seconds': element['duration']['value']
+                    } if element['status'] == 'OK' else None
+                    for element in row['elements']
+                ]
+                for row in result['rows']
+            ]
+        except Exception as e:
+            print(f"Google Maps Distance Matrix API error: {e}")
+            return None
+
     def get_detailed_route(
         self,
         origin: Tuple[float, float],
@@ -164,7 +395,8 @@ class GoogleMapsService:
             Dict with polyline and detailed route info or None if failed
         """
         try:
-            result = self.client.directions(  # type: ignore
+            result = self._call(
+                self.client.directions,  # type: ignore
                 origin=origin,
                 destination=destination,
                 mode='driving',
@@ -205,10 +437,53 @@ class GoogleMapsService:
             return None
 
 
+class AsyncGoogleMapsService:
+    """
+    Awaitable facade over GoogleMapsService for ASGI views
+
+    Calls run on the shared pooled client in a dedicated thread pool
+    (GOOGLE_MAPS_ASYNC_THREADS) and are cut off at GOOGLE_MAPS_DEADLINE, so
+    a slow Google response never blocks the event loop.
+    """
+    
+    def __init__(self, service: Optional[GoogleMapsService] = None):
+        self.service = service or GoogleMapsService()
+    
+    async def _run(self, method, *args):
+        try:
+            return await asyncio.wait_for(
+                sync_to_async(method, thread_sensitive=False, executor=get_maps_executor())(*args),
+                timeout=settings.GOOGLE_MAPS_DEADLINE
+            )
+        except asyncio.TimeoutError:
+            self.service.breaker.record_failure()
+            print("Google Maps API error: deadline exceeded")
+            return None
+    
+    async def get_route_distance(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float]
+    ) -> Optional[Dict]:
+        """Async GoogleMapsService.get_route_distance"""
+        return await self._run(self.service.get_route_distance, origin, destination)
+    
+    async def get_detailed_route(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float]
+    ) -> Optional[Dict]:
+        """Async GoogleMapsService.get_detailed_route"""
+        return await self._run(self.service.get_detailed_route, origin, destination)
+
+
 class GPSDistanceCalculator:
     """Calculate distance using Haversine formula (GPS-only fallback)"""
     
     EARTH_RADIUS_KM = 6371.0
+    # Road network multiplier (roads are not straight lines): 40% longer.
+    # Used where calibrate_road_multipliers has not fitted one for the area.
+    ROAD_MULTIPLIER = 1.4
     
     @classmethod
     def calculate_distance(
@@ -248,10 +523,86 @@ class GPSDistanceCalculator:
         distance = cls.EARTH_RADIUS_KM * c
         
         # Apply road network multiplier (roads are not straight lines)
-        # Default multiplier: 1.4 (40% longer than straight line)
-        road_multiplier = 1.4
+        return distance * road_multipliers.lookup(origin, destination, cls.ROAD_MULTIPLIER)
+    
+    @classmethod
+    def calculate_distances(
+        cls,
+        origins: Union[Sequence[Tuple[float, float]], np.ndarray],
+        destinations: Union[Sequence[Tuple[float, float]], np.ndarray]
+    ) -> np.ndarray:
+        """
+        Vectorized calculate_distance over pairs of coordinates
+        
+        Args:
+            origins: (N, 2) array-like of (latitude, longitude)
+            destinations: (N, 2) array-like of (latitude, longitude); a single
+                point is broadcast against every origin (and vice versa)
+        
+        Returns:
+            Array of N distances in kilometers (road multiplier applied)
+        """
+        origins = cls._as_points(origins)
+        destinations = cls._as_points(destinations)
+        return cls.straight_line_distances(origins, destinations) * road_multipliers.lookup_many(
+            origins, destinations, cls.ROAD_MULTIPLIER
+        )
+    
+    @classmethod
+    def straight_line_distances(
+        cls,
+        origins: Union[Sequence[Tuple[float, float]], np.ndarray],
+        destinations: Union[Sequence[Tuple[float, float]], np.ndarray]
+    ) -> np.ndarray:
+        """Great-circle distances in kilometers, without a road multiplier"""
+        origins = cls._as_points(origins)
+        destinations = cls._as_points(destinations)
+        return cls._haversine(
+            origins[..., 0], origins[..., 1],
+            destinations[..., 0], destinations[..., 1]
+        )
+    
+    @classmethod
+    def pairwise_matrix(
+        cls,
+        points: Union[Sequence[Tuple[float, float]], np.ndarray]
+    ) -> np.ndarray:
+        """
+        Distances between every pair of points
+        
+        Args:
+            points: (N, 2) array-like of (latitude, longitude)
         
-        return distance * road_multiplier
+        Returns:
+            (N, N) array where [i, j] is the distance in kilometers from
+            points[i] to points[j] (road multiplier applied)
+        """
+        points = cls._as_points(points)
+        lat, lng = points[:, 0], points[:, 1]
+        return cls._haversine(
+            lat[:, None], lng[:, None], lat[None, :], lng[None, :]
+        ) * road_multipliers.lookup_many(
+            points[:, None, :], points[None, :, :], cls.ROAD_MULTIPLIER
+        )
+    
+    @staticmethod
+    def _as_points(points) -> np.ndarray:
+        points = np.asarray(points, dtype=np.float64)
+        if points.shape[-1:] != (2,):
+            raise ValueError("Points must be (latitude, longitude) pairs")
+        return points
+    
+    @classmethod
+    def _haversine(cls, lat1, lon1, lat2, lon2) -> np.ndarray:
+        """Great-circle distance in kilometers (same formula as the scalar path)"""
+        lat1_rad = np.radians(lat1)
+        lat2_rad = np.radians(lat2)
+        dlat = lat2_rad - lat1_rad
+        dlon = np.radians(lon2) - np.radians(lon1)
+        
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon / 2) ** 2
+        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+        return cls.EARTH_RADIUS_KM * c
 
 
 def calculate_route_with_fare(
@@ -259,7 +610,9 @@ def calculate_route_with_fare(
     destination: Tuple[float, float],
     discount_card=None,
     use_google_maps: bool = True,
-    passenger_type: str = 'REGULAR'
+    passenger_type: str = 'REGULAR',
+    origin_location_id: Optional[int] = None,
+    destination_location_id: Optional[int] = None
 ) -> Dict:
     """
     Complete route calculation with fare
@@ -268,39 +621,189 @@ def calculate_route_with_fare(
         origin: Tuple of (latitude, longitude)
         destination: Tuple of (latitude, longitude)
         discount_card: Optional DiscountCard model instance
-        use_google_maps: Whether to use Google Maps API (fallback to GPS if False)
+        use_google_maps: Whether to use Google Maps API (if False, or if it fails,
+            the offline road graph and then GPS are used)
         passenger_type: Passenger type (REGULAR, SENIOR, PWD, STUDENT) for discount
+        origin_location_id: Optional Location id of the origin
+        destination_location_id: Optional Location id of the destination
     
     Returns:
-        Dict with route info, distance, and fare calculation
+        Dict with route info, distance, and fare calculation. ``method`` is
+        one of distance_matrix, google_maps, road_graph or gps.
+        ``origin_location``/``destination_location`` are the Locations the
+        endpoints were attributed to (the given ids, else the nearest within
+        LOCATION_MATCH_MAX_METERS), or None.
     """
     method_used = 'gps'
     route_data = None
+    distance_m = None
+    
+    # Known location pairs are a single lookup in the precomputed matrix
+    if origin_location_id and destination_location_id:
+        distance_m = _matrix_distance_query(origin_location_id, destination_location_id).first()
+        if distance_m is not None:
+            method_used = 'distance_matrix'
     
-    # Try Google Maps first if enabled
-    if use_google_maps:
+    # Try Google Maps next if enabled (cached results cost no API quota)
+    if distance_m is None and use_google_maps:
         try:
-            gmaps = GoogleMapsService()
-            route_data = gmaps.get_detailed_route(origin, destination)
-            
+            # Concurrent identical lookups share a single Google call
+            route_data = route_cache.get_or_fetch(
+                origin, destination,
+                lambda: GoogleMapsService().get_detailed_route(origin, destination)
+            )
             if route_data:
-                distance_km = route_data['distance']['kilometers']
+                distance_m = route_data['distance']['meters']
                 method_used = 'google_maps'
-            else:
-                # Fallback to GPS
-                distance_km = GPSDistanceCalculator.calculate_distance(origin, destination)
         except Exception:
-            # Fallback to GPS
-            distance_km = GPSDistanceCalculator.calculate_distance(origin, destination)
-    else:
-        distance_km = GPSDistanceCalculator.calculate_distance(origin, destination)
+            route_data = None
+    
+    # Offline road network, when one is configured
+    if distance_m is None:
+        distance_m = road_graph_distance(origin, destination)
+        if distance_m is not None:
+            method_used = 'road_graph'
+    
+    # Fallback to GPS (estimate rounded to whole metres)
+    if distance_m is None:
+        distance_m = round(GPSDistanceCalculator.calculate_distance(origin, destination) * 1000)
+    
+    # Route tariffs from the compiled fare schedule take precedence
+    fare = None
+    if origin_location_id and destination_location_id:
+        from .schedule import fare_schedule
+        fare = fare_schedule.quote(
+            origin_location_id, destination_location_id, distance_m, passenger_type
+        )
+    
+    locations = _endpoint_locations(origin, destination, origin_location_id, destination_location_id)
+    return _route_result(
+        method_used, route_data, distance_m, passenger_type, discount_card, fare, locations
+    )
+
+
+async def acalculate_route_with_fare(
+    origin: Tuple[float, float],
+    destination: Tuple[float, float],
+    discount_card=None,
+    use_google_maps: bool = True,
+    passenger_type: str = 'REGULAR',
+    origin_location_id: Optional[int] = None,
+    destination_location_id: Optional[int] = None
+) -> Dict:
+    """
+    Async calculate_route_with_fare for ASGI views
+    
+    Same arguments and result as calculate_route_with_fare, except that
+    discount_card may also be an awaitable resolving to a DiscountCard (or
+    None), e.g. a pending ``afirst()`` query. It is awaited concurrently
+    with the distance lookup, so neither blocks the other, and cancelled if
+    the quote fails first.
+    """
+    card_task = asyncio.ensure_future(discount_card) if inspect.isawaitable(discount_card) else None
+    
+    async def resolve_card():
+        if card_task is not None:
+            return await card_task
+        return discount_card
+    
+    async def resolve_distance():
+        # Known location pairs are a single lookup in the precomputed matrix
+        if origin_location_id and destination_location_id:
+            distance_m = await _matrix_distance_query(
+                origin_location_id, destination_location_id
+            ).afirst()
+            if distance_m is not None:
+                return 'distance_matrix', None, distance_m
+        
+        # Try Google Maps next if enabled (cached results cost no API quota)
+        if use_google_maps:
+            try:
+                route_data = await route_cache.aget_or_fetch(
+                    origin, destination,
+                    lambda: AsyncGoogleMapsService().get_detailed_route(origin, destination)
+                )
+                if route_data:
+                    return 'google_maps', route_data, route_data['distance']['meters']
+            except Exception:
+                pass
+        
+        # Offline road network, when one is configured (loading it the first
+        # time takes a moment, so keep it off the event loop)
+        distance_m = await sync_to_async(road_graph_distance, thread_sensitive=False)(
+            origin, destination
+        )
+        if distance_m is not None:
+            return 'road_graph', None, distance_m
+        
+        # Fallback to GPS (estimate rounded to whole metres); the road
+        # multipliers it applies are loaded from the database when stale
+        distance_km = await sync_to_async(GPSDistanceCalculator.calculate_distance, thread_sensitive=False)(
+            origin, destination
+        )
+        return 'gps', None, round(distance_km * 1000)
+    
+    try:
+        card, (method_used, route_data, distance_m), locations = await asyncio.gather(
+            resolve_card(), resolve_distance(),
+            sync_to_async(_endpoint_locations)(
+                origin, destination, origin_location_id, destination_location_id
+            )
+        )
+    finally:
+        if card_task is not None and not card_task.done():
+            card_task.cancel()
+    
+    # Route tariffs from the compiled fare schedule take precedence
+    fare = None
+    if origin_location_id and destination_location_id:
+        from .schedule import fare_schedule
+        fare = await sync_to_async(fare_schedule.quote)(
+            origin_location_id, destination_location_id, distance_m, passenger_type
+        )
+    
+    return _route_result(method_used, route_data, distance_m, passenger_type, card, fare, locations)
+
+
+def _matrix_distance_query(origin_location_id: int, destination_location_id: int):
+    return LocationDistance.objects.filter(
+        origin_id=origin_location_id,
+        destination_id=destination_location_id
+    ).values_list('distance_meters', flat=True)
+
+
+def _endpoint_locations(
+    origin: Tuple[float, float],
+    destination: Tuple[float, float],
+    origin_location_id: Optional[int] = None,
+    destination_location_id: Optional[int] = None
+) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """Locations the origin and destination belong to (from the spatial index)"""
+    from locations.spatial_index import location_index
+    return (
+        location_index.match(origin, origin_location_id),
+        location_index.match(destination, destination_location_id)
+    )
+
+
+def _route_result(
+    method_used: str,
+    route_data: Optional[Dict],
+    distance_m: int,
+    passenger_type: str,
+    discount_card=None,
+    fare: Optional[Dict] = None,
+    locations: Tuple[Optional[Dict], Optional[Dict]] = (None, None)
+) -> Dict:
+    """Assemble the calculate_route_with_fare response"""
+    distance_km = distance_m / 1000.0
     
     # Determine discount rate based on passenger type
     discount_rate = None
     discount_info = None
     
     # Apply discount for eligible passenger types (20% discount)
-    if passenger_type in ['SENIOR', 'PWD', 'STUDENT']:
+    if passenger_type in FareCalculator.DISCOUNTED_PASSENGER_TYPES:
         discount_rate = 0.20  # 20% discount
         discount_info = {
             'passenger_type': passenger_type,
@@ -314,9 +817,10 @@ def calculate_route_with_fare(
             discount_info['discount_type'] = discount_card.discount_type
             discount_info['id_number'] = discount_card.id_number
     
-    # Calculate fare
-    fare_result = FareCalculator.calculate_fare(distance_km, discount_rate)
-    breakdown = fare_result['breakdown']
+    # Without a route tariff apply the ordinance formula (integer fast path,
+    # identical to FareCalculator.calculate_fare)
+    if fare is None:
+        fare = CentavoFareCalculator.fare_breakdown(distance_m, discounted=discount_rate is not None)
     
     return {
         'success': True,
@@ -326,17 +830,8 @@ def calculate_route_with_fare(
             'kilometers': distance_km,
             'meters': distance_km * 1000
         },
-        'fare': {
-            'fare': float(fare_result['fare']),
-            'original_fare': float(fare_result['original_fare']),
-            'discount_applied': float(fare_result['discount_applied']),
-            'breakdown': {
-                'base_fare': float(breakdown['base_fare']),
-                'base_distance_km': float(breakdown['base_distance_km']),
-                'additional_distance_km': float(breakdown['additional_distance_km']),
-                'additional_fare': float(breakdown['additional_fare']),
-                'distance_km': float(breakdown['distance_km']),
-            }
-        },
-        'discount_info': discount_info
+        'fare': fare,
+        'discount_info': discount_info,
+        'origin_location': locations[0],
+        'destination_location': locations[1]
     }
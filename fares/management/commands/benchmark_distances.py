@@ -0,0 +1,101 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from fares.fare_calculator import GPSDistanceCalculator
+
+
+# Rough bounding box of Basey, Samar
+LATITUDE_RANGE = (11.15, 11.50)
+LONGITUDE_RANGE = (124.95, 125.25)
+
+# Scalar and vector paths use the same formula; allow for libm vs NumPy ulps
+TOLERANCE_KM = 1e-9
+
+
+class Command(BaseCommand):
+    help = "Compare scalar and vectorized Haversine throughput (and check they agree)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000, help='Origin/destination pairs per run')
+        parser.add_argument('--points', type=int, default=500, help='Points in the pairwise matrix')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per engine (best is reported)')
+        parser.add_argument('--seed', type=int, default=105)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        origins = [self.random_point(rng) for _ in range(options['count'])]
+        destinations = [self.random_point(rng) for _ in range(options['count'])]
+        points = [self.random_point(rng) for _ in range(options['points'])]
+        origin_array = np.asarray(origins)
+        destination_array = np.asarray(destinations)
+        repeat = options['repeat']
+
+        def scalar_pairs():
+            return [
+                GPSDistanceCalculator.calculate_distance(origin, destination)
+                for origin, destination in zip(origins, destinations)
+            ]
+
+        def vector_pairs():
+            return GPSDistanceCalculator.calculate_distances(origin_array, destination_array)
+
+        def vector_pairs_from_lists():
+            return GPSDistanceCalculator.calculate_distances(origins, destinations)
+
+        def scalar_matrix():
+            return [
+                [GPSDistanceCalculator.calculate_distance(a, b) for b in points]
+                for a in points
+            ]
+
+        def vector_matrix():
+            return GPSDistanceCalculator.pairwise_matrix(points)
+
+        scalar_seconds, scalar_result = self.best_of(scalar_pairs, repeat)
+        vector_seconds, vector_result = self.best_of(vector_pairs, repeat)
+        self.check_agree('calculate_distances', scalar_result, vector_result)
+        list_seconds, _ = self.best_of(vector_pairs_from_lists, repeat)
+        self.report('pairs, scalar', len(origins), scalar_seconds)
+        self.report('pairs, vectorized', len(origins), vector_seconds)
+        self.report('  (from lists)', len(origins), list_seconds)
+
+        matrix_pairs = len(points) ** 2
+        scalar_seconds_m, scalar_result = self.best_of(scalar_matrix, repeat)
+        vector_seconds_m, vector_result = self.best_of(vector_matrix, repeat)
+        self.check_agree('pairwise_matrix', scalar_result, vector_result)
+        self.report('matrix, scalar', matrix_pairs, scalar_seconds_m)
+        self.report('matrix, vectorized', matrix_pairs, vector_seconds_m)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Outputs agree within {TOLERANCE_KM:g} km; speedup "
+            f"x{scalar_seconds / vector_seconds:.1f} (pairs), "
+            f"x{scalar_seconds_m / vector_seconds_m:.1f} (matrix)"
+        ))
+
+    @staticmethod
+    def random_point(rng):
+        return (rng.uniform(*LATITUDE_RANGE), rng.uniform(*LONGITUDE_RANGE))
+
+    @staticmethod
+    def check_agree(label, expected, actual):
+        difference = np.max(np.abs(np.asarray(expected) - actual))
+        if difference > TOLERANCE_KM:
+            raise CommandError(f"{label} differs from the scalar path by {difference} km")
+
+    @staticmethod
+    def best_of(func, repeat):
+        best, result = None, None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def report(self, label, count, seconds):
+        self.stdout.write(
+            f"{label:<22} {seconds * 1000:10.2f} ms  {count / seconds / 1000:10,.1f} pairs/ms"
+        )
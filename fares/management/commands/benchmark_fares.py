@@ -0,0 +1,82 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fares.fare_calculator import CentavoFareCalculator, FareCalculator
+
+
+PASSENGER_TYPES = ['REGULAR', 'SENIOR', 'PWD', 'STUDENT']
+
+
+class Command(BaseCommand):
+    help = "Compare Decimal, integer-centavo and vectorized fare quoting throughput (and check they agree)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000, help='Quotes per run')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per engine (best is reported)')
+        parser.add_argument('--max-km', type=float, default=40.0, help='Largest random distance')
+        parser.add_argument('--seed', type=int, default=105)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        count = options['count']
+        distances = [round(rng.uniform(0, options['max_km']), 3) for _ in range(count)]
+        passenger_types = [rng.choice(PASSENGER_TYPES) for _ in range(count)]
+
+        def scalar():
+            return [
+                FareCalculator.calculate_fare(
+                    distance,
+                    0.20 if passenger_type in FareCalculator.DISCOUNTED_PASSENGER_TYPES else None
+                )
+                for distance, passenger_type in zip(distances, passenger_types)
+            ]
+
+        def centavos():
+            return [
+                CentavoFareCalculator.calculate_fare(
+                    round(distance * 1000),
+                    passenger_type in FareCalculator.DISCOUNTED_PASSENGER_TYPES
+                )
+                for distance, passenger_type in zip(distances, passenger_types)
+            ]
+
+        def vectorized():
+            return FareCalculator.calculate_fares(distances, passenger_types)
+
+        scalar_seconds, scalar_results = self.best_of(scalar, options['repeat'])
+        centavo_seconds, centavo_results = self.best_of(centavos, options['repeat'])
+        vector_seconds, vector_results = self.best_of(vectorized, options['repeat'])
+
+        for key in ('fare', 'original_fare', 'discount_applied'):
+            expected = [float(result[key]) for result in scalar_results]
+            if expected != vector_results[key].tolist():
+                raise CommandError(f"Vectorized {key} differs from the scalar path")
+        if [float(result['fare']) for result in scalar_results] != [
+            result[0] / 100 for result in centavo_results
+        ]:
+            raise CommandError("Integer-centavo fare differs from the scalar path")
+
+        self.report('scalar (Decimal)', count, scalar_seconds)
+        self.report('scalar (int centavos)', count, centavo_seconds)
+        self.report('vectorized (NumPy)', count, vector_seconds)
+        self.stdout.write(self.style.SUCCESS(
+            f"Outputs identical; speedup x{scalar_seconds / centavo_seconds:.1f} (int), "
+            f"x{scalar_seconds / vector_seconds:.1f} (vectorized)"
+        ))
+
+    @staticmethod
+    def best_of(func, repeat):
+        best, result = None, None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def report(self, label, count, seconds):
+        self.stdout.write(
+            f"{label:<22} {seconds * 1000:10.2f} ms  {count / seconds:14,.0f} quotes/s"
+        )
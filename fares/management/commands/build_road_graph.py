@@ -0,0 +1,66 @@
+import random
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fares.road_graph import RoadGraph
+
+
+class Command(BaseCommand):
+    help = "Compile a road network (GeoJSON or OSM XML) into the .npz used by ROAD_GRAPH_PATH"
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='GeoJSON (.geojson/.json) or OSM XML (.osm) road network')
+        parser.add_argument('output', nargs='?', help='Output .npz (default: next to the source)')
+        parser.add_argument(
+            '--benchmark', type=int, default=200,
+            help='Time this many shortest-path queries between random nodes (0 to skip)'
+        )
+        parser.add_argument('--seed', type=int, default=105)
+
+    def handle(self, *args, **options):
+        source = Path(options['source'])
+        output = Path(options['output']) if options['output'] else source.with_suffix('.npz')
+        if output.suffix != '.npz':
+            raise CommandError("Output must be an .npz file")
+
+        started = time.perf_counter()
+        try:
+            graph = RoadGraph.load(source)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {source}: {e}")
+        if not graph.edge_count:
+            raise CommandError(f"No drivable roads found in {source}")
+        graph.save(output)
+        self.stdout.write(
+            f"{graph.node_count:,} nodes, {graph.edge_count:,} directed edges "
+            f"compiled in {time.perf_counter() - started:.2f} s -> {output} "
+            f"({output.stat().st_size / 1024:,.0f} KiB)"
+        )
+
+        started = time.perf_counter()
+        RoadGraph.load(output)
+        self.stdout.write(f"Compiled graph loads in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        if options['benchmark'] > 0:
+            self.benchmark(graph, options['benchmark'], random.Random(options['seed']))
+        self.stdout.write(self.style.SUCCESS(f"Set ROAD_GRAPH_PATH={output} to quote with it"))
+
+    def benchmark(self, graph, count, rng):
+        timings = []
+        unreachable = 0
+        for _ in range(count):
+            source = rng.randrange(graph.node_count)
+            target = rng.randrange(graph.node_count)
+            started = time.perf_counter()
+            if graph.search(source, target) is None:
+                unreachable += 1
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        self.stdout.write(
+            f"{count} random queries: p50 {timings[len(timings) // 2]:.3f} ms, "
+            f"p99 {timings[min(len(timings) - 1, int(len(timings) * 0.99))]:.3f} ms, "
+            f"max {timings[-1]:.3f} ms; {unreachable} unreachable"
+        )
@@ -0,0 +1,64 @@
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from fares.fare_calculator import GPSDistanceCalculator
+from fares.models import RoadMultiplier
+from fares.road_multipliers import evaluate, fit, store, training_samples
+
+
+class Command(BaseCommand):
+    help = "Fit GPS road multipliers per grid cell from Google Maps fare history"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-samples', type=int, default=settings.ROAD_MULTIPLIER_MIN_SAMPLES,
+            help='Fewest trips a cell or cell pair needs for its own multiplier'
+        )
+        parser.add_argument(
+            '--holdout', type=float, default=0.2,
+            help='Fraction of trips held out to report the error of the fit (0 to skip)'
+        )
+        parser.add_argument('--seed', type=int, default=105)
+        parser.add_argument('--dry-run', action='store_true', help='Report without saving')
+
+    def handle(self, *args, **options):
+        cell_meters = settings.ROAD_MULTIPLIER_CELL_METERS
+        min_samples = options['min_samples']
+        default = GPSDistanceCalculator.ROAD_MULTIPLIER
+
+        samples = training_samples()
+        self.stdout.write(f"{len(samples)} Google Maps quotes with usable route data")
+        if not len(samples):
+            raise CommandError("No Google Maps fare history to calibrate from")
+
+        holdout = options['holdout']
+        if 0 < holdout < 1:
+            order = list(range(len(samples)))
+            random.Random(options['seed']).shuffle(order)
+            split = int(len(order) * (1 - holdout))
+            train, test = samples[order[:split]], samples[order[split:]]
+            errors = evaluate(fit(train, cell_meters, min_samples), test, cell_meters, default)
+            if errors:
+                self.stdout.write(
+                    f"Held-out error on {errors['samples']} trips: "
+                    f"median {errors['fitted_median']:.1f}% / p90 {errors['fitted_p90']:.1f}% "
+                    f"(fixed x{default}: median {errors['default_median']:.1f}% / "
+                    f"p90 {errors['default_p90']:.1f}%)"
+                )
+
+        rows = fit(samples, cell_meters, min_samples)
+        counts = {scope: 0 for scope in RoadMultiplier.Scope.values}
+        for row in rows:
+            counts[row.scope] += 1
+        self.stdout.write(
+            f"Fitted {len(rows)} multipliers on a {cell_meters} m grid: "
+            + ", ".join(f"{count} {scope.lower()}" for scope, count in counts.items())
+        )
+
+        if options['dry_run']:
+            self.stdout.write("Dry run; nothing saved")
+            return
+        store(rows, cell_meters)
+        self.stdout.write(self.style.SUCCESS("Road multipliers saved"))
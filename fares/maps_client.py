@@ -0,0 +1,168 @@
+"""
+Process-wide Google Maps client with deadlines and a circuit breaker
+
+One googlemaps.Client (and its pooled requests.Session) is shared by every
+request in the process instead of being rebuilt per quote. Each call is
+bounded by connect/read timeouts and an overall deadline, and repeated
+upstream failures open a circuit breaker so quotes fall back to GPS
+immediately instead of tying up a worker.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import googlemaps
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Google while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    Closed: calls pass through. After ``failure_threshold`` consecutive
+    failures the breaker opens and rejects calls for ``reset_timeout``
+    seconds, then lets a single trial call through (half-open); its outcome
+    closes or re-opens the breaker.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """Whether a call may be attempted now"""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def reset(self) -> None:
+        self.record_success()
+
+
+_client_lock = threading.Lock()
+_client: Optional[googlemaps.Client] = None
+_breaker: Optional[CircuitBreaker] = None
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_maps_client() -> googlemaps.Client:
+    """Return the shared googlemaps.Client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build_maps_client()
+    return _client
+
+
+def build_maps_client() -> googlemaps.Client:
+    # Use server API key (no referrer restrictions) for server-side APIs
+    api_key = settings.GOOGLE_MAPS_SERVER_API_KEY or settings.GOOGLE_MAPS_API_KEY
+    if not api_key:
+        raise ValueError("GOOGLE_MAPS_SERVER_API_KEY not configured in settings")
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.GOOGLE_MAPS_POOL_SIZE,
+        max_retries=0
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return googlemaps.Client(  # type: ignore
+        key=api_key,
+        connect_timeout=settings.GOOGLE_MAPS_CONNECT_TIMEOUT,
+        read_timeout=settings.GOOGLE_MAPS_READ_TIMEOUT,
+        # Retries of retriable errors stop once the deadline has passed
+        retry_timeout=settings.GOOGLE_MAPS_DEADLINE,
+        retry_over_query_limit=False,
+        requests_session=session,
+        base_url=settings.GOOGLE_MAPS_BASE_URL
+    )
+
+
+def get_breaker() -> CircuitBreaker:
+    """Return the shared circuit breaker guarding Google Maps calls"""
+    global _breaker
+    if _breaker is None:
+        with _client_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    failure_threshold=settings.GOOGLE_MAPS_BREAKER_THRESHOLD,
+                    reset_timeout=settings.GOOGLE_MAPS_BREAKER_RESET_SECONDS
+                )
+    return _breaker
+
+
+def get_maps_executor() -> ThreadPoolExecutor:
+    """
+    Thread pool running Google calls for async views
+
+    Sized separately from the event loop's default executor (cpu + 4
+    threads), which would otherwise cap in-flight quotes per worker.
+    """
+    global _executor
+    if _executor is None:
+        with _client_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.GOOGLE_MAPS_ASYNC_THREADS,
+                    thread_name_prefix='google-maps'
+                )
+    return _executor
+
+
+def reset_maps_client() -> None:
+    """Drop the shared client and breaker (settings changes, tests)"""
+    global _client, _breaker
+    with _client_lock:
+        if _client is not None:
+            _client.session.close()
+        _client = None
+        _breaker = None
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fares", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RoadMultiplier",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "scope",
+                    models.CharField(
+                        choices=[
+                            ("GLOBAL", "Global"),
+                            ("CELL", "Grid cell"),
+                            ("PAIR", "Cell pair"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("cell_meters", models.PositiveIntegerField()),
+                ("lat_cell", models.IntegerField(blank=True, null=True)),
+                ("lng_cell", models.IntegerField(blank=True, null=True)),
+                ("other_lat_cell", models.IntegerField(blank=True, null=True)),
+                ("other_lng_cell", models.IntegerField(blank=True, null=True)),
+                ("multiplier", models.FloatField()),
+                ("samples", models.PositiveIntegerField()),
+                ("fitted_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": [
+                    "scope",
+                    "lat_cell",
+                    "lng_cell",
+                    "other_lat_cell",
+                    "other_lng_cell",
+                ],
+                "indexes": [
+                    models.Index(
+                        fields=["cell_meters", "scope"],
+                        name="fares_roadm_cell_me_ea13fd_idx",
+                    )
+                ],
+            },
+        ),
+    ]
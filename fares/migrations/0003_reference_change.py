@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fares", "0002_road_multiplier"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReferenceChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("LOCATION", "Location"),
+                            ("ROUTE", "Route"),
+                            ("FARE", "Fare"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("object_id", models.BigIntegerField()),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("SAVED", "Created or updated"),
+                            ("DEACTIVATED", "Deactivated"),
+                            ("DELETED", "Deleted"),
+                        ],
+                        max_length=12,
+                    ),
+                ),
+                ("changed_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["id"],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fares", "0003_reference_change"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RouteGeometry",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(max_length=40, primary_key=True, serialize=False),
+                ),
+                ("polyline", models.TextField()),
+                ("bounds", models.JSONField(blank=True, null=True)),
+                ("steps", models.BinaryField(blank=True, default=b"")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name_plural": "route geometries",
+            },
+        ),
+    ]
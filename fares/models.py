@@ -33,3 +33,97 @@ class Fare(models.Model):
         
     def __str__(self):
         return f"{self.route} - ₱{self.amount} ({self.get_passenger_type_display()})"
+
+
+class RoadMultiplier(models.Model):
+    """
+    Fitted ratio of road distance to straight-line distance for an area
+
+    Rows are replaced wholesale by the calibrate_road_multipliers command
+    and looked up by the GPS fallback (see road_multipliers.py). Cells are
+    indices on a grid of ``cell_meters``; pair rows are stored with the
+    smaller cell first.
+    """
+    class Scope(models.TextChoices):
+        GLOBAL = 'GLOBAL', 'Global'
+        CELL = 'CELL', 'Grid cell'
+        PAIR = 'PAIR', 'Cell pair'
+
+    scope = models.CharField(max_length=10, choices=Scope.choices)
+    cell_meters = models.PositiveIntegerField()
+    lat_cell = models.IntegerField(null=True, blank=True)
+    lng_cell = models.IntegerField(null=True, blank=True)
+    other_lat_cell = models.IntegerField(null=True, blank=True)
+    other_lng_cell = models.IntegerField(null=True, blank=True)
+    multiplier = models.FloatField()
+    samples = models.PositiveIntegerField()
+    fitted_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['scope', 'lat_cell', 'lng_cell', 'other_lat_cell', 'other_lng_cell']
+        indexes = [
+            models.Index(fields=['cell_meters', 'scope']),
+        ]
+
+    def __str__(self):
+        if self.scope == self.Scope.GLOBAL:
+            area = 'global'
+        elif self.scope == self.Scope.CELL:
+            area = f"({self.lat_cell}, {self.lng_cell})"
+        else:
+            area = (
+                f"({self.lat_cell}, {self.lng_cell}) ↔ "
+                f"({self.other_lat_cell}, {self.other_lng_cell})"
+            )
+        return f"{area} ×{self.multiplier:.3f} [{self.samples} samples]"
+
+
+class ReferenceChange(models.Model):
+    """
+    Append-only log of changes to the public reference data
+
+    One row per saved or deleted Location, Route or Fare, written by the
+    signal handlers in the same transaction as the change. The id is the
+    cursor clients pass to /v2/sync/ to fetch what changed since.
+    """
+    class Kind(models.TextChoices):
+        LOCATION = 'LOCATION', 'Location'
+        ROUTE = 'ROUTE', 'Route'
+        FARE = 'FARE', 'Fare'
+
+    class Action(models.TextChoices):
+        SAVED = 'SAVED', 'Created or updated'
+        DEACTIVATED = 'DEACTIVATED', 'Deactivated'
+        DELETED = 'DELETED', 'Deleted'
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=12, choices=Action.choices)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} {self.kind} {self.object_id} {self.get_action_display().lower()}"
+
+
+class RouteGeometry(models.Model):
+    """
+    Directions geometry shared by every stored quote over the same route
+
+    Content-addressed: digest is the SHA-1 of the polyline, bounds and
+    steps, so identical routes are stored once however often they are
+    quoted. Step text is kept zlib-compressed (see route_geometry.py).
+    """
+    digest = models.CharField(max_length=40, primary_key=True)
+    polyline = models.TextField()
+    bounds = models.JSONField(null=True, blank=True)
+    steps = models.BinaryField(blank=True, default=b'')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'route geometries'
+
+    def __str__(self):
+        return self.digest
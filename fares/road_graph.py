@@ -0,0 +1,432 @@
+"""
+Offline road-graph routing
+
+Loads a road network into a compressed sparse row (CSR) adjacency graph
+held in NumPy arrays and answers shortest-path distance queries with A*,
+guided by straight-line and landmark (ALT) lower bounds.
+Quotes use it between Google Maps and the GPS estimate when ROAD_GRAPH_PATH
+points at one of:
+
+- a GeoJSON file of LineString/MultiLineString road features
+  (``oneway`` and ``highway`` properties are honoured),
+- an OSM XML extract (``.osm``; ways tagged ``highway``),
+- the ``.npz`` compiled from either by the build_road_graph command, which
+  loads in milliseconds instead of re-parsing the source.
+"""
+import heapq
+import json
+import math
+import threading
+import xml.etree.ElementTree as ElementTree
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .route_cache import METERS_PER_DEGREE
+
+
+# Segments a vehicle cannot use
+EXCLUDED_HIGHWAYS = {
+    'footway', 'steps', 'cycleway', 'bridleway', 'corridor', 'elevator',
+    'platform', 'proposed', 'construction', 'abandoned',
+}
+ONEWAY_FORWARD = {'yes', 'true', '1'}
+ONEWAY_REVERSE = {'-1', 'reverse'}
+
+EARTH_RADIUS_M = 6371000.0
+# Coordinates are merged into one node at this precision (~1 cm)
+COORDINATE_DECIMALS = 7
+# Snapping grid; a point is matched to the nearest node within
+# ROAD_GRAPH_MAX_SNAP_METERS by scanning the surrounding cells
+SNAP_CELL_METERS = 250.0
+# Landmarks for the A* lower bounds (ALT); each costs two float32 node arrays
+LANDMARKS = 8
+# Stand-in for "no path" in landmark distances, keeping bound arithmetic finite
+UNREACHABLE_M = 1e9
+
+# A segment: [(lat, lng), ...] and its direction (0 both ways, 1 forward, -1 reverse)
+Segment = Tuple[List[Tuple[float, float]], int]
+
+
+def _oneway(value) -> int:
+    value = str(value).strip().lower() if value is not None else ''
+    if value in ONEWAY_FORWARD:
+        return 1
+    if value in ONEWAY_REVERSE:
+        return -1
+    return 0
+
+
+def geojson_segments(path: Path) -> Iterator[Segment]:
+    """Road segments from a GeoJSON FeatureCollection"""
+    with open(path, encoding='utf-8') as handle:
+        data = json.load(handle)
+    features = data.get('features', []) if data.get('type') == 'FeatureCollection' else [data]
+    for feature in features:
+        properties = feature.get('properties') or {}
+        if properties.get('highway') in EXCLUDED_HIGHWAYS:
+            continue
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'LineString':
+            lines = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiLineString':
+            lines = geometry['coordinates']
+        else:
+            continue
+        direction = _oneway(properties.get('oneway'))
+        for line in lines:
+            # GeoJSON positions are [longitude, latitude]
+            yield [(float(position[1]), float(position[0])) for position in line], direction
+
+
+def osm_segments(path: Path) -> Iterator[Segment]:
+    """Road segments from an OSM XML extract"""
+    nodes = {}
+    ways = []
+    for _, element in ElementTree.iterparse(path, events=('end',)):
+        if element.tag == 'node':
+            nodes[element.get('id')] = (float(element.get('lat')), float(element.get('lon')))
+            element.clear()
+        elif element.tag == 'way':
+            tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+            highway = tags.get('highway')
+            if highway and highway not in EXCLUDED_HIGHWAYS:
+                ways.append(([nd.get('ref') for nd in element.iter('nd')], _oneway(tags.get('oneway'))))
+            element.clear()
+
+    for refs, direction in ways:
+        yield [nodes[ref] for ref in refs if ref in nodes], direction
+
+
+class RoadGraph:
+    """
+    Directed road graph in CSR form
+
+    Node i is at (lat[i], lng[i]); its outgoing edges are
+    indices[indptr[i]:indptr[i + 1]] with lengths (metres) in the same
+    slice of weights.
+    """
+
+    def __init__(self, lat, lng, indptr, indices, weights, landmark_from=None, landmark_to=None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+
+        # A* walks the graph one node at a time; plain lists index far
+        # faster than NumPy scalars
+        self._indptr = self.indptr.tolist()
+        self._indices = self.indices.tolist()
+        self._weights = self.weights.tolist()
+        self._build_snap_index()
+
+        if landmark_from is None or landmark_to is None:
+            landmark_from, landmark_to = self._select_landmarks(LANDMARKS)
+        self.landmark_from = np.asarray(landmark_from, dtype=np.float32)
+        self.landmark_to = np.asarray(landmark_to, dtype=np.float32)
+
+        # Popular trips and destinations repeat; remember recent answers
+        self.shortest_path_length = lru_cache(maxsize=4096)(self.search)
+        self._target_bounds = lru_cache(maxsize=64)(self._lower_bounds)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.lat)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.indices)
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[Segment]) -> 'RoadGraph':
+        node_ids = {}
+        coordinates = []
+        sources, targets, directions = [], [], []
+
+        def node(point):
+            key = (round(point[0], COORDINATE_DECIMALS), round(point[1], COORDINATE_DECIMALS))
+            node_id = node_ids.get(key)
+            if node_id is None:
+                node_id = node_ids[key] = len(coordinates)
+                coordinates.append(key)
+            return node_id
+
+        for points, direction in segments:
+            ids = [node(point) for point in points]
+            for source, target in zip(ids, ids[1:]):
+                if source != target:
+                    sources.append(source)
+                    targets.append(target)
+                    directions.append(direction)
+
+        coordinates = np.array(coordinates, dtype=np.float64).reshape(-1, 2)
+        sources = np.array(sources, dtype=np.int64)
+        targets = np.array(targets, dtype=np.int64)
+        directions = np.array(directions, dtype=np.int8)
+        lengths = _haversine_m(
+            coordinates[sources, 0], coordinates[sources, 1],
+            coordinates[targets, 0], coordinates[targets, 1]
+        ) if len(sources) else np.zeros(0)
+
+        forward = directions >= 0
+        backward = directions <= 0
+        edge_from = np.concatenate([sources[forward], targets[backward]])
+        edge_to = np.concatenate([targets[forward], sources[backward]])
+        edge_length = np.concatenate([lengths[forward], lengths[backward]])
+
+        order = np.argsort(edge_from, kind='stable')
+        indptr = np.zeros(len(coordinates) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(edge_from, minlength=len(coordinates)), out=indptr[1:])
+        return cls(
+            coordinates[:, 0], coordinates[:, 1],
+            indptr, edge_to[order], edge_length[order]
+        )
+
+    @classmethod
+    def load(cls, path) -> 'RoadGraph':
+        """Load a compiled .npz, a GeoJSON file or an OSM XML extract"""
+        path = Path(path)
+        suffix = path.suffix.lower()
+        if suffix == '.npz':
+            with np.load(path) as arrays:
+                return cls(
+                    arrays['lat'], arrays['lng'], arrays['indptr'],
+                    arrays['indices'], arrays['weights'],
+                    arrays['landmark_from'], arrays['landmark_to']
+                )
+        if suffix == '.osm':
+            return cls.from_segments(osm_segments(path))
+        if suffix in ('.geojson', '.json'):
+            return cls.from_segments(geojson_segments(path))
+        raise ValueError(f"Unsupported road network format: {path.name}")
+
+    def save(self, path) -> None:
+        """Write the compiled arrays to an .npz file"""
+        np.savez_compressed(
+            path, lat=self.lat, lng=self.lng, indptr=self.indptr,
+            indices=self.indices, weights=self.weights,
+            landmark_from=self.landmark_from, landmark_to=self.landmark_to
+        )
+
+    def _build_snap_index(self) -> None:
+        self._snap_degrees = SNAP_CELL_METERS / METERS_PER_DEGREE
+        cells = np.floor(np.column_stack([self.lat, self.lng]) / self._snap_degrees).astype(np.int64)
+        self._snap_cells = {}
+        if not len(cells):
+            return
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        unique, starts = np.unique(cells[order], axis=0, return_index=True)
+        for cell, nodes in zip(unique.tolist(), np.split(order, starts[1:])):
+            self._snap_cells[tuple(cell)] = nodes
+
+    def nearest_node(
+        self,
+        point: Tuple[float, float],
+        max_meters: float
+    ) -> Optional[Tuple[int, float]]:
+        """(node, distance in metres) of the node nearest point, if within max_meters"""
+        lat, lng = point
+        cell_lat = math.floor(lat / self._snap_degrees)
+        cell_lng = math.floor(lng / self._snap_degrees)
+        # Longitude cells narrow away from the equator
+        reach_lat = math.ceil(max_meters / SNAP_CELL_METERS)
+        reach_lng = math.ceil(reach_lat / max(math.cos(math.radians(lat)), 0.01))
+        candidates = [
+            self._snap_cells[(cell_lat + i, cell_lng + j)]
+            for i in range(-reach_lat, reach_lat + 1)
+            for j in range(-reach_lng, reach_lng + 1)
+            if (cell_lat + i, cell_lng + j) in self._snap_cells
+        ]
+        if not candidates:
+            return None
+        candidates = np.concatenate(candidates)
+        distances = _haversine_m(lat, lng, self.lat[candidates], self.lng[candidates])
+        best = int(np.argmin(distances))
+        if distances[best] > max_meters:
+            return None
+        return int(candidates[best]), float(distances[best])
+
+    def _reversed(self) -> Tuple[List[int], List[int], List[float]]:
+        """CSR lists of the graph with every edge reversed"""
+        sources = np.repeat(np.arange(self.node_count), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind='stable')
+        indptr = np.zeros(self.node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=self.node_count), out=indptr[1:])
+        return indptr.tolist(), sources[order].tolist(), self.weights[order].tolist()
+
+    def _dijkstra(self, source: int, indptr, indices, weights) -> np.ndarray:
+        """Distances in metres from source to every node (inf if unreachable)"""
+        best = [math.inf] * self.node_count
+        best[source] = 0.0
+        queue = [(0.0, source)]
+        while queue:
+            distance, node = heapq.heappop(queue)
+            if distance > best[node]:
+                continue
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[edge]
+                candidate = distance + weights[edge]
+                if candidate < best[neighbour]:
+                    best[neighbour] = candidate
+                    heapq.heappush(queue, (candidate, neighbour))
+        return np.array(best)
+
+    def _select_landmarks(self, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distances from and to up to count landmarks spread over the network
+
+        Landmarks are picked farthest-first: each new one is the node
+        furthest (by road) from those already chosen, which gives tight
+        A* bounds for trips across the area.
+        """
+        if not self.edge_count:
+            return np.zeros((0, self.node_count)), np.zeros((0, self.node_count))
+        reverse = self._reversed()
+        forward = (self._indptr, self._indices, self._weights)
+
+        start = self._dijkstra(0, *forward)
+        nearest = np.full(self.node_count, np.inf)
+        candidate = int(np.argmax(np.where(np.isfinite(start), start, -1)))
+        landmark_from, landmark_to = [], []
+        for _ in range(min(count, self.node_count)):
+            landmark_from.append(self._dijkstra(candidate, *forward))
+            landmark_to.append(self._dijkstra(candidate, *reverse))
+            nearest = np.minimum(nearest, landmark_from[-1])
+            spread = np.where(np.isfinite(nearest), nearest, -1)
+            candidate = int(np.argmax(spread))
+            if spread[candidate] <= 0:
+                break
+
+        def finite(distances):
+            return np.where(np.isfinite(distances), distances, UNREACHABLE_M)
+        return finite(np.array(landmark_from)), finite(np.array(landmark_to))
+
+    def _lower_bounds(self, target: int) -> List[float]:
+        """
+        Lower bound on the road distance from every node to target by the
+        triangle inequality over each landmark L
+
+            d(v, t) >= d(L, t) - d(L, v)    and    d(v, t) >= d(v, L) - d(t, L)
+
+        (the straight line when the graph has no landmarks). Bounds near
+        UNREACHABLE_M mean target cannot be reached from that node.
+        """
+        if not len(self.landmark_from):
+            return _haversine_m(self.lat, self.lng, self.lat[target], self.lng[target]).tolist()
+        bounds = np.maximum(
+            (self.landmark_from[:, target, None] - self.landmark_from).max(axis=0),
+            (self.landmark_to - self.landmark_to[:, target, None]).max(axis=0)
+        )
+        # Distances are rounded to float32; never let a bound overshoot
+        return (bounds * np.float32(1 - 1e-5)).tolist()
+
+    def search(self, source: int, target: int) -> Optional[float]:
+        """
+        A* search: length in metres of the shortest path, or None if
+        unreachable (shortest_path_length is the cached form)
+        """
+        if source == target:
+            return 0.0
+        bounds = self._target_bounds(target)
+        if bounds[source] >= UNREACHABLE_M / 2:
+            return None
+        indptr, indices, weights = self._indptr, self._indices, self._weights
+
+        best = {source: 0.0}
+        queue = [(bounds[source], 0.0, source)]
+        done = set()
+        while queue:
+            _, distance, node = heapq.heappop(queue)
+            if node == target:
+                return distance
+            if node in done:
+                continue
+            done.add(node)
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[edge]
+                candidate = distance + weights[edge]
+                if candidate < best.get(neighbour, math.inf):
+                    best[neighbour] = candidate
+                    heapq.heappush(queue, (candidate + bounds[neighbour], candidate, neighbour))
+        return None
+
+    def route_distance(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float],
+        max_snap_meters: float
+    ) -> Optional[float]:
+        """
+        Road distance in metres between two points, including the straight
+        legs to and from the nearest nodes; None if either point is off the
+        network or no path connects them
+        """
+        start = self.nearest_node(origin, max_snap_meters)
+        end = self.nearest_node(destination, max_snap_meters)
+        if start is None or end is None:
+            return None
+        path = self.shortest_path_length(start[0], end[0])
+        if path is None:
+            return None
+        return start[1] + path + end[1]
+
+
+def _haversine_m(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = (np.radians(value) for value in (lat1, lng1, lat2, lng2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2 +
+        np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+_graph_lock = threading.Lock()
+_graph: Optional[RoadGraph] = None
+_graph_path: Optional[str] = None
+
+
+def get_road_graph() -> Optional[RoadGraph]:
+    """
+    The road graph configured by ROAD_GRAPH_PATH, loaded on first use
+
+    Returns None when no path is configured or it failed to load (the error
+    is reported once, not on every quote).
+    """
+    global _graph, _graph_path
+    path = settings.ROAD_GRAPH_PATH
+    if not path:
+        return None
+    if _graph_path != path:
+        with _graph_lock:
+            if _graph_path != path:
+                try:
+                    _graph = RoadGraph.load(path)
+                except Exception as e:
+                    print(f"Road graph load error ({path}): {e}")
+                    _graph = None
+                _graph_path = path
+    return _graph
+
+
+def reset_road_graph() -> None:
+    """Forget the loaded graph (settings changes, tests)"""
+    global _graph, _graph_path
+    with _graph_lock:
+        _graph = None
+        _graph_path = None
+
+
+def road_graph_distance(
+    origin: Tuple[float, float],
+    destination: Tuple[float, float]
+) -> Optional[int]:
+    """Road distance in whole metres from the configured graph, or None"""
+    graph = get_road_graph()
+    if graph is None:
+        return None
+    distance = graph.route_distance(origin, destination, settings.ROAD_GRAPH_MAX_SNAP_METERS)
+    return round(distance) if distance is not None else None
@@ -0,0 +1,300 @@
+"""
+Calibrated road multipliers for the GPS fallback
+
+The GPS fallback estimates road distance as straight-line (Haversine)
+distance times a multiplier. Instead of one fixed factor, multipliers are
+fitted from past Google Maps quotes (calibrate_road_multipliers) for pairs
+of grid cells, single cells and the whole area, and stored in the
+RoadMultiplier table. Lookups resolve the most specific fitted multiplier
+from an in-memory dict:
+
+    cell pair -> mean of the origin and destination cells -> global -> default
+
+The dict is loaded on first use in each process. A calibration run,
+usually a management command in a process of its own, replaces the shared
+version token (bfg/versions.py) on commit; web workers poll it and reload.
+"""
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from googlemaps.convert import decode_polyline
+
+from bfg.versions import VersionedValue
+
+from .models import RoadMultiplier
+from .route_cache import METERS_PER_DEGREE
+
+
+Cell = Tuple[int, int]
+
+# Trips this short measure GPS noise more than the road network
+MIN_STRAIGHT_KM = 0.3
+# Ratios outside this range are bad samples (misplaced pins, ferry legs)
+RATIO_RANGE = (1.0, 4.0)
+
+
+def route_sample(route_data) -> Optional[Tuple[float, float, float, float, float]]:
+    """
+    (origin lat, origin lng, destination lat, destination lng, road km) of a
+    stored Google Maps quote, or None if route_data does not describe one
+
+    Accepts the calculate_route response as well as the bare route dict.
+    """
+    endpoints = route_endpoints(route_data)
+    if endpoints is None:
+        return None
+    route = route_data['route'] if isinstance(route_data.get('route'), dict) else route_data
+    try:
+        meters = (route.get('distance') or route_data['distance'])['meters']
+        return (*endpoints[0], *endpoints[1], float(meters) / 1000)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def route_endpoints(route_data) -> Optional[Tuple[Tuple[float, float], Tuple[float, float]]]:
+    """
+    Origin and destination (latitude, longitude) of stored route data
+
+    Endpoints come from explicit origin/destination keys when present,
+    otherwise from the first and last point of the route polyline.
+    """
+    if not isinstance(route_data, dict):
+        return None
+    route = route_data['route'] if isinstance(route_data.get('route'), dict) else route_data
+    try:
+        origin = route_data.get('origin')
+        destination = route_data.get('destination')
+        if origin is None or destination is None:
+            points = decode_polyline(route['polyline'])
+            origin, destination = points[0], points[-1]
+        return _point(origin), _point(destination)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def _point(value) -> Tuple[float, float]:
+    if isinstance(value, dict):
+        return float(value['lat']), float(value['lng'])
+    lat, lng = value
+    return float(lat), float(lng)
+
+
+def training_samples() -> np.ndarray:
+    """(N, 5) array of route_sample() rows from Google Maps fare history"""
+    from users.models import FareCalculation
+
+    rows = FareCalculation.objects.filter(route_data__isnull=False).filter(
+        Q(route_data__method='google_maps') | Q(calculation_type__icontains='google')
+    ).values_list('route_data', flat=True)
+    samples = [sample for sample in map(route_sample, rows.iterator()) if sample]
+    return np.array(samples, dtype=np.float64).reshape(-1, 5)
+
+
+def fit(
+    samples: np.ndarray,
+    cell_meters: int,
+    min_samples: int
+) -> List[RoadMultiplier]:
+    """
+    Fit multipliers (median road/straight-line ratio) for every cell pair,
+    cell and the whole area with at least min_samples usable trips
+
+    Returns unsaved RoadMultiplier rows.
+    """
+    from .fare_calculator import GPSDistanceCalculator
+
+    straight = GPSDistanceCalculator.straight_line_distances(samples[:, 0:2], samples[:, 2:4])
+    usable = straight >= MIN_STRAIGHT_KM
+    ratios = np.divide(samples[:, 4], straight, out=np.zeros_like(straight), where=usable)
+    usable &= (ratios >= RATIO_RANGE[0]) & (ratios <= RATIO_RANGE[1])
+
+    samples, ratios = samples[usable], ratios[usable]
+    origin_cells = to_cells(samples[:, 0:2], cell_meters).tolist()
+    destination_cells = to_cells(samples[:, 2:4], cell_meters).tolist()
+
+    pair_ratios = defaultdict(list)
+    cell_ratios = defaultdict(list)
+    for ratio, origin, destination in zip(ratios.tolist(), origin_cells, destination_cells):
+        origin, destination = tuple(origin), tuple(destination)
+        pair_ratios[_pair_key(origin, destination)].append(ratio)
+        for cell in {origin, destination}:
+            cell_ratios[cell].append(ratio)
+
+    def row(scope, values, first=(None, None), second=(None, None)):
+        return RoadMultiplier(
+            scope=scope, cell_meters=cell_meters,
+            lat_cell=first[0], lng_cell=first[1],
+            other_lat_cell=second[0], other_lng_cell=second[1],
+            multiplier=float(np.median(values)), samples=len(values)
+        )
+
+    rows = []
+    if len(ratios) >= min_samples:
+        rows.append(row(RoadMultiplier.Scope.GLOBAL, ratios))
+    for cell, values in cell_ratios.items():
+        if len(values) >= min_samples:
+            rows.append(row(RoadMultiplier.Scope.CELL, values, cell))
+    for (first, second), values in pair_ratios.items():
+        if len(values) >= min_samples:
+            rows.append(row(RoadMultiplier.Scope.PAIR, values, first, second))
+    return rows
+
+
+def evaluate(
+    rows: Iterable[RoadMultiplier],
+    samples: np.ndarray,
+    cell_meters: int,
+    default: float
+) -> Dict[str, float]:
+    """
+    Absolute percentage error of GPS estimates against the samples' road
+    distances, with the fitted multipliers and with the default alone
+    """
+    from .fare_calculator import GPSDistanceCalculator
+
+    table = table_from_rows(rows)
+    straight = GPSDistanceCalculator.straight_line_distances(samples[:, 0:2], samples[:, 2:4])
+    usable = straight >= MIN_STRAIGHT_KM
+    samples, straight = samples[usable], straight[usable]
+    if not len(samples):
+        return {}
+
+    fitted = np.array([
+        resolve(table, cell_of(origin, cell_meters), cell_of(destination, cell_meters), default)
+        for origin, destination in zip(samples[:, 0:2].tolist(), samples[:, 2:4].tolist())
+    ])
+    road = samples[:, 4]
+    fitted_error = np.abs(straight * fitted - road) / road * 100
+    default_error = np.abs(straight * default - road) / road * 100
+    return {
+        'samples': len(samples),
+        'fitted_median': float(np.median(fitted_error)),
+        'fitted_p90': float(np.percentile(fitted_error, 90)),
+        'default_median': float(np.median(default_error)),
+        'default_p90': float(np.percentile(default_error, 90)),
+    }
+
+
+def store(rows: Sequence[RoadMultiplier], cell_meters: int) -> None:
+    """Replace the multipliers for cell_meters with rows"""
+    with transaction.atomic():
+        RoadMultiplier.objects.filter(cell_meters=cell_meters).delete()
+        RoadMultiplier.objects.bulk_create(rows)
+        transaction.on_commit(road_multipliers.invalidate)
+
+
+def to_cells(points: np.ndarray, cell_meters: int) -> np.ndarray:
+    """Integer grid cell indices of (..., 2) latitude/longitude points"""
+    return np.floor(np.asarray(points) / (cell_meters / METERS_PER_DEGREE)).astype(np.int64)
+
+
+def cell_of(point: Tuple[float, float], cell_meters: int) -> Cell:
+    degrees = cell_meters / METERS_PER_DEGREE
+    return math.floor(point[0] / degrees), math.floor(point[1] / degrees)
+
+
+def table_from_rows(rows: Iterable[RoadMultiplier]) -> Dict[tuple, float]:
+    table = {}
+    for row in rows:
+        if row.scope == RoadMultiplier.Scope.GLOBAL:
+            table[(row.scope,)] = row.multiplier
+        elif row.scope == RoadMultiplier.Scope.CELL:
+            table[(row.scope, row.lat_cell, row.lng_cell)] = row.multiplier
+        else:
+            table[(row.scope, row.lat_cell, row.lng_cell,
+                   row.other_lat_cell, row.other_lng_cell)] = row.multiplier
+    return table
+
+
+def resolve(table: Dict[tuple, float], origin: Cell, destination: Cell, default: float) -> float:
+    """Most specific multiplier in table for a trip between two cells"""
+    first, second = _pair_key(origin, destination)
+    multiplier = table.get((RoadMultiplier.Scope.PAIR, *first, *second))
+    if multiplier is not None:
+        return multiplier
+    cell_keys = {(RoadMultiplier.Scope.CELL, *origin), (RoadMultiplier.Scope.CELL, *destination)}
+    cells = [table[key] for key in cell_keys if key in table]
+    if cells:
+        return sum(cells) / len(cells)
+    return table.get((RoadMultiplier.Scope.GLOBAL,), default)
+
+
+def _pair_key(origin: Cell, destination: Cell) -> Tuple[Cell, Cell]:
+    # Road distance is close enough to symmetric; share samples both ways
+    return (origin, destination) if origin <= destination else (destination, origin)
+
+
+class RoadMultiplierTable:
+    """In-memory lookup of fitted multipliers for the configured cell size"""
+
+    VERSION_KEY = 'road-multipliers:version'
+
+    def __init__(self):
+        self._table = VersionedValue(
+            self.VERSION_KEY, self.load, local=lambda: settings.ROAD_MULTIPLIER_CELL_METERS
+        )
+
+    def table(self) -> Dict[tuple, float]:
+        return self._table.get()
+
+    @staticmethod
+    def load() -> Dict[tuple, float]:
+        """Multipliers fitted for the configured cell size"""
+        return table_from_rows(RoadMultiplier.objects.filter(
+            cell_meters=settings.ROAD_MULTIPLIER_CELL_METERS
+        ).only('scope', 'lat_cell', 'lng_cell', 'other_lat_cell',
+               'other_lng_cell', 'multiplier'))
+
+    def invalidate(self) -> None:
+        """Drop this process' table and tell other processes to reload"""
+        self._table.invalidate()
+
+    def lookup(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float],
+        default: float
+    ) -> float:
+        """Multiplier for a single trip (default if nothing was fitted)"""
+        table = self.table()
+        if not table:
+            return default
+        cell_meters = settings.ROAD_MULTIPLIER_CELL_METERS
+        return resolve(
+            table, cell_of(origin, cell_meters), cell_of(destination, cell_meters), default
+        )
+
+    def lookup_many(
+        self,
+        origins: np.ndarray,
+        destinations: np.ndarray,
+        default: float
+    ):
+        """
+        Multipliers for broadcastable (..., 2) arrays of trip endpoints
+
+        Returns the default as a scalar when nothing was fitted; otherwise an
+        array with the broadcast shape, resolving each distinct cell pair once.
+        """
+        table = self.table()
+        if not table:
+            return default
+        cell_meters = settings.ROAD_MULTIPLIER_CELL_METERS
+        origin_cells, destination_cells = np.broadcast_arrays(
+            to_cells(origins, cell_meters), to_cells(destinations, cell_meters)
+        )
+        keys = np.concatenate([origin_cells, destination_cells], axis=-1).reshape(-1, 4)
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        values = np.array([
+            resolve(table, (o_lat, o_lng), (d_lat, d_lng), default)
+            for o_lat, o_lng, d_lat, d_lng in unique.tolist()
+        ])
+        return values[inverse.reshape(-1)].reshape(origin_cells.shape[:-1])
+
+
+road_multipliers = RoadMultiplierTable()
@@ -0,0 +1,259 @@
+"""
+Route result cache for Google Maps lookups
+
+Directions results are cached under a key built from the origin and
+destination snapped to a fixed grid (ROUTE_CACHE_GRID_METERS), so repeat
+quotes for the same trip are served without a paid API call.
+
+Storage, TTL and eviction come from the ``routes`` cache alias in
+settings.CACHES. The default LocMemCache backend evicts least recently
+used entries once MAX_ENTRIES is reached; point ROUTE_CACHE_BACKEND at
+DatabaseCache or Redis to keep entries across restarts.
+
+Misses are filled through get_or_fetch()/aget_or_fetch(): identical lookups
+in flight at the same time share one upstream call, within the process and,
+with ROUTE_CACHE_LOCK_ACROSS_WORKERS, across workers sharing the backend.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from .single_flight import SingleFlight
+
+
+# Metres per degree of latitude (close enough for a municipality-sized grid)
+METERS_PER_DEGREE = 111320.0
+
+
+class RouteCache:
+    """Cache of detailed route results keyed on snapped coordinates"""
+
+    KEY_PREFIX = 'route:v1'
+    STATS_PREFIX = 'route-stats:v1'
+    LOCK_PREFIX = 'route-lock:v1'
+    LOCK_POLL_SECONDS = 0.05
+
+    def __init__(self, alias: str = 'routes', grid_meters: Optional[float] = None):
+        self.alias = alias
+        self.grid_meters = grid_meters or getattr(settings, 'ROUTE_CACHE_GRID_METERS', 25)
+        self.grid_degrees = self.grid_meters / METERS_PER_DEGREE
+        self._flight = SingleFlight()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def snap(self, point: Tuple[float, float]) -> Tuple[int, int]:
+        """Snap a (latitude, longitude) pair to integer grid cell indices"""
+        lat, lng = point
+        return (
+            int(round(float(lat) / self.grid_degrees)),
+            int(round(float(lng) / self.grid_degrees)),
+        )
+
+    def make_key(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float]
+    ) -> str:
+        """Build the cache key for an origin/destination pair"""
+        o_lat, o_lng = self.snap(origin)
+        d_lat, d_lng = self.snap(destination)
+        return f"{self.KEY_PREFIX}:{self.grid_meters:g}:{o_lat}:{o_lng}:{d_lat}:{d_lng}"
+
+    def get(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float]
+    ) -> Optional[Dict]:
+        """Return the cached route for the pair, or None on a miss"""
+        route_data = self.cache.get(self.make_key(origin, destination))
+        self._bump('hits' if route_data is not None else 'misses')
+        return route_data
+
+    def set(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float],
+        route_data: Dict
+    ) -> None:
+        """Store a route result using the alias' default TTL"""
+        self.cache.set(self.make_key(origin, destination), route_data)
+
+    async def aget(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float]
+    ) -> Optional[Dict]:
+        """Async get() for ASGI views"""
+        route_data = await self.cache.aget(self.make_key(origin, destination))
+        await sync_to_async(self._bump)('hits' if route_data is not None else 'misses')
+        return route_data
+
+    async def aset(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float],
+        route_data: Dict
+    ) -> None:
+        """Async set() for ASGI views"""
+        await self.cache.aset(self.make_key(origin, destination), route_data)
+
+    def get_or_fetch(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float],
+        fetch: Callable[[], Optional[Dict]]
+    ) -> Optional[Dict]:
+        """
+        Cached route for the pair, calling fetch() on a miss
+
+        Concurrent misses for the same key share a single fetch() call; its
+        result (or exception) is returned to every caller. Falsy results are
+        not cached.
+        """
+        route_data = self.get(origin, destination)
+        if route_data is not None:
+            return route_data
+
+        key = self.make_key(origin, destination)
+        route_data, shared = self._flight.do(key, lambda: self._fill(key, fetch))
+        if shared:
+            self._bump('coalesced')
+        return route_data
+
+    async def aget_or_fetch(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float],
+        fetch: Callable[[], Awaitable[Optional[Dict]]]
+    ) -> Optional[Dict]:
+        """Async get_or_fetch(); fetch() returns an awaitable"""
+        route_data = await self.aget(origin, destination)
+        if route_data is not None:
+            return route_data
+
+        key = self.make_key(origin, destination)
+        route_data, shared = await self._flight.ado(key, lambda: self._afill(key, fetch))
+        if shared:
+            await sync_to_async(self._bump)('coalesced')
+        return route_data
+
+    def _fill(self, key: str, fetch: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        # Another thread may have filled the key between our miss and now
+        route_data = self.cache.get(key)
+        if route_data is not None:
+            return route_data
+
+        lock_key = None
+        if settings.ROUTE_CACHE_LOCK_ACROSS_WORKERS:
+            lock_key = f"{self.LOCK_PREFIX}:{key}"
+            if not self.cache.add(lock_key, 1, timeout=settings.ROUTE_CACHE_LOCK_TIMEOUT):
+                # Another worker is fetching; use its result once stored
+                route_data = self._wait_for_fill(key, lock_key)
+                if route_data is not None:
+                    self._bump('coalesced')
+                    return route_data
+                lock_key = None
+
+        try:
+            route_data = fetch()
+            if route_data:
+                self.cache.set(key, route_data)
+            return route_data
+        finally:
+            if lock_key:
+                self.cache.delete(lock_key)
+
+    async def _afill(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Optional[Dict]]]
+    ) -> Optional[Dict]:
+        route_data = await self.cache.aget(key)
+        if route_data is not None:
+            return route_data
+
+        lock_key = None
+        if settings.ROUTE_CACHE_LOCK_ACROSS_WORKERS:
+            lock_key = f"{self.LOCK_PREFIX}:{key}"
+            if not await self.cache.aadd(lock_key, 1, timeout=settings.ROUTE_CACHE_LOCK_TIMEOUT):
+                route_data = await self._await_fill(key, lock_key)
+                if route_data is not None:
+                    await sync_to_async(self._bump)('coalesced')
+                    return route_data
+                lock_key = None
+
+        try:
+            route_data = await fetch()
+            if route_data:
+                await self.cache.aset(key, route_data)
+            return route_data
+        finally:
+            if lock_key:
+                await self.cache.adelete(lock_key)
+
+    def _wait_for_fill(self, key: str, lock_key: str) -> Optional[Dict]:
+        """
+        Poll for the lock holder's result until it is stored, the lock is
+        released without one (the fetch failed) or the lock expires
+        """
+        deadline = time.monotonic() + settings.ROUTE_CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(self.LOCK_POLL_SECONDS)
+            route_data = self.cache.get(key)
+            if route_data is not None or self.cache.get(lock_key) is None:
+                return route_data
+        return None
+
+    async def _await_fill(self, key: str, lock_key: str) -> Optional[Dict]:
+        deadline = time.monotonic() + settings.ROUTE_CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.LOCK_POLL_SECONDS)
+            route_data = await self.cache.aget(key)
+            if route_data is not None or await self.cache.aget(lock_key) is None:
+                return route_data
+        return None
+
+    def stats(self) -> Dict:
+        """
+        Hit/miss counters since the counters were last reset
+
+        ``coalesced`` counts misses answered by another caller's in-flight
+        fetch instead of a call of their own.
+        """
+        hits = self.cache.get(self._stats_key('hits'), 0)
+        misses = self.cache.get(self._stats_key('misses'), 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'coalesced': self.cache.get(self._stats_key('coalesced'), 0),
+            'hit_rate': (hits / total) if total else 0.0,
+        }
+
+    def reset_stats(self) -> None:
+        self.cache.delete_many([
+            self._stats_key(name) for name in ('hits', 'misses', 'coalesced')
+        ])
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def _stats_key(self, name: str) -> str:
+        return f"{self.STATS_PREFIX}:{name}"
+
+    def _bump(self, name: str) -> None:
+        key = self._stats_key(name)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # Counter missing (first use or culled); never let it expire
+            if not self.cache.add(key, 1, timeout=None):
+                self.cache.incr(key)
+
+
+route_cache = RouteCache()
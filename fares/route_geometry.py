@@ -0,0 +1,128 @@
+"""
+Compact storage of Directions routes in fare history
+
+A Google Maps route carries its overview polyline, bounds and per-step HTML
+instructions, which dwarf the rest of a quote. Stored quotes keep only the
+route summary (distance, duration, addresses, endpoints) in route_data and
+reference the geometry by digest; the geometry itself is a RouteGeometry
+row written once per distinct route, with its steps as zlib-compressed
+JSON.
+
+Steps are also left out of API responses unless the client asks for them
+with ?include=steps.
+"""
+import hashlib
+import json
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .models import RouteGeometry
+from .road_multipliers import route_endpoints
+
+
+GEOMETRY_KEYS = ('polyline', 'bounds', 'steps')
+
+
+def wants_steps(request) -> bool:
+    """Whether ?include= lists steps"""
+    return 'steps' in request.GET.get('include', '').split(',')
+
+
+def without_steps(route: Optional[Dict]) -> Optional[Dict]:
+    """Copy of a route dict without its steps"""
+    if not isinstance(route, dict) or 'steps' not in route:
+        return route
+    return {key: value for key, value in route.items() if key != 'steps'}
+
+
+def compress_steps(steps: List[Dict]) -> bytes:
+    if not steps:
+        return b''
+    return zlib.compress(json.dumps(steps, separators=(',', ':')).encode(), 9)
+
+
+def decompress_steps(data) -> List[Dict]:
+    if not data:
+        return []
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def geometry_digest(route: Dict) -> str:
+    """SHA-1 of a route's polyline, bounds and steps"""
+    content = {key: route.get(key) for key in GEOMETRY_KEYS}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def _inner(route_data) -> Optional[Dict]:
+    """The Directions route in route_data (bare, or under "route" in a calculate response)"""
+    if not isinstance(route_data, dict):
+        return None
+    route = route_data['route'] if isinstance(route_data.get('route'), dict) else route_data
+    return route if isinstance(route.get('polyline'), str) else None
+
+
+def store_geometries(route_datas: Sequence) -> List[Tuple[object, Optional[str]]]:
+    """
+    Compact route_data values for storage
+
+    Returns (compacted route_data, digest or None) per value, after writing
+    the RouteGeometry rows that do not exist yet in one bulk insert. Values
+    without a Directions route are returned unchanged.
+    """
+    results, geometries = [], {}
+    for route_data in route_datas:
+        route = _inner(route_data)
+        if route is None:
+            results.append((route_data, None))
+            continue
+        digest = geometry_digest(route)
+        geometries.setdefault(digest, route)
+        summary = {key: value for key, value in route.items() if key not in GEOMETRY_KEYS}
+        summary['geometry'] = digest
+        if route is not route_data:
+            summary = dict(route_data, route=summary)
+        # Keep the endpoints readable without the polyline (route_endpoints)
+        endpoints = route_endpoints(route_data)
+        if endpoints is not None and not ('origin' in summary and 'destination' in summary):
+            summary['origin'], summary['destination'] = map(list, endpoints)
+        results.append((summary, digest))
+
+    if geometries:
+        existing = set(RouteGeometry.objects.filter(pk__in=list(geometries)).values_list('pk', flat=True))
+        RouteGeometry.objects.bulk_create([
+            RouteGeometry(
+                digest=digest,
+                polyline=route['polyline'],
+                bounds=route.get('bounds'),
+                steps=compress_steps(route.get('steps') or [])
+            )
+            for digest, route in geometries.items() if digest not in existing
+        ], ignore_conflicts=True)
+    return results
+
+
+def expand_route_data(route_data, geometry: Optional[RouteGeometry], include_steps: bool = False):
+    """
+    route_data as clients see it: the stored summary with polyline and
+    bounds restored from its geometry, and steps only when asked for
+    """
+    if geometry is None:
+        # Stored before compaction (or never a Directions route)
+        if not include_steps:
+            route = _inner(route_data)
+            if route is not None and 'steps' in route:
+                stripped = without_steps(route)
+                return stripped if route is route_data else dict(route_data, route=stripped)
+        return route_data
+
+    def expand(summary):
+        route = {key: value for key, value in summary.items() if key != 'geometry'}
+        route['polyline'] = geometry.polyline
+        route['bounds'] = geometry.bounds
+        if include_steps:
+            route['steps'] = decompress_steps(geometry.steps)
+        return route
+
+    if isinstance(route_data.get('route'), dict):
+        return dict(route_data, route=expand(route_data['route']))
+    return expand(route_data)
@@ -0,0 +1,196 @@
+"""
+Compiled fare schedule
+
+Active Fare rows are compiled into an in-memory table keyed by the route's
+origin/destination locations, so quotes resolve the tariff in force for a
+known location pair without touching the database. The table is built on
+first use in each process and rebuilt after any Fare or Route is saved or
+deleted (see signals.py). The save replaces the schedule's shared version
+token (bfg/versions.py); every worker polls the token and compiles again
+within a second.
+
+Only flat per-route amounts come from the Fare table. The distance formula
+used for pairs without a tariff (base fare, base distance, rate per km,
+discount) is still made of FareCalculator's constants, which is also what
+the offline snapshot hands to clients, so changing those takes a deploy.
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from django.utils import timezone
+
+from bfg.versions import VersionedValue
+
+from .fare_calculator import CentavoFareCalculator, FareCalculator
+from .models import Fare, PassengerType
+
+
+class Tariff(NamedTuple):
+    fare_id: int
+    route_id: int
+    transport_type: str
+    passenger_type: str
+    amount: int  # centavos
+    effective_date: date
+    expiry_date: Optional[date]
+
+    def in_force(self, on: date) -> bool:
+        return self.effective_date <= on and (self.expiry_date is None or on <= self.expiry_date)
+
+
+class FareSchedule:
+    """In-memory lookup of route tariffs compiled from the Fare table"""
+
+    VERSION_KEY = 'fare-schedule:version'
+
+    def __init__(self):
+        self._table = VersionedValue(self.VERSION_KEY, self.compile)
+
+    def table(self) -> Dict[Tuple[int, int], Dict[Tuple[str, str], List[Tariff]]]:
+        return self._table.get()
+
+    @staticmethod
+    def compile() -> Dict[Tuple[int, int], Dict[Tuple[str, str], List[Tariff]]]:
+        """Build the lookup table from active fares on active routes"""
+        table = defaultdict(lambda: defaultdict(list))
+        rows = Fare.objects.filter(is_active=True, route__is_active=True).values_list(
+            'id', 'route_id', 'route__origin_id', 'route__destination_id',
+            'route__transport_type', 'passenger_type', 'amount',
+            'effective_date', 'expiry_date'
+        )
+        for (fare_id, route_id, origin_id, destination_id, transport_type,
+             passenger_type, amount, effective_date, expiry_date) in rows:
+            table[(origin_id, destination_id)][(transport_type, passenger_type)].append(Tariff(
+                fare_id, route_id, transport_type, passenger_type,
+                int(amount * 100), effective_date, expiry_date
+            ))
+
+        # Newest first, so resolution stops at the first tariff in force
+        for entries in table.values():
+            for tariffs in entries.values():
+                tariffs.sort(key=lambda tariff: tariff.effective_date, reverse=True)
+        return {key: dict(entries) for key, entries in table.items()}
+
+    def invalidate(self) -> None:
+        """Drop this process' table and tell other processes to rebuild"""
+        self._table.invalidate()
+
+    def resolve(
+        self,
+        origin_id: int,
+        destination_id: int,
+        passenger_type: str = PassengerType.REGULAR,
+        transport_type: Optional[str] = None,
+        on: Optional[date] = None
+    ) -> Optional[Tariff]:
+        """
+        Tariff in force for a location pair
+
+        Args:
+            origin_id: Origin Location id
+            destination_id: Destination Location id
+            passenger_type: Passenger type to look up
+            transport_type: Transport type; when omitted, the cheapest
+                tariff of any transport type serving the pair
+            on: Date to resolve for (defaults to today)
+
+        Returns:
+            Tariff for the passenger type, or None if the pair has no tariff
+        """
+        entries = self.table().get((origin_id, destination_id))
+        if not entries:
+            return None
+
+        on = on or timezone.localdate()
+        in_force = []
+        for transport in self.transport_types(entries) if transport_type is None else [transport_type]:
+            tariff = next(
+                (tariff for tariff in entries.get((transport, passenger_type), ()) if tariff.in_force(on)),
+                None
+            )
+            if tariff is not None:
+                in_force.append(tariff)
+        return min(in_force, key=lambda tariff: tariff.amount, default=None)
+
+    @staticmethod
+    def transport_types(entries: Dict[Tuple[str, str], List[Tariff]]) -> List[str]:
+        return sorted({transport_type for transport_type, _ in entries})
+
+    def quote(
+        self,
+        origin_id: int,
+        destination_id: int,
+        distance_m: int,
+        passenger_type: str = PassengerType.REGULAR,
+        transport_type: Optional[str] = None
+    ) -> Optional[Dict]:
+        """
+        Fare dict (same shape as CentavoFareCalculator.fare_breakdown) from the
+        route tariff, or None if the pair has none
+
+        The breakdown is marked flat_tariff: the whole regular tariff is in
+        base_fare, with no base distance or per-km component.
+
+        A passenger type without its own tariff pays the regular tariff less
+        the ordinance discount. Without a transport type, a pair served by
+        several transport types is quoted at the cheapest of them.
+        """
+        if transport_type is None:
+            entries = self.table().get((origin_id, destination_id))
+            if not entries:
+                return None
+            quotes = [
+                self.quote(origin_id, destination_id, distance_m, passenger_type, transport)
+                for transport in self.transport_types(entries)
+            ]
+            return min(
+                (quote for quote in quotes if quote is not None),
+                key=lambda quote: quote['fare'], default=None
+            )
+
+        discounted = passenger_type in FareCalculator.DISCOUNTED_PASSENGER_TYPES
+        regular = self.resolve(origin_id, destination_id, PassengerType.REGULAR, transport_type)
+        own = self.resolve(origin_id, destination_id, passenger_type, transport_type) \
+            if passenger_type != PassengerType.REGULAR else regular
+
+        if own is not None:
+            tariff = own
+            original_fare = regular.amount if regular is not None else own.amount
+            fare = own.amount
+            discount = max(original_fare - fare, 0)
+        elif regular is not None:
+            tariff = regular
+            original_fare = regular.amount
+            if discounted:
+                discount = original_fare * CentavoFareCalculator.DISCOUNT_PERCENT // 100
+                fare = CentavoFareCalculator.round_to_nearest_half(original_fare - discount)
+            else:
+                fare, discount = original_fare, 0
+        else:
+            return None
+
+        return {
+            'fare': fare / 100,
+            'original_fare': original_fare / 100,
+            'discount_applied': discount / 100,
+            'breakdown': {
+                'flat_tariff': True,
+                'base_fare': original_fare / 100,
+                'base_distance_km': None,
+                'additional_distance_km': 0.0,
+                'additional_fare': 0.0,
+                'distance_km': distance_m / 1000,
+            },
+            'tariff': {
+                'fare_id': tariff.fare_id,
+                'route_id': tariff.route_id,
+                'transport_type': tariff.transport_type,
+                'passenger_type': tariff.passenger_type,
+                'effective_date': tariff.effective_date.isoformat(),
+                'expiry_date': tariff.expiry_date.isoformat() if tariff.expiry_date else None,
+            }
+        }
+
+
+fare_schedule = FareSchedule()
@@ -15,3 +15,28 @@ class FareSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
+
+
+class FareSnapshotSerializer(serializers.ModelSerializer):
+    """Fare row of the offline snapshot; the route is an id"""
+
+    class Meta:
+        model = Fare
+        fields = ['id', 'route', 'passenger_type', 'amount', 'effective_date', 'expiry_date']
+
+
+class SnapshotQuerySerializer(serializers.Serializer):
+    """Query parameters of the offline snapshot"""
+    since = serializers.IntegerField(
+        min_value=0,
+        required=False,
+        help_text="Version of the client's copy; only rows changed after it are sent"
+    )
+
+
+class SyncQuerySerializer(serializers.Serializer):
+    """Query parameters of the delta sync"""
+    since = serializers.IntegerField(
+        min_value=0,
+        help_text="Cursor returned by the previous sync or the snapshot"
+    )
@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from bfg.conditional import invalidate_stamp
+from locations.models import Location
+from routes.models import Route
+from .models import Fare, ReferenceChange, RoadMultiplier
+from .road_multipliers import road_multipliers
+from .schedule import fare_schedule
+
+
+@receiver(post_save, sender=Fare)
+@receiver(post_delete, sender=Fare)
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def invalidate_fare_schedule(sender, **kwargs):
+    """Rebuild the compiled fare schedule once a tariff or route change commits"""
+    transaction.on_commit(fare_schedule.invalidate)
+    transaction.on_commit(lambda: invalidate_stamp(sender))
+
+
+@receiver(post_save, sender=RoadMultiplier)
+@receiver(post_delete, sender=RoadMultiplier)
+def invalidate_road_multipliers(sender, **kwargs):
+    """Reload fitted road multipliers once an edit commits"""
+    transaction.on_commit(road_multipliers.invalidate)
+
+
+REFERENCE_KINDS = {
+    Location: ReferenceChange.Kind.LOCATION,
+    Route: ReferenceChange.Kind.ROUTE,
+    Fare: ReferenceChange.Kind.FARE,
+}
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Route)
+@receiver(post_save, sender=Fare)
+def log_reference_save(sender, instance, **kwargs):
+    """Append the change to the sync log, in the same transaction"""
+    ReferenceChange.objects.create(
+        kind=REFERENCE_KINDS[sender],
+        object_id=instance.pk,
+        action=ReferenceChange.Action.SAVED if instance.is_active else ReferenceChange.Action.DEACTIVATED
+    )
+
+
+@receiver(post_delete, sender=Location)
+@receiver(post_delete, sender=Route)
+@receiver(post_delete, sender=Fare)
+def log_reference_delete(sender, instance, **kwargs):
+    ReferenceChange.objects.create(
+        kind=REFERENCE_KINDS[sender], object_id=instance.pk, action=ReferenceChange.Action.DELETED
+    )
@@ -0,0 +1,87 @@
+"""
+Single-flight call deduplication
+
+Concurrent callers asking for the same key share one execution of the
+underlying call and receive its result (or exception), so a burst of
+identical quotes costs one upstream request instead of one per caller.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls by key within the process
+
+    ``do`` coalesces threads (WSGI workers with threads, sync views under
+    ASGI); ``ado`` coalesces tasks on the running event loop. Nothing is
+    remembered once a call finishes: callers arriving afterwards start a new
+    one, so caching the result is left to the caller.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn() unless a call for key is already in flight
+
+        Returns:
+            (result, shared) where shared is True if the result came from
+            another caller's call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Async do(): await fn() unless a call for key is already in flight
+
+        The call runs as its own task, so a caller that is cancelled (client
+        went away) does not cancel the result for everyone else waiting.
+        """
+        task_key = (id(asyncio.get_running_loop()), key)
+        task = self._tasks.get(task_key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(fn())
+            self._tasks[task_key] = task
+            task.add_done_callback(lambda done: self._forget(task_key, done))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, task_key: Tuple[int, Hashable], task: asyncio.Future) -> None:
+        if self._tasks.get(task_key) is task:
+            del self._tasks[task_key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter was cancelled
+            task.exception()
@@ -0,0 +1,147 @@
+"""
+Offline snapshot of the fare guide
+
+One gzipped JSON bundle holds every active location, route and fare plus
+the Ordinance 105 fare rules, which is all a client needs to quote fares
+without a connection. It replaces paging through /v2/locations/ and
+/v2/routes/ over poor mobile links.
+
+The bundle's version is the time of the last change to any of the three
+tables in milliseconds, taken from the conditional GET stamps that the
+apps' signal handlers drop on every write; the bundle is rebuilt and
+compressed once per version and then served from the cache. A client
+holding version V asks for ?since=V and gets only the rows changed after V
+together with the ids of every row still in the snapshot, so it can drop
+deleted and deactivated rows. The bundle also carries the change log
+cursor it was built at, to continue with /v2/sync/ (see sync.py).
+"""
+import gzip
+import hashlib
+import json
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Optional, Tuple
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from bfg.conditional import model_stamp
+from locations.models import Location
+from locations.serializers import LocationListSerializer
+from routes.models import Route
+from routes.serializers import RouteSnapshotSerializer
+from .fare_calculator import FareCalculator
+from .models import Fare
+from .serializers import FareSnapshotSerializer
+from .sync import active_querysets, latest_cursor
+
+
+CACHE_PREFIX = 'fare-snapshot:v1'
+CACHE_TIMEOUT = 24 * 3600
+# Deltas re-send rows changed this long before the client's version, so a
+# write committed just after the client's download is not missed
+DELTA_OVERLAP_SECONDS = 60
+# Deltas are cached per version and since, and since is chosen by the
+# client: it is rounded down to a bucket (the client gets a few rows it
+# already has), and a copy older than DELTA_MAX_AGE_SECONDS gets the full
+# snapshot, so a version has a bounded number of cached deltas
+DELTA_BUCKET_SECONDS = 600
+DELTA_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+
+def fare_rules() -> Dict:
+    """Constants of FareCalculator, for clients that quote offline"""
+    return {
+        'base_fare': str(FareCalculator.BASE_FARE),
+        'base_distance_km': str(FareCalculator.BASE_DISTANCE_KM),
+        'additional_rate_per_km': str(FareCalculator.ADDITIONAL_RATE_PER_KM),
+        # Every started kilometre beyond the base distance is charged
+        'additional_km_rounding': 'up',
+        'rounding': '0.50',
+        'discount_rate': str(FareCalculator.DISCOUNT_RATE),
+        'discounted_passenger_types': list(FareCalculator.DISCOUNTED_PASSENGER_TYPES),
+    }
+
+
+def snapshot_version() -> Tuple[int, str]:
+    """(version, ETag) of the current snapshot"""
+    stamps = [model_stamp(model) for model in (Location, Route, Fare)]
+    version = int(max(last for last, _ in stamps) * 1000)
+    # Row counts catch deletions the timestamp alone would miss
+    return version, f'"{hashlib.sha1(repr(stamps).encode()).hexdigest()}"'
+
+
+def _querysets(since: Optional[int] = None):
+    locations, routes, fares = active_querysets()
+    if since is not None:
+        after = datetime.fromtimestamp(since / 1000 - DELTA_OVERLAP_SECONDS, tz=dt_timezone.utc)
+        locations = locations.filter(updated_at__gt=after)
+        # A route or fare comes back into the snapshot when a location or
+        # route it hangs on is reactivated, without changing itself
+        routes = routes.filter(
+            Q(updated_at__gt=after)
+            | Q(origin__updated_at__gt=after)
+            | Q(destination__updated_at__gt=after)
+        )
+        fares = fares.filter(
+            Q(updated_at__gt=after)
+            | Q(route__updated_at__gt=after)
+            | Q(route__origin__updated_at__gt=after)
+            | Q(route__destination__updated_at__gt=after)
+        )
+    return locations.order_by('id'), routes.order_by('id'), fares.order_by('id')
+
+
+def build_snapshot(version: int, since: Optional[int] = None) -> Dict:
+    """
+    Snapshot at version: every active row, or with since only the rows
+    changed after it plus the ids of all rows in the snapshot
+    """
+    # Read before the rows: a change racing the build is synced again later
+    cursor = latest_cursor()
+    locations, routes, fares = _querysets(since)
+    snapshot = {
+        'version': version,
+        'since': since,
+        'cursor': cursor,
+        'fare_rules': fare_rules(),
+        'locations': LocationListSerializer(locations, many=True).data,
+        'routes': RouteSnapshotSerializer(routes, many=True).data,
+        'fares': FareSnapshotSerializer(fares, many=True).data,
+    }
+    if since is not None:
+        all_locations, all_routes, all_fares = _querysets()
+        snapshot['ids'] = {
+            'locations': list(all_locations.values_list('id', flat=True)),
+            'routes': list(all_routes.values_list('id', flat=True)),
+            'fares': list(all_fares.values_list('id', flat=True)),
+        }
+    return snapshot
+
+
+def snapshot_response(since: Optional[int] = None) -> Optional[Tuple[str, bytes]]:
+    """
+    (ETag, gzipped JSON body) of the current snapshot, or of the delta
+    since a version; built once per version and cached
+
+    A since equal to the current version still gets a (usually empty)
+    delta, so the client learns its copy is current. None when since is
+    newer than the current version: the client must start over.
+    """
+    version, etag = snapshot_version()
+    if since is not None:
+        if since > version:
+            return None
+        if version - since > DELTA_MAX_AGE_SECONDS * 1000:
+            since = None
+        else:
+            since -= since % (DELTA_BUCKET_SECONDS * 1000)
+    if since is not None:
+        etag = f'"{etag[1:-1]}.{since}"'
+    key = f"{CACHE_PREFIX}:{etag[1:-1]}"
+    body: Optional[bytes] = cache.get(key)
+    if body is None:
+        data = json.dumps(build_snapshot(version, since), cls=DjangoJSONEncoder, separators=(',', ':'))
+        body = gzip.compress(data.encode(), compresslevel=9, mtime=0)
+        cache.set(key, body, timeout=CACHE_TIMEOUT)
+    return etag, body
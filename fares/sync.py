@@ -0,0 +1,131 @@
+"""
+Delta sync of the reference data from the change log
+
+Clients keep the cursor of their last sync (the snapshot carries one too)
+and ask /v2/sync/?since=<cursor> for what changed after it. The log
+entries past the cursor are collapsed per row, and each touched row is
+sent in its current state when it is in the snapshot, or listed as
+removed when it is not. A route is only in the snapshot while both its
+locations are active, and a fare while its route is, so a change to a
+location also touches its routes, and a change to a route its fares. The
+rows are serialized exactly as in the snapshot, so one client-side store
+takes both.
+
+Log ids are handed out when a row is inserted but become visible when its
+transaction commits, which is not always in id order: a cursor taken past
+an entry whose neighbour below is still uncommitted would skip it for
+good. So cursors only move over entries older than SETTLE_SECONDS; newer
+entries are sent at once all the same, and again on the next sync.
+
+Like the conditional GET stamps, the log is fed by model signals: writes
+through queryset.update() or bulk_create() do not show up here.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.db.models import Q
+from django.utils import timezone
+
+from locations.models import Location
+from locations.serializers import LocationListSerializer
+from routes.models import Route
+from routes.serializers import RouteSnapshotSerializer
+from .models import Fare, ReferenceChange
+from .serializers import FareSnapshotSerializer
+
+
+# Log entries consumed per sync response; clients come back while "more"
+MAX_CHANGES = 1000
+# Longest a transaction writing reference data is expected to stay open
+SETTLE_SECONDS = 60
+
+SYNCED = (
+    # (key in the response, log kind, model, serializer)
+    ('locations', ReferenceChange.Kind.LOCATION, Location, LocationListSerializer),
+    ('routes', ReferenceChange.Kind.ROUTE, Route, RouteSnapshotSerializer),
+    ('fares', ReferenceChange.Kind.FARE, Fare, FareSnapshotSerializer),
+)
+
+
+def active_querysets():
+    """Locations, routes and fares in the snapshot: active, and hanging on active rows"""
+    locations = Location.objects.filter(is_active=True)
+    routes = Route.objects.filter(
+        is_active=True, origin__is_active=True, destination__is_active=True
+    )
+    fares = Fare.objects.filter(
+        is_active=True, route__in=routes.values('pk')
+    )
+    return locations, routes, fares
+
+
+def _settled_before():
+    return timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+
+
+def _newest_id() -> int:
+    return ReferenceChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def latest_cursor() -> int:
+    """Id of the newest settled change log entry (0 when none)"""
+    return (
+        ReferenceChange.objects.filter(changed_at__lte=_settled_before())
+        .order_by('-id').values_list('id', flat=True).first() or 0
+    )
+
+
+def changes_since(since: int, limit: int = MAX_CHANGES) -> Optional[Dict]:
+    """
+    Rows changed after cursor since, or None when the cursor is newer than
+    the log (the client must start over from a snapshot)
+    """
+    settled_before = _settled_before()
+    entries = list(
+        ReferenceChange.objects.filter(id__gt=since)
+        .order_by('id')
+        .values_list('id', 'kind', 'object_id', 'changed_at')[:limit + 1]
+    )
+    if not entries and since > _newest_id():
+        return None
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    cursor = since
+    for entry_id, _, _, changed_at in entries:
+        if changed_at > settled_before:
+            break
+        cursor = entry_id
+    if cursor == since:
+        # Only unsettled entries left: calling again at once would not move
+        more = False
+
+    touched = defaultdict(set)
+    for _, kind, object_id, _ in entries:
+        touched[kind].add(object_id)
+    locations = touched[ReferenceChange.Kind.LOCATION]
+    if locations:
+        touched[ReferenceChange.Kind.ROUTE].update(
+            Route.objects.filter(Q(origin__in=locations) | Q(destination__in=locations))
+            .values_list('id', flat=True)
+        )
+    routes = touched[ReferenceChange.Kind.ROUTE]
+    if routes:
+        touched[ReferenceChange.Kind.FARE].update(
+            Fare.objects.filter(route__in=routes).values_list('id', flat=True)
+        )
+
+    result = {
+        'since': since,
+        'cursor': cursor,
+        'more': more,
+        'removed': {},
+    }
+    for (key, kind, _, serializer), queryset in zip(SYNCED, active_querysets()):
+        ids = touched[kind]
+        rows = queryset.filter(pk__in=ids).order_by('id') if ids else []
+        result[key] = serializer(rows, many=True).data
+        current = {row['id'] for row in result[key]}
+        result['removed'][key] = sorted(ids - current)
+    return result
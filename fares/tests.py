@@ -1,3 +1,1033 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import inspect
+import json
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from googlemaps.convert import encode_polyline
+from rest_framework.test import APIClient
+
+from bfg.conditional import invalidate_stamp
+from bfg.testing import LOCAL_CACHES, ListQueryCountMixin
+from bfg.versions import VersionedValue, bump_shared_version
+from .fare_calculator import (
+    AsyncGoogleMapsService, CentavoFareCalculator, FareCalculator,
+    GoogleMapsService, GPSDistanceCalculator, acalculate_route_with_fare,
+    calculate_route_with_fare
+)
+from .maps_client import CircuitBreaker, get_breaker, reset_maps_client
+from .models import Fare, ReferenceChange, RoadMultiplier
+from .road_graph import RoadGraph, reset_road_graph
+from .road_multipliers import RoadMultiplierTable, road_multipliers, route_sample
+from .route_cache import METERS_PER_DEGREE, route_cache
+from .schedule import FareSchedule, fare_schedule
+from .snapshot import DELTA_BUCKET_SECONDS, DELTA_MAX_AGE_SECONDS
+from .sync import changes_since
+from locations.models import Location
+from routes.models import Route
+from users.models import FareCalculation
+
+
+ORIGIN = (11.28026, 125.06909)
+DESTINATION = (11.2768363, 125.0114879)
+
+ROUTE_DATA = {
+    'polyline': 'abc',
+    'bounds': {},
+    'distance': {'meters': 6420, 'kilometers': 6.42, 'text': '6.4 km'},
+    'duration': {'seconds': 720, 'text': '12 mins'},
+    'start_address': 'Basey',
+    'end_address': 'Amandayehan',
+    'steps': [],
+}
+
+
+class RouteCacheTests(TestCase):
+    def setUp(self):
+        route_cache.clear()
+
+    def test_nearby_points_share_a_key(self):
+        nudged = (ORIGIN[0] + 0.00001, ORIGIN[1] - 0.00001)  # ~1.5 m away
+        self.assertEqual(
+            route_cache.make_key(ORIGIN, DESTINATION),
+            route_cache.make_key(nudged, DESTINATION)
+        )
+        self.assertNotEqual(
+            route_cache.make_key(ORIGIN, DESTINATION),
+            route_cache.make_key(DESTINATION, ORIGIN)
+        )
+
+    @mock.patch('fares.fare_calculator.GoogleMapsService')
+    def test_repeat_quote_skips_google(self, service_cls):
+        service_cls.return_value.get_detailed_route.return_value = ROUTE_DATA
+
+        first = calculate_route_with_fare(ORIGIN, DESTINATION)
+        second = calculate_route_with_fare(ORIGIN, DESTINATION)
+
+        self.assertEqual(service_cls.return_value.get_detailed_route.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(second['method'], 'google_maps')
+        stats = route_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class RequestCoalescingTests(TestCase):
+    def setUp(self):
+        route_cache.clear()
+
+    @mock.patch('fares.fare_calculator.GoogleMapsService')
+    def test_concurrent_identical_quotes_share_one_call(self, service_cls):
+        def slow_route(origin, destination):
+            time.sleep(0.2)
+            return ROUTE_DATA
+        service_cls.return_value.get_detailed_route.side_effect = slow_route
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(calculate_route_with_fare(ORIGIN, DESTINATION)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(service_cls.return_value.get_detailed_route.call_count, 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(results[0]['method'], 'google_maps')
+        self.assertEqual(route_cache.stats()['coalesced'], 7)
+
+    @mock.patch('fares.fare_calculator.AsyncGoogleMapsService')
+    def test_async_quotes_share_one_call(self, service_cls):
+        calls = []
+
+        async def slow_route(origin, destination):
+            calls.append((origin, destination))
+            await asyncio.sleep(0.1)
+            return ROUTE_DATA
+        service_cls.return_value.get_detailed_route.side_effect = slow_route
+
+        async def burst():
+            return await asyncio.gather(*[
+                acalculate_route_with_fare(ORIGIN, DESTINATION) for _ in range(8)
+            ])
+
+        results = async_to_sync(burst)()
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result['method'] == 'google_maps' for result in results))
+
+    def test_pending_card_lookup_is_cancelled_when_the_quote_fails(self):
+        async def card_lookup():
+            await asyncio.sleep(10)
+
+        async def quote():
+            lookup = card_lookup()
+            with mock.patch('fares.fare_calculator.road_graph_distance', side_effect=RuntimeError('graph')):
+                with self.assertRaises(RuntimeError):
+                    await acalculate_route_with_fare(
+                        ORIGIN, DESTINATION, discount_card=lookup, use_google_maps=False
+                    )
+            await asyncio.sleep(0)
+            return inspect.getcoroutinestate(lookup)
+
+        self.assertEqual(async_to_sync(quote)(), inspect.CORO_CLOSED)
+
+    @mock.patch('fares.fare_calculator.GoogleMapsService')
+    def test_failed_call_is_shared_and_not_cached(self, service_cls):
+        service_cls.return_value.get_detailed_route.return_value = None
+
+        self.assertEqual(calculate_route_with_fare(ORIGIN, DESTINATION)['method'], 'gps')
+        self.assertEqual(calculate_route_with_fare(ORIGIN, DESTINATION)['method'], 'gps')
+        self.assertEqual(service_cls.return_value.get_detailed_route.call_count, 2)
+
+    @override_settings(ROUTE_CACHE_LOCK_ACROSS_WORKERS=True, ROUTE_CACHE_LOCK_TIMEOUT=2)
+    def test_waits_for_fill_by_another_worker(self):
+        key = route_cache.make_key(ORIGIN, DESTINATION)
+        lock_key = f"{route_cache.LOCK_PREFIX}:{key}"
+        route_cache.cache.add(lock_key, 1)
+
+        def other_worker():
+            time.sleep(0.15)
+            route_cache.cache.set(key, ROUTE_DATA)
+            route_cache.cache.delete(lock_key)
+        threading.Thread(target=other_worker).start()
+
+        fetch = mock.Mock(return_value=None)
+        self.assertEqual(route_cache.get_or_fetch(ORIGIN, DESTINATION, fetch), ROUTE_DATA)
+        fetch.assert_not_called()
+
+    @override_settings(ROUTE_CACHE_LOCK_ACROSS_WORKERS=True, ROUTE_CACHE_LOCK_TIMEOUT=2)
+    def test_fetches_when_lock_holder_gives_up(self):
+        key = route_cache.make_key(ORIGIN, DESTINATION)
+        lock_key = f"{route_cache.LOCK_PREFIX}:{key}"
+        route_cache.cache.add(lock_key, 1)
+        threading.Timer(0.1, route_cache.cache.delete, [lock_key]).start()
+
+        fetch = mock.Mock(return_value=ROUTE_DATA)
+        self.assertEqual(route_cache.get_or_fetch(ORIGIN, DESTINATION, fetch), ROUTE_DATA)
+        fetch.assert_called_once_with()
+        self.assertIsNone(route_cache.cache.get(lock_key))
+
+
+class BatchFareTests(TestCase):
+    DISTANCES = [0, 2.5, 3.0, 3.0001, 4.1, 7.999, 8.0, 12.345, 29.9, 500, 20037.508]
+
+    def test_vectorized_matches_scalar(self):
+        for passenger_type in ('REGULAR', 'STUDENT'):
+            fares = FareCalculator.calculate_fares(self.DISTANCES, passenger_type)
+            rate = 0.20 if passenger_type == 'STUDENT' else None
+            for i, distance in enumerate(self.DISTANCES):
+                expected = FareCalculator.calculate_fare(distance, rate)
+                for key in ('fare', 'original_fare', 'discount_applied'):
+                    self.assertEqual(fares[key][i], float(expected[key]), (distance, key))
+
+    def test_out_of_range_distances_raise(self):
+        for distance in (float('nan'), float('inf'), -1, 1e17):
+            with self.assertRaises(ValueError, msg=distance):
+                FareCalculator.calculate_fares([2.0, distance])
+
+    def test_batch_endpoint_rejects_bad_distances(self):
+        for distance in ('nan', 'inf', '-inf', 1e19, 501, -1):
+            response = APIClient().post('/v2/routes/calculate/batch/', {
+                'distances': [2.0, distance],
+            }, format='json')
+            self.assertEqual(response.status_code, 400, distance)
+            self.assertIn('distances', response.data)
+
+    def test_batch_endpoint_rejects_bad_coordinates(self):
+        for point in ([91, 125.0], [11.2, -180.5], ['nan', 125.0]):
+            response = APIClient().post('/v2/routes/calculate/batch/', {
+                'origins': [list(ORIGIN), point],
+                'destinations': [list(DESTINATION), list(DESTINATION)],
+            }, format='json')
+            self.assertEqual(response.status_code, 400, point)
+            self.assertIn('origins', response.data)
+
+    def test_batch_endpoint(self):
+        response = APIClient().post('/v2/routes/calculate/batch/', {
+            'distances': [2.0, 5.5],
+            'passenger_types': ['REGULAR', 'SENIOR'],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['fare'], [15.0, 19.0])
+        self.assertEqual(response.data['original_fare'], [15.0, 24.0])
+
+    def test_batch_endpoint_with_coordinates(self):
+        response = APIClient().post('/v2/routes/calculate/batch/', {
+            'origins': [list(ORIGIN), list(ORIGIN)],
+            'destinations': [list(DESTINATION), list(ORIGIN)],
+            'passenger_type': 'PWD',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        single = calculate_route_with_fare(
+            ORIGIN, DESTINATION, use_google_maps=False, passenger_type='PWD'
+        )
+        self.assertEqual(response.data['distance_km'], [single['distance']['kilometers'], 0.0])
+        self.assertEqual(response.data['fare'][0], single['fare']['fare'])
+
+    def test_batch_endpoint_requires_distances_or_coordinates(self):
+        response = APIClient().post('/v2/routes/calculate/batch/', {
+            'origins': [list(ORIGIN)],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_endpoint_rejects_mismatched_lengths(self):
+        response = APIClient().post('/v2/routes/calculate/batch/', {
+            'distances': [2.0, 5.5],
+            'passenger_types': ['REGULAR'],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class GPSDistanceCalculatorTests(TestCase):
+    POINTS = [ORIGIN, DESTINATION, (11.3, 125.1), (11.2, 124.98), (-33.86, 151.21)]
+
+    def test_pairs_match_scalar(self):
+        origins = self.POINTS
+        destinations = self.POINTS[::-1]
+        distances = GPSDistanceCalculator.calculate_distances(origins, destinations)
+        for distance, origin, destination in zip(distances, origins, destinations):
+            self.assertAlmostEqual(
+                distance, GPSDistanceCalculator.calculate_distance(origin, destination), places=9
+            )
+
+    def test_single_destination_is_broadcast(self):
+        distances = GPSDistanceCalculator.calculate_distances(self.POINTS, DESTINATION)
+        self.assertEqual(distances.shape, (len(self.POINTS),))
+        self.assertEqual(distances[1], 0.0)
+
+    def test_pairwise_matrix(self):
+        matrix = GPSDistanceCalculator.pairwise_matrix(self.POINTS)
+        self.assertEqual(matrix.shape, (5, 5))
+        for i, a in enumerate(self.POINTS):
+            self.assertEqual(matrix[i, i], 0.0)
+            for j, b in enumerate(self.POINTS):
+                self.assertAlmostEqual(
+                    matrix[i, j], GPSDistanceCalculator.calculate_distance(a, b), places=9
+                )
+
+    def test_rejects_malformed_points(self):
+        with self.assertRaises(ValueError):
+            GPSDistanceCalculator.pairwise_matrix([(11.28, 125.06, 0.0)])
+
+
+@override_settings(ROAD_MULTIPLIER_CELL_METERS=2000)
+class RoadMultiplierTests(TestCase):
+    CELL_DEGREES = 2000 / METERS_PER_DEGREE
+
+    def setUp(self):
+        # Fitted rows are rolled back after each test; the loaded table is not
+        road_multipliers.invalidate()
+        self.addCleanup(road_multipliers.invalidate)
+
+    def cell_center(self, lat_cell, lng_cell, jitter=0.0):
+        return (
+            (lat_cell + 0.5) * self.CELL_DEGREES + jitter,
+            (lng_cell + 0.5) * self.CELL_DEGREES - jitter,
+        )
+
+    def record_trips(self, origin_cell, destination_cell, ratio, count=6):
+        for i in range(count):
+            origin = self.cell_center(*origin_cell, jitter=i * 0.0003)
+            destination = self.cell_center(*destination_cell, jitter=-i * 0.0003)
+            straight_km = GPSDistanceCalculator.straight_line_distances([origin], [destination])[0]
+            FareCalculation.objects.create(
+                from_location='A', to_location='B', distance=Decimal('1.00'),
+                calculated_fare=Decimal('15.00'), calculation_type='Google Maps Route Planner',
+                route_data={
+                    'polyline': encode_polyline([origin, destination]),
+                    'distance': {'meters': round(straight_km * ratio * 1000)},
+                }
+            )
+
+    def test_route_sample_formats(self):
+        response = {
+            'method': 'google_maps',
+            'route': {'polyline': encode_polyline([ORIGIN, DESTINATION]), 'distance': {'meters': 6420}},
+            'distance': {'kilometers': 6.42, 'meters': 6420},
+        }
+        sample = route_sample(response)
+        self.assertAlmostEqual(sample[0], ORIGIN[0], places=5)
+        self.assertAlmostEqual(sample[3], DESTINATION[1], places=5)
+        self.assertEqual(sample[4], 6.42)
+        self.assertEqual(
+            route_sample({'origin': {'lat': 1, 'lng': 2}, 'destination': [3, 4], 'distance': {'meters': 500}}),
+            (1.0, 2.0, 3.0, 4.0, 0.5)
+        )
+        self.assertIsNone(route_sample({'polyline': 'abc'}))
+        self.assertIsNone(route_sample(None))
+
+    def test_calibration_in_another_process_is_picked_up(self):
+        far = self.cell_center(700, 7000), self.cell_center(705, 7000)
+        self.assertEqual(road_multipliers.lookup(*far, default=1.3), 1.3)
+
+        # calibrate_road_multipliers ran as a separate command: its rows and
+        # its version token arrive, its on_commit in this process does not
+        RoadMultiplier.objects.create(
+            scope=RoadMultiplier.Scope.GLOBAL, cell_meters=2000, multiplier=1.6, samples=10
+        )
+        bump_shared_version(RoadMultiplierTable.VERSION_KEY)
+        with mock.patch.object(VersionedValue, 'CHECK_SECONDS', 0):
+            self.assertEqual(road_multipliers.lookup(*far, default=1.3), 1.6)
+
+    def test_calibrated_multipliers_are_used(self):
+        self.record_trips((627, 6957), (629, 6960), ratio=1.8)
+        self.record_trips((640, 6950), (643, 6951), ratio=1.2)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('calibrate_road_multipliers', holdout=0, verbosity=0, stdout=mock.Mock())
+
+        self.assertEqual(RoadMultiplier.objects.filter(scope=RoadMultiplier.Scope.PAIR).count(), 2)
+        cases = [
+            (self.cell_center(627, 6957), self.cell_center(629, 6960), 1.8),
+            (self.cell_center(643, 6951), self.cell_center(640, 6950), 1.2),  # reverse direction
+            (self.cell_center(627, 6957), self.cell_center(643, 6951), 1.5),  # cells 1.8 and 1.2
+            (self.cell_center(700, 7000), self.cell_center(705, 7000), 1.5),  # global median
+        ]
+        origins = [origin for origin, _, _ in cases]
+        destinations = [destination for _, destination, _ in cases]
+        straight = GPSDistanceCalculator.straight_line_distances(origins, destinations)
+        vectorized = GPSDistanceCalculator.calculate_distances(origins, destinations)
+        for i, (origin, destination, multiplier) in enumerate(cases):
+            self.assertAlmostEqual(
+                GPSDistanceCalculator.calculate_distance(origin, destination) / straight[i],
+                multiplier, places=2
+            )
+            self.assertAlmostEqual(vectorized[i] / straight[i], multiplier, places=2)
+
+        matrix = GPSDistanceCalculator.pairwise_matrix(origins)
+        self.assertAlmostEqual(
+            matrix[0, 2], GPSDistanceCalculator.calculate_distance(origins[0], origins[2]), places=9
+        )
+
+    def test_without_calibration_uses_default(self):
+        self.assertAlmostEqual(
+            GPSDistanceCalculator.calculate_distance(ORIGIN, DESTINATION) /
+            GPSDistanceCalculator.straight_line_distances([ORIGIN], [DESTINATION])[0],
+            GPSDistanceCalculator.ROAD_MULTIPLIER
+        )
+
+
+class RoadGraphTests(TestCase):
+    """A→B→C is a two-way road; C→A a one-way shortcut; A–C also a footpath"""
+    A = (11.2800, 125.0000)
+    B = (11.2800, 125.0100)
+    C = (11.2900, 125.0100)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.geojson = self.directory / 'roads.geojson'
+        self.geojson.write_text(json.dumps({
+            'type': 'FeatureCollection',
+            'features': [
+                self.feature([self.A, self.B, self.C], highway='tertiary'),
+                self.feature([self.C, self.A], highway='residential', oneway='yes'),
+                self.feature([self.A, self.C], highway='footway'),
+            ],
+        }))
+        reset_road_graph()
+        self.addCleanup(reset_road_graph)
+
+    @staticmethod
+    def feature(points, **properties):
+        return {
+            'type': 'Feature',
+            'properties': properties,
+            'geometry': {'type': 'LineString', 'coordinates': [[lng, lat] for lat, lng in points]},
+        }
+
+    @staticmethod
+    def straight_m(a, b):
+        return GPSDistanceCalculator.straight_line_distances([a], [b])[0] * 1000
+
+    def test_shortest_paths_follow_roads(self):
+        graph = RoadGraph.load(self.geojson)
+        self.assertEqual(graph.node_count, 3)
+        self.assertEqual(graph.edge_count, 5)
+        there = graph.route_distance(self.A, self.C, max_snap_meters=50)
+        back = graph.route_distance(self.C, self.A, max_snap_meters=50)
+        self.assertAlmostEqual(there, self.straight_m(self.A, self.B) + self.straight_m(self.B, self.C), delta=0.01)
+        self.assertAlmostEqual(back, self.straight_m(self.C, self.A), delta=0.01)
+        self.assertIsNone(graph.route_distance(self.A, (11.40, 125.20), max_snap_meters=50))
+
+    def test_compiled_graph_matches_source(self):
+        compiled = self.directory / 'roads.npz'
+        call_command('build_road_graph', str(self.geojson), str(compiled), benchmark=5, stdout=mock.Mock())
+        source, loaded = RoadGraph.load(self.geojson), RoadGraph.load(compiled)
+        for array in ('lat', 'lng', 'indptr', 'indices', 'weights'):
+            self.assertTrue((getattr(source, array) == getattr(loaded, array)).all(), array)
+
+    def test_osm_extract(self):
+        osm = self.directory / 'roads.osm'
+        osm.write_text(
+            '<osm version="0.6">'
+            f'<node id="1" lat="{self.A[0]}" lon="{self.A[1]}"/>'
+            f'<node id="2" lat="{self.B[0]}" lon="{self.B[1]}"/>'
+            f'<node id="3" lat="{self.C[0]}" lon="{self.C[1]}"/>'
+            '<way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><tag k="highway" v="tertiary"/></way>'
+            '<way id="11"><nd ref="3"/><nd ref="1"/><tag k="highway" v="residential"/>'
+            '<tag k="oneway" v="yes"/></way>'
+            '<way id="12"><nd ref="1"/><nd ref="3"/><tag k="highway" v="footway"/></way>'
+            '<way id="13"><nd ref="1"/><nd ref="3"/><tag k="waterway" v="river"/></way>'
+            '</osm>'
+        )
+        graph = RoadGraph.load(osm)
+        self.assertEqual(graph.edge_count, 5)
+        self.assertAlmostEqual(
+            graph.route_distance(self.C, self.A, max_snap_meters=50), self.straight_m(self.C, self.A), delta=0.01
+        )
+
+    def test_quotes_use_road_graph_before_gps(self):
+        near_a = (self.A[0] + 0.0001, self.A[1])  # ~11 m off the road
+        with override_settings(ROAD_GRAPH_PATH=str(self.geojson), ROAD_GRAPH_MAX_SNAP_METERS=50):
+            result = calculate_route_with_fare(near_a, self.C, use_google_maps=False)
+            async_result = async_to_sync(acalculate_route_with_fare)(near_a, self.C, use_google_maps=False)
+            off_network = calculate_route_with_fare((11.40, 125.20), self.C, use_google_maps=False)
+
+        expected = round(
+            self.straight_m(near_a, self.A) + self.straight_m(self.A, self.B) + self.straight_m(self.B, self.C)
+        )
+        self.assertEqual(result['method'], 'road_graph')
+        self.assertEqual(result['distance']['meters'], expected)
+        self.assertEqual(async_result, result)
+        self.assertEqual(off_network['method'], 'gps')
+
+    def test_unconfigured_or_unreadable_graph_falls_back(self):
+        self.assertEqual(calculate_route_with_fare(self.A, self.C, use_google_maps=False)['method'], 'gps')
+        with override_settings(ROAD_GRAPH_PATH=str(self.directory / 'missing.npz')):
+            self.assertEqual(calculate_route_with_fare(self.A, self.C, use_google_maps=False)['method'], 'gps')
+
+
+class CentavoFareCalculatorTests(TestCase):
+    def test_matches_decimal_implementation_on_every_metre(self):
+        """Every metre from 0 to 60 km, with and without the discount"""
+        for distance_m in range(0, 60001):
+            for discounted in (False, True):
+                expected = FareCalculator.calculate_fare(
+                    distance_m / 1000.0,
+                    0.20 if discounted else None
+                )
+                actual = CentavoFareCalculator.fare_breakdown(distance_m, discounted)
+                breakdown = expected.pop('breakdown')
+                for key, value in expected.items():
+                    self.assertEqual(actual[key], float(value), (distance_m, discounted, key))
+                for key, value in breakdown.items():
+                    self.assertEqual(actual['breakdown'][key], float(value), (distance_m, discounted, key))
+
+    def test_started_kilometre_is_charged(self):
+        self.assertEqual(CentavoFareCalculator.calculate_fare(3000), (1500, 1500, 0, 0))
+        self.assertEqual(CentavoFareCalculator.calculate_fare(3001), (1800, 1800, 0, 1))
+        self.assertEqual(CentavoFareCalculator.calculate_fare(5500, discounted=True), (1900, 2400, 480, 3))
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class FareScheduleTests(TestCase):
+    def setUp(self):
+        self.origin = Location.objects.create(name='Mercado', latitude=ORIGIN[0], longitude=ORIGIN[1])
+        self.destination = Location.objects.create(
+            name='Amandayehan', latitude=DESTINATION[0], longitude=DESTINATION[1]
+        )
+        self.route = Route.objects.create(
+            origin=self.origin, destination=self.destination, transport_type='TRICYCLE'
+        )
+        today = date.today()
+        with self.captureOnCommitCallbacks(execute=True):
+            Fare.objects.create(
+                route=self.route, amount=Decimal('30.00'),
+                effective_date=today - timedelta(days=400), expiry_date=today - timedelta(days=30)
+            )
+            self.current = Fare.objects.create(
+                route=self.route, amount=Decimal('35.00'), effective_date=today - timedelta(days=29)
+            )
+
+    def quote(self, passenger_type='REGULAR'):
+        return calculate_route_with_fare(
+            ORIGIN, DESTINATION, use_google_maps=False, passenger_type=passenger_type,
+            origin_location_id=self.origin.id, destination_location_id=self.destination.id
+        )['fare']
+
+    def test_tariff_in_force_is_used(self):
+        fare = self.quote()
+        self.assertEqual((fare['fare'], fare['original_fare']), (35.0, 35.0))
+        self.assertEqual(fare['tariff']['fare_id'], self.current.id)
+        # A flat amount, not the distance formula
+        self.assertEqual(fare['breakdown'], {
+            'flat_tariff': True, 'base_fare': 35.0, 'base_distance_km': None,
+            'additional_distance_km': 0.0, 'additional_fare': 0.0, 'distance_km': fare['breakdown']['distance_km'],
+        })
+
+    def test_discount_applies_to_regular_tariff(self):
+        fare = self.quote('STUDENT')
+        self.assertEqual((fare['fare'], fare['discount_applied']), (28.0, 7.0))
+
+    def test_no_queries_once_compiled_and_rebuilt_after_save(self):
+        self.quote()
+        with self.assertNumQueries(0):
+            fare_schedule.resolve(self.origin.id, self.destination.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.current.amount = Decimal('40.00')
+            self.current.save()
+        self.assertEqual(self.quote()['fare'], 40.0)
+
+    def test_unknown_pair_uses_ordinance(self):
+        fare = calculate_route_with_fare(ORIGIN, DESTINATION, use_google_maps=False)['fare']
+        self.assertNotIn('tariff', fare)
+
+    def test_cheapest_transport_type_without_one_given(self):
+        jeepney = Route.objects.create(
+            origin=self.origin, destination=self.destination, transport_type='JEEPNEY'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            cheaper = Fare.objects.create(
+                route=jeepney, amount=Decimal('25.00'), effective_date=date.today() - timedelta(days=1)
+            )
+        fare = self.quote()
+        self.assertEqual((fare['fare'], fare['tariff']['transport_type']), (25.0, 'JEEPNEY'))
+        self.assertEqual(fare_schedule.resolve(self.origin.id, self.destination.id).fare_id, cheaper.id)
+        self.assertEqual(
+            fare_schedule.quote(self.origin.id, self.destination.id, 6000, transport_type='TRICYCLE')['fare'],
+            35.0
+        )
+
+    def test_change_made_by_another_process_is_picked_up(self):
+        self.quote()
+        # Another worker saves a fare: the row changes and the shared token
+        # is replaced, but no signal fires in this process
+        Fare.objects.filter(pk=self.current.pk).update(amount=Decimal('45.00'))
+        bump_shared_version(FareSchedule.VERSION_KEY)
+        with mock.patch.object(VersionedValue, 'CHECK_SECONDS', 0):
+            self.assertEqual(self.quote()['fare'], 45.0)
+
+
+DIRECTIONS_RESPONSE = {
+    'status': 'OK',
+    'routes': [{
+        'overview_polyline': {'points': 'abc'},
+        'bounds': {},
+        'legs': [{
+            'distance': {'value': 6420, 'text': '6.4 km'},
+            'duration': {'value': 720, 'text': '12 mins'},
+            'start_address': 'Basey',
+            'end_address': 'Amandayehan',
+            'steps': [],
+        }],
+    }],
+}
+
+
+class StubGoogleHandler(BaseHTTPRequestHandler):
+    """Serves canned Directions responses; behaviour set on the server"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.hits += 1
+        self.server.client_ports.add(self.client_address[1])
+        if self.server.mode == 'slow':
+            time.sleep(1)
+        status = 502 if self.server.mode == 'error' else 200
+        body = json.dumps(
+            {'status': 'NOT_FOUND', 'routes': []} if self.server.mode == 'not_found' else DIRECTIONS_RESPONSE
+        ).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client gave up (read timeout tests)
+
+    def log_message(self, *args):
+        pass
+
+
+class GoogleMapsClientTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGoogleHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.mode = 'ok'
+        self.server.hits = 0
+        self.server.client_ports = set()
+        overrides = override_settings(
+            GOOGLE_MAPS_SERVER_API_KEY='AIzaStubKey',
+            GOOGLE_MAPS_BASE_URL=f'http://127.0.0.1:{self.server.server_port}',
+            GOOGLE_MAPS_READ_TIMEOUT=0.3,
+            GOOGLE_MAPS_DEADLINE=0.5,
+            GOOGLE_MAPS_BREAKER_THRESHOLD=2,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_maps_client()
+        self.addCleanup(reset_maps_client)
+        route_cache.clear()
+
+    def test_client_and_connection_are_shared(self):
+        first = GoogleMapsService().get_detailed_route(ORIGIN, DESTINATION)
+        second = GoogleMapsService().get_detailed_route(ORIGIN, DESTINATION)
+        self.assertEqual(first['distance']['meters'], 6420)
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.hits, 2)
+        self.assertEqual(len(self.server.client_ports), 1)
+
+    def test_slow_response_hits_read_timeout(self):
+        self.server.mode = 'slow'
+        started = time.monotonic()
+        self.assertIsNone(GoogleMapsService().get_detailed_route(ORIGIN, DESTINATION))
+        self.assertLess(time.monotonic() - started, 0.9)
+
+    def test_breaker_opens_and_quotes_fall_back_to_gps(self):
+        self.server.mode = 'error'
+        for _ in range(2):
+            self.assertIsNone(GoogleMapsService().get_detailed_route(ORIGIN, DESTINATION))
+        self.assertEqual(self.server.hits, 2)
+
+        result = calculate_route_with_fare(ORIGIN, DESTINATION)
+        self.assertEqual(result['method'], 'gps')
+        self.assertEqual(self.server.hits, 2)
+
+    def test_bad_requests_leave_the_breaker_closed(self):
+        self.server.mode = 'not_found'
+        for _ in range(5):
+            self.assertIsNone(GoogleMapsService().get_detailed_route(ORIGIN, DESTINATION))
+        self.assertEqual(self.server.hits, 5)
+        self.assertEqual(get_breaker().state, CircuitBreaker.CLOSED)
+
+    def test_async_variant(self):
+        route = async_to_sync(AsyncGoogleMapsService().get_detailed_route)(ORIGIN, DESTINATION)
+        self.assertEqual(route['duration']['seconds'], 720)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        for model in (Fare, Route, Location):
+            invalidate_stamp(model)
+            self.addCleanup(invalidate_stamp, model)
+        self.origin = Location.objects.create(name='Mercado', latitude=ORIGIN[0], longitude=ORIGIN[1])
+        self.destination = Location.objects.create(
+            name='Amandayehan', latitude=DESTINATION[0], longitude=DESTINATION[1]
+        )
+        route = Route.objects.create(origin=self.origin, destination=self.destination)
+        Fare.objects.create(route=route, amount=Decimal('35.00'), effective_date=date.today())
+
+    def test_unchanged_list_is_not_serialized(self):
+        response = self.client.get('/v2/fares/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('max-age=0', response['Cache-Control'])
+
+        # One stamp aggregate per model; the queryset is never evaluated
+        with self.assertNumQueries(3):
+            cached = self.client.get('/v2/fares/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+        cached = self.client.get('/v2/fares/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(cached.status_code, 304)
+
+        # Another query string is another representation
+        other = self.client.get('/v2/fares/?passenger_type=REGULAR', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(other.status_code, 200)
+
+    def test_save_in_another_worker_is_not_answered_from_a_stale_stamp(self):
+        response = self.client.get('/v2/locations/')
+        other_worker = dict(LOCAL_CACHES, default={
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'other-worker'
+        })
+        with override_settings(CACHES=other_worker), \
+                mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(seconds=5)), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.origin.name = 'Basey Public Market'
+            self.origin.save()
+
+        for headers in ({'HTTP_IF_NONE_MATCH': response['ETag']},
+                        {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}):
+            revalidated = self.client.get('/v2/locations/', **headers)
+            self.assertEqual(revalidated.status_code, 200, headers)
+            self.assertIn('Basey Public Market', [location['name'] for location in revalidated.json()['results']])
+
+    def test_nested_model_change_is_a_new_version(self):
+        etags = {path: self.client.get(path)['ETag'] for path in ('/v2/fares/', '/v2/routes/', '/v2/locations/')}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.origin.name = 'Basey Public Market'
+            self.origin.save()
+        for path, etag in etags.items():
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_deletion_moves_last_modified(self):
+        response = self.client.get(f'/v2/locations/{self.destination.id}/')
+        self.assertEqual(response.status_code, 200)
+        last_modified = response['Last-Modified']
+        with mock.patch('bfg.conditional.time.time', return_value=time.time() + 5), \
+                self.captureOnCommitCallbacks(execute=True):
+            Location.objects.create(name='Temporary').delete()
+        response = self.client.get('/v2/locations/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+        missing = self.client.get('/v2/locations/999999/')
+        self.assertEqual(missing.status_code, 404)
+        self.assertNotIn('ETag', missing)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SnapshotTests(TestCase):
+    def setUp(self):
+        for model in (Fare, Route, Location):
+            invalidate_stamp(model)
+            self.addCleanup(invalidate_stamp, model)
+        self.origin = Location.objects.create(name='Mercado', latitude=ORIGIN[0], longitude=ORIGIN[1])
+        self.destination = Location.objects.create(
+            name='Amandayehan', latitude=DESTINATION[0], longitude=DESTINATION[1]
+        )
+        closed = Location.objects.create(name='Closed', is_active=False)
+        self.route = Route.objects.create(
+            origin=self.origin, destination=self.destination, transport_type='TRICYCLE',
+            distance_km=Decimal('6.42')
+        )
+        self.other_route = Route.objects.create(
+            origin=self.destination, destination=self.origin, transport_type='JEEPNEY'
+        )
+        self.hidden_route = Route.objects.create(
+            origin=self.origin, destination=closed, transport_type='TRICYCLE'
+        )
+        self.fare = Fare.objects.create(route=self.route, amount=Decimal('25.00'), effective_date=date.today())
+        self.other_fare = Fare.objects.create(
+            route=self.other_route, amount=Decimal('30.00'), effective_date=date.today()
+        )
+        Fare.objects.create(route=self.hidden_route, amount=Decimal('20.00'), effective_date=date.today())
+
+    def get(self, path='/v2/snapshot/', **headers):
+        response = self.client.get(path, HTTP_ACCEPT_ENCODING='gzip, deflate', **headers)
+        if response.status_code == 200:
+            response.data = json.loads(gzip.decompress(response.content))
+        return response
+
+    def test_bundle_holds_active_rows_and_fare_rules(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        snapshot = response.data
+        self.assertIsNone(snapshot['since'])
+        self.assertEqual([loc['id'] for loc in snapshot['locations']], [self.origin.id, self.destination.id])
+        self.assertEqual([route['id'] for route in snapshot['routes']], [self.route.id, self.other_route.id])
+        self.assertEqual(snapshot['routes'][0]['origin'], self.origin.id)
+        self.assertEqual(snapshot['routes'][0]['distance_km'], '6.42')
+        self.assertEqual([fare['id'] for fare in snapshot['fares']], [self.fare.id, self.other_fare.id])
+        self.assertEqual(snapshot['fares'][0]['amount'], '25.00')
+        self.assertEqual(snapshot['fare_rules']['base_fare'], '15.00')
+        self.assertEqual(snapshot['fare_rules']['discount_rate'], '0.20')
+
+        # Same bytes for clients that cannot take gzip
+        plain = self.client.get('/v2/snapshot/')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(json.loads(plain.content), snapshot)
+
+        # Only the three stamp aggregates; nothing is built or compressed
+        with self.assertNumQueries(3):
+            cached = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_write_publishes_a_new_version(self):
+        response = self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fare.amount = Decimal('27.50')
+            self.fare.save()
+        updated = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(updated.status_code, 200)
+        self.assertGreaterEqual(updated.data['version'], response.data['version'])
+        self.assertEqual(updated.data['fares'][0]['amount'], '27.50')
+
+    def test_delta_since_version(self):
+        # Everything the client already has was written an hour ago
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        for model in (Fare, Route, Location):
+            model.objects.update(updated_at=an_hour_ago)
+            invalidate_stamp(model)
+        version = self.get().data['version']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other_route.estimated_duration_minutes = 15
+            self.other_route.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fare.delete()
+
+        delta = self.get(f'/v2/snapshot/?since={version}')
+        self.assertEqual(delta.status_code, 200)
+        snapshot = delta.data
+        self.assertEqual(snapshot['since'], version - version % (DELTA_BUCKET_SECONDS * 1000))
+        self.assertGreater(snapshot['version'], version)
+        self.assertEqual(snapshot['locations'], [])
+        self.assertEqual([route['id'] for route in snapshot['routes']], [self.other_route.id])
+        self.assertEqual(snapshot['routes'][0]['estimated_duration_minutes'], 15)
+        # The fare hangs on the changed route
+        self.assertEqual([fare['id'] for fare in snapshot['fares']], [self.other_fare.id])
+        self.assertEqual(snapshot['ids'], {
+            'locations': [self.origin.id, self.destination.id],
+            'routes': [self.route.id, self.other_route.id],
+            'fares': [self.other_fare.id],
+        })
+
+    def test_delta_since_is_bucketed(self):
+        version = self.get().data['version']
+        bucket = version - version % (DELTA_BUCKET_SECONDS * 1000)
+        first = self.get(f'/v2/snapshot/?since={version}')
+        self.assertEqual(first.data['since'], bucket)
+        # Any since in the bucket is the same cached delta
+        second = self.get(f'/v2/snapshot/?since={bucket + 1}')
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_old_or_future_since(self):
+        version = self.get().data['version']
+        full = self.get(f'/v2/snapshot/?since={version - DELTA_MAX_AGE_SECONDS * 1000 - 1}')
+        self.assertIsNone(full.data['since'])
+        self.assertNotIn('ids', full.data)
+        self.assertEqual(full['ETag'], self.get()['ETag'])
+
+        self.assertEqual(self.client.get(f'/v2/snapshot/?since={version + 1}').status_code, 410)
+
+    def test_invalid_since_is_rejected(self):
+        response = self.client.get('/v2/snapshot/?since=yesterday')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('since', response.json())
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.origin = Location.objects.create(name='Mercado', latitude=ORIGIN[0], longitude=ORIGIN[1])
+        self.destination = Location.objects.create(
+            name='Amandayehan', latitude=DESTINATION[0], longitude=DESTINATION[1]
+        )
+        self.route = Route.objects.create(origin=self.origin, destination=self.destination)
+        self.fare = Fare.objects.create(route=self.route, amount=Decimal('25.00'), effective_date=date.today())
+        self.cursor = ReferenceChange.objects.latest('id').id
+        # Treat every entry as settled unless a test says otherwise
+        patcher = mock.patch('fares.sync.SETTLE_SECONDS', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sync(self, since):
+        return self.client.get(f'/v2/sync/?since={since}')
+
+    def test_writes_are_logged(self):
+        log = list(ReferenceChange.objects.values_list('kind', 'object_id', 'action'))
+        self.assertEqual(log, [
+            ('LOCATION', self.origin.id, 'SAVED'),
+            ('LOCATION', self.destination.id, 'SAVED'),
+            ('ROUTE', self.route.id, 'SAVED'),
+            ('FARE', self.fare.id, 'SAVED'),
+        ])
+
+    def test_changes_since_cursor(self):
+        self.fare.amount = Decimal('27.50')
+        self.fare.save()
+        self.fare.save()
+        new_location = Location.objects.create(name='Guirang')
+        closed = Location.objects.create(name='Bucas')
+        closed.is_active = False
+        closed.save()
+
+        response = self.sync(self.cursor)
+        self.assertEqual(response.status_code, 200)
+        changes = response.json()
+        self.assertEqual(changes['cursor'], ReferenceChange.objects.latest('id').id)
+        self.assertFalse(changes['more'])
+        self.assertEqual([loc['id'] for loc in changes['locations']], [new_location.id])
+        self.assertEqual(changes['routes'], [])
+        # Two saves of one fare collapse into its current row
+        self.assertEqual(len(changes['fares']), 1)
+        self.assertEqual(changes['fares'][0]['amount'], '27.50')
+        self.assertEqual(changes['removed'], {'locations': [closed.id], 'routes': [], 'fares': []})
+
+        # Nothing new at the returned cursor
+        current = self.sync(changes['cursor']).json()
+        self.assertEqual(current['cursor'], changes['cursor'])
+        self.assertEqual(current['fares'], [])
+
+    def test_deactivated_location_removes_its_routes_and_fares(self):
+        self.destination.is_active = False
+        self.destination.save()
+        changes = self.sync(self.cursor).json()
+        self.assertEqual([changes['locations'], changes['routes'], changes['fares']], [[], [], []])
+        self.assertEqual(changes['removed'], {
+            'locations': [self.destination.id], 'routes': [self.route.id], 'fares': [self.fare.id]
+        })
+
+        # Reactivating it brings them back without touching them
+        self.destination.is_active = True
+        self.destination.save()
+        changes = self.sync(changes['cursor']).json()
+        self.assertEqual([route['id'] for route in changes['routes']], [self.route.id])
+        self.assertEqual([fare['id'] for fare in changes['fares']], [self.fare.id])
+        self.assertEqual(changes['removed'], {'locations': [], 'routes': [], 'fares': []})
+
+    def test_deactivated_route_removes_its_fares(self):
+        self.route.is_active = False
+        self.route.save()
+        changes = self.sync(self.cursor).json()
+        self.assertEqual(changes['removed'], {'locations': [], 'routes': [self.route.id], 'fares': [self.fare.id]})
+
+    def test_deletes_are_removed(self):
+        ids = {'locations': [self.origin.id], 'routes': [self.route.id], 'fares': [self.fare.id]}
+        # The cascade logs the route and fare too
+        self.origin.delete()
+        changes = self.sync(self.cursor).json()
+        self.assertEqual(changes['removed'], ids)
+        self.assertEqual(
+            ReferenceChange.objects.filter(action='DELETED').count(), 3
+        )
+
+    def test_large_backlogs_are_paged(self):
+        first = changes_since(0, limit=2)
+        self.assertTrue(first['more'])
+        self.assertEqual(len(first['locations']), 2)
+        second = changes_since(first['cursor'], limit=2)
+        self.assertFalse(second['more'])
+        self.assertEqual([len(second['routes']), len(second['fares'])], [1, 1])
+
+    @mock.patch('fares.sync.SETTLE_SECONDS', 60)
+    def test_cursor_stays_behind_unsettled_entries(self):
+        self.fare.amount = Decimal('27.50')
+        self.fare.save()
+        changes = self.sync(self.cursor).json()
+        # Sent at once, but an entry committed late below it must not be skipped
+        self.assertEqual(changes['fares'][0]['amount'], '27.50')
+        self.assertEqual(changes['cursor'], self.cursor)
+        self.assertFalse(changes['more'])
+
+        ReferenceChange.objects.update(changed_at=timezone.now() - timedelta(seconds=61))
+        changes = self.sync(self.cursor).json()
+        self.assertEqual(changes['cursor'], ReferenceChange.objects.latest('id').id)
+
+    @mock.patch('fares.sync.SETTLE_SECONDS', 60)
+    def test_pages_stop_at_unsettled_entries(self):
+        ReferenceChange.objects.filter(object_id=self.origin.id, kind='LOCATION').update(
+            changed_at=timezone.now() - timedelta(seconds=61)
+        )
+        first = changes_since(0, limit=2)
+        self.assertTrue(first['more'])
+        self.assertEqual(first['cursor'], ReferenceChange.objects.get(object_id=self.origin.id, kind='LOCATION').id)
+        second = changes_since(first['cursor'], limit=2)
+        self.assertEqual(second['cursor'], first['cursor'])
+        self.assertFalse(second['more'])
+
+    def test_snapshot_carries_cursor(self):
+        response = self.client.get('/v2/snapshot/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))['cursor'], self.cursor)
+
+    def test_unknown_cursor(self):
+        self.assertEqual(self.sync(self.cursor + 100).status_code, 410)
+        self.assertEqual(self.client.get('/v2/sync/').status_code, 400)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class FareListQueryTests(ListQueryCountMixin, TestCase):
+    def setUp(self):
+        for model in (Fare, Route, Location):
+            invalidate_stamp(model)
+            self.addCleanup(invalidate_stamp, model)
+
+    def add_fares(self, count):
+        start = Location.objects.count()
+        for i in range(start, start + count):
+            route = Route.objects.create(
+                origin=Location.objects.create(name=f'From {i}'),
+                destination=Location.objects.create(name=f'To {i}'),
+                transport_type='TRICYCLE'
+            )
+            Fare.objects.create(route=route, amount=Decimal('25.00'), effective_date=date.today())
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        # Three version stamps, the page count and the rows
+        page = self.assertListQueries('/v2/fares/', self.add_fares, 5, large=30)
+        self.assertEqual(page['count'], 32)
+        self.assertTrue(page['results'][0]['route_details']['origin_details']['name'])
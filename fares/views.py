@@ -1,15 +1,93 @@
-from rest_framework import viewsets
+import gzip
+
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_GET
+from rest_framework import viewsets, status
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 
+from bfg.conditional import ConditionalGetMixin, conditional_response
+from locations.models import Location
+from routes.models import Route
 from .models import Fare
-from .serializers import FareSerializer
+from .serializers import FareSerializer, SnapshotQuerySerializer, SyncQuerySerializer
+from .snapshot import snapshot_response
+from .sync import changes_since
 
 
-class FareViewSet(viewsets.ModelViewSet):
+class FareViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet for Fare model"""
-    queryset = Fare.objects.filter(is_active=True)
+    # The route and both its endpoints are nested in every row
+    queryset = Fare.objects.filter(is_active=True).select_related(
+        'route__origin', 'route__destination'
+    ).defer('route__origin__boundary_data', 'route__destination__boundary_data')
+    conditional_models = [Fare, Route, Location]
     serializer_class = FareSerializer
     permission_classes = [AllowAny]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['route', 'passenger_type', 'is_active']
+
+
+@require_GET
+def snapshot(request):
+    """
+    Offline bundle of active locations, routes, fares and fare rules
+    GET /v2/snapshot/[?since=<version>]
+    
+    With since, only rows changed after that version are sent, plus the ids
+    of every row in the snapshot ("ids") so deleted rows can be dropped; a
+    copy older than a week gets the full snapshot ("since" is null). 410
+    when since is newer than the current version.
+    Gzip-encoded when the client accepts it; revalidate with If-None-Match.
+    """
+    query = SnapshotQuerySerializer(data=request.GET)
+    if not query.is_valid():
+        return JsonResponse(query.errors, status=400)
+    
+    bundle = snapshot_response(query.validated_data.get('since'))
+    if bundle is None:
+        return JsonResponse(
+            {'error': 'Unknown snapshot version; download /v2/snapshot/ again'},
+            status=status.HTTP_410_GONE
+        )
+    etag, body = bundle
+    
+    def render():
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = HttpResponse(body, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+            return response
+        return HttpResponse(gzip.decompress(body), content_type='application/json')
+    
+    response = conditional_response(request, etag, render)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def sync(request):
+    """
+    Locations, routes and fares changed since a change log cursor
+    GET /v2/sync/?since=<cursor>
+    
+    Active rows come in "locations", "routes" and "fares" in their current
+    state; deactivated and deleted ones are listed by id under "removed".
+    Store "cursor" for the next sync and call again at once while "more" is
+    true; changes of the last minute come again on the next sync. 410 when
+    the cursor is unknown: download /v2/snapshot/ again.
+    """
+    query = SyncQuerySerializer(data=request.query_params)
+    if not query.is_valid():
+        return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    changes = changes_since(query.validated_data['since'])
+    if changes is None:
+        return Response(
+            {'error': 'Unknown sync cursor; download /v2/snapshot/ again'},
+            status=status.HTTP_410_GONE
+        )
+    return Response(changes, status=status.HTTP_200_OK)
@@ -4,8 +4,15 @@ import locationService from '../services/locationService';
 import { useAuth } from '../context/AuthContext';
 import './FareCalculator.css';
 
+const METHOD_LABELS = {
+  google_maps: 'Google Maps',
+  distance_matrix: 'Precomputed Distance Matrix',
+  road_graph: 'Offline Road Network',
+  gps: 'GPS Distance (Haversine Formula)',
+};
+
 const FareCalculator = () => {
-  const { isAuthenticated, user } = useAuth();
+  const { isAuthenticated } = useAuth();
   const [locations, setLocations] = useState([]);
   const [formData, setFormData] = useState({
     origin_location: '',
@@ -52,13 +59,8 @@ const FareCalculator = () => {
     }
 
     try {
-      // Add user_id if authenticated
-      const requestData = {
-        ...formData,
-        ...(isAuthenticated && user?.id && { user_id: user.id })
-      };
-      
-      const data = await fareService.calculateFare(requestData);
+      // Signed-in users are identified by their token, not the request body
+      const data = await fareService.calculateFare(formData);
       setResult(data);
     } catch (err) {
       console.error('Fare calculation error:', err);
@@ -164,7 +166,9 @@ const FareCalculator = () => {
                 </div>
               )}
               <div className="result-item">
-                <span className="result-label">Base Fare:</span>
+                <span className="result-label">
+                  {result.fare?.breakdown?.flat_tariff ? 'Route Tariff:' : 'Base Fare:'}
+                </span>
                 <span className="result-value">
                   ₱{result.fare?.breakdown?.base_fare?.toFixed(2) || '0.00'}
                 </span>
@@ -185,14 +189,18 @@ const FareCalculator = () => {
               </div>
             </div>
             <div className="result-info">
-              <p><strong>Method:</strong> {result.method === 'google_maps' ? 'Google Maps' : 'GPS Distance (Haversine Formula)'}</p>
-              {result.method !== 'google_maps' && formData.calculation_method === 'GOOGLE_MAPS' && (
+              <p><strong>Method:</strong> {METHOD_LABELS[result.method] || METHOD_LABELS.gps}</p>
+              {result.method === 'gps' && formData.calculation_method === 'GOOGLE_MAPS' && (
                 <p className="info-text" style={{ color: '#ff9800', fontSize: '0.9em' }}>
                   ℹ️ Using GPS calculation as fallback. Distance estimated using road network multiplier.
                 </p>
               )}
               <p className="fare-formula">
-                <strong>Formula:</strong> ₱15.00 for first 3km, then ₱3.00/km additional
+                {result.fare?.breakdown?.flat_tariff ? (
+                  <><strong>Fare:</strong> Flat tariff for this route</>
+                ) : (
+                  <><strong>Formula:</strong> ₱15.00 for first 3km, then ₱3.00/km additional</>
+                )}
                 {result.fare?.discount_applied > 0 && ' (20% discount applied)'}
               </p>
               {result.origin_location && (
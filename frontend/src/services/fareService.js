@@ -15,15 +15,13 @@ const fareService = {
     const requestData = {
       origin: [originLocation.latitude, originLocation.longitude],
       destination: [destinationLocation.latitude, destinationLocation.longitude],
+      // Known locations are quoted from the distance matrix and route tariffs
+      origin_location_id: originLocation.id,
+      destination_location_id: destinationLocation.id,
       use_google_maps: fareData.calculation_method === 'GOOGLE_MAPS',
       passenger_type: fareData.passenger_type || 'REGULAR',
     };
 
-    // Add user_id if authenticated
-    if (fareData.user_id) {
-      requestData.user_id = fareData.user_id;
-    }
-
     const response = await api.post(API_ENDPOINTS.ROUTE_CALCULATE, requestData);
     
     // Add additional context to the response
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Location
+from .models import Location, LocationDistance
 
 
 @admin.register(Location)
@@ -25,3 +25,13 @@ class LocationAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at')
         }),
     )
+
+
+@admin.register(LocationDistance)
+class LocationDistanceAdmin(admin.ModelAdmin):
+    """Admin for LocationDistance model"""
+    list_display = ['origin', 'destination', 'distance_meters', 'duration_seconds', 'fare', 'computed_at']
+    search_fields = ['origin__name', 'destination__name']
+    ordering = ['origin', 'destination']
+    raw_id_fields = ['origin', 'destination']
+    readonly_fields = ['computed_at']
@@ -0,0 +1,134 @@
+"""
+In-memory prefix index for Location autocomplete
+
+Names and barangays of active locations are folded (accents stripped,
+case-folded, punctuation dropped, so "José Rizal" matches "jose riz") and
+split into words, which are kept in one sorted list. Every query word is
+looked up by binary search as a word prefix; a location matches when each
+query word prefixes one of its words. Matches are ranked:
+
+    exact name -> name starts with the query -> a name word starts with the
+    first query word -> other name matches -> matched through the barangay
+
+then by shorter name and alphabetically. The index is built on first use in
+each process; a Location save or delete replaces its token in the shared
+version store (bfg/versions.py) and the next keystroke in any worker
+after that rebuilds it.
+"""
+import bisect
+import heapq
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from bfg.versions import VersionedValue
+
+from .models import Location
+from .serializers import LocationListSerializer
+
+
+NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def fold(text: Optional[str]) -> str:
+    """Lower-case ASCII words of text separated by single spaces"""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return NON_WORD.sub(' ', stripped).strip()
+
+
+class _Entries:
+    """Folded words of every location, sorted for prefix search"""
+
+    def __init__(self, records: List[Dict]):
+        self.records = records
+        self.names = [fold(record['name']) for record in records]
+        words = []
+        for i, record in enumerate(records):
+            for position, word in enumerate(self.names[i].split()):
+                words.append((word, i, position))
+            for word in fold(record['barangay']).split():
+                words.append((word, i, -1))
+        words.sort()
+        self.words = [word for word, _, _ in words]
+        self.owners = [(i, position) for _, i, position in words]
+
+    def prefixed(self, prefix: str) -> Iterable[Tuple[int, int]]:
+        """(record index, word position; -1 for barangay words) of words starting with prefix"""
+        start = bisect.bisect_left(self.words, prefix)
+        end = bisect.bisect_left(self.words, prefix + '\x7f', start)
+        return self.owners[start:end]
+
+
+class AutocompleteIndex:
+    """Ranked prefix search over active location names"""
+
+    VERSION_KEY = 'location-autocomplete:version'
+
+    def __init__(self):
+        self._entries = VersionedValue(self.VERSION_KEY, lambda: _Entries(self.build()))
+
+    def entries(self) -> _Entries:
+        return self._entries.get()
+
+    @staticmethod
+    def build() -> List[Dict]:
+        """Serialized active locations"""
+        locations = Location.objects.filter(is_active=True).order_by('id')
+        return [dict(record) for record in LocationListSerializer(locations, many=True).data]
+
+    def invalidate(self) -> None:
+        """Drop this process' index and tell other processes to rebuild"""
+        self._entries.invalidate()
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        types: Optional[Iterable[str]] = None
+    ) -> List[Dict]:
+        """Best matches for what the user has typed so far, best first"""
+        entries = self.entries()
+        terms = fold(query).split()
+        if not terms or limit < 1:
+            return []
+
+        # Location -> earliest name word matching the first term (-1 when
+        # only its barangay matches); every later term must match too
+        first: Dict[int, int] = {}
+        for i, position in entries.prefixed(terms[0]):
+            if position >= 0:
+                first[i] = position if first.get(i, -1) < 0 else min(first[i], position)
+            else:
+                first.setdefault(i, -1)
+        candidates: Set[int] = set(first)
+        for term in terms[1:]:
+            candidates.intersection_update(i for i, _ in entries.prefixed(term))
+            if not candidates:
+                return []
+        if types:
+            types = set(types)
+            candidates = {i for i in candidates if entries.records[i]['type'] in types}
+
+        folded = ' '.join(terms)
+
+        def rank(i):
+            name = entries.names[i]
+            if name == folded:
+                tier = 0
+            elif name.startswith(folded):
+                tier = 1
+            elif first[i] == 0:
+                tier = 2
+            elif first[i] > 0:
+                tier = 3
+            else:
+                tier = 4
+            return tier, len(name), name, entries.records[i]['id']
+
+        return [entries.records[i] for i in heapq.nsmallest(limit, candidates, key=rank)]
+
+
+location_autocomplete = AutocompleteIndex()
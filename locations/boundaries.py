@@ -0,0 +1,213 @@
+"""
+Point-in-polygon barangay resolution over Location.boundary_data
+
+Boundary polygons of active Locations are parsed once into flat edge arrays
+with a bounding box per location. Resolving a point keeps the locations
+whose box contains it and ray-casts against their edges in one vectorized
+pass each; batches are resolved location by location over all points at
+once. When boundaries overlap (a sitio inside its barangay), the location
+with the smallest bounding box wins.
+
+The arrays are built on first use in each process and rebuilt once a saved
+or deleted Location has replaced the boundaries' version token
+(bfg/versions.py). The token also keys the outlines and vector tiles
+cached from these boundaries (geometry.py, vector_tiles.py).
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bfg.versions import VersionedValue
+from fares.road_multipliers import route_endpoints
+
+from .models import Location, LocationType
+from .serializers import LocationListSerializer
+
+
+# Points x edges compared per ray-casting chunk in batch resolution
+CHUNK_CELLS = 1_000_000
+
+
+def polygons(boundary) -> List[List[np.ndarray]]:
+    """
+    Polygons in a GeoJSON value, each a list of rings (exterior first) as
+    (N, 2) arrays of (latitude, longitude)
+
+    Accepts a FeatureCollection, Feature, GeometryCollection, Polygon or
+    MultiPolygon, or bare Polygon/MultiPolygon coordinates. Anything else,
+    including malformed coordinates, yields no polygons.
+    """
+    if isinstance(boundary, dict):
+        kind = boundary.get('type')
+        if kind == 'FeatureCollection':
+            return [p for feature in boundary.get('features') or [] for p in polygons(feature)]
+        if kind == 'Feature':
+            return polygons(boundary.get('geometry'))
+        if kind == 'GeometryCollection':
+            return [p for geometry in boundary.get('geometries') or [] for p in polygons(geometry)]
+        if kind == 'Polygon':
+            return _polygons(boundary.get('coordinates'), depth=3)
+        if kind == 'MultiPolygon':
+            return _polygons(boundary.get('coordinates'), depth=4)
+        return []
+    if isinstance(boundary, list):
+        return _polygons(boundary)
+    return []
+
+
+def _depth(value) -> int:
+    depth = 0
+    while isinstance(value, list) and value:
+        value, depth = value[0], depth + 1
+    return depth
+
+
+def _polygons(coordinates, depth: Optional[int] = None) -> List[List[np.ndarray]]:
+    depth = _depth(coordinates) if depth is None else depth
+    if depth != _depth(coordinates) or depth not in (2, 3, 4):
+        return []
+    if depth == 2:
+        # A single ring without the Polygon nesting
+        coordinates = [[coordinates]]
+    elif depth == 3:
+        coordinates = [coordinates]
+    try:
+        result = []
+        for polygon in coordinates:
+            # GeoJSON positions are [longitude, latitude]
+            rings = [np.asarray(ring, dtype=np.float64)[:, 1::-1] for ring in polygon]
+            rings = [ring for ring in rings if len(ring) >= 3]
+            if rings:
+                result.append(rings)
+        return result
+    except (TypeError, ValueError, IndexError):
+        return []
+
+
+def _edges(rings: Sequence[np.ndarray]) -> np.ndarray:
+    """(E, 4) lat1, lng1, lat2, lng2 edges of rings, closing each ring"""
+    return np.concatenate([
+        np.hstack([ring, np.roll(ring, -1, axis=0)]) for ring in rings
+    ])
+
+
+def _crossings(edges: np.ndarray, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Edges crossed by an eastward ray from each point (even-odd rule)"""
+    lat1, lng1, lat2, lng2 = (edges[:, i, None] for i in range(4))
+    straddles = (lat1 > lats) != (lat2 > lats)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing_lng = lng1 + (lats - lat1) * (lng2 - lng1) / (lat2 - lat1)
+    return np.count_nonzero(straddles & (lngs < crossing_lng), axis=0)
+
+
+class _Boundaries:
+    """Edge arrays and bounding boxes of every location with a boundary"""
+
+    def __init__(self, records: List[Dict], rings: List[List[np.ndarray]]):
+        boxes = []
+        for location_rings in rings:
+            points = np.concatenate(location_rings)
+            boxes.append((*points.min(axis=0).tolist(), *points.max(axis=0).tolist()))
+        # Smallest box first, so overlaps resolve to the most specific area
+        order = sorted(
+            range(len(records)),
+            key=lambda i: ((boxes[i][2] - boxes[i][0]) * (boxes[i][3] - boxes[i][1]), records[i]['id'])
+        )
+        self.records = [records[i] for i in order]
+        boxes = np.array([boxes[i] for i in order], dtype=np.float64).reshape(-1, 4)
+        self.min_lat, self.min_lng, self.max_lat, self.max_lng = boxes.T
+
+        edges = [_edges(rings[i]) for i in order]
+        self.offsets = np.cumsum([0] + [len(location_edges) for location_edges in edges])
+        self.edges = np.concatenate(edges) if edges else np.empty((0, 4))
+
+    def location_edges(self, i: int) -> np.ndarray:
+        return self.edges[self.offsets[i]:self.offsets[i + 1]]
+
+
+class BoundaryResolver:
+    """Maps points to the Location whose boundary polygon contains them"""
+
+    VERSION_KEY = 'location-boundaries:version'
+
+    def __init__(self):
+        self._boundaries = VersionedValue(self.VERSION_KEY, self.build)
+
+    def boundaries(self) -> _Boundaries:
+        return self._boundaries.get()
+
+    @staticmethod
+    def build() -> _Boundaries:
+        """Parse the boundaries of active locations"""
+        locations = Location.objects.filter(is_active=True, boundary_data__isnull=False).order_by('id')
+        records, rings = [], []
+        for location in locations:
+            location_rings = [ring for polygon in polygons(location.boundary_data) for ring in polygon]
+            if location_rings:
+                records.append(dict(LocationListSerializer(location).data))
+                rings.append(location_rings)
+        return _Boundaries(records, rings)
+
+    def invalidate(self) -> None:
+        """Drop this process' boundaries and tell other processes to rebuild"""
+        self._boundaries.invalidate()
+
+    def resolve(self, point: Tuple[float, float]) -> Optional[Dict]:
+        """Location whose boundary contains point (latitude, longitude), or None"""
+        boundaries = self.boundaries()
+        lat, lng = float(point[0]), float(point[1])
+        candidates = np.flatnonzero(
+            (boundaries.min_lat <= lat) & (lat <= boundaries.max_lat)
+            & (boundaries.min_lng <= lng) & (lng <= boundaries.max_lng)
+        )
+        point_lat, point_lng = np.array([lat]), np.array([lng])
+        for i in candidates.tolist():
+            if _crossings(boundaries.location_edges(i), point_lat, point_lng)[0] % 2:
+                return boundaries.records[i]
+        return None
+
+    def resolve_many(self, points) -> List[Optional[Dict]]:
+        """resolve() for an (N, 2) array-like of (latitude, longitude)"""
+        boundaries = self.boundaries()
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        lats, lngs = points[:, 0], points[:, 1]
+        owner = np.full(len(points), -1)
+        for i in range(len(boundaries.records)):
+            candidates = np.flatnonzero(
+                (owner < 0)
+                & (boundaries.min_lat[i] <= lats) & (lats <= boundaries.max_lat[i])
+                & (boundaries.min_lng[i] <= lngs) & (lngs <= boundaries.max_lng[i])
+            )
+            if not len(candidates):
+                continue
+            edges = boundaries.location_edges(i)
+            step = max(1, CHUNK_CELLS // len(edges))
+            for start in range(0, len(candidates), step):
+                chunk = candidates[start:start + step]
+                inside = _crossings(edges, lats[chunk], lngs[chunk]) % 2 == 1
+                owner[chunk[inside]] = i
+        return [boundaries.records[i] if i >= 0 else None for i in owner.tolist()]
+
+
+def barangay_name(location: Optional[Dict]) -> str:
+    """Barangay a resolved location belongs to ('' for None)"""
+    if not location:
+        return ''
+    if location['type'] in (LocationType.BARANGAY, LocationType.POBLACION):
+        return location['name']
+    return location['barangay'] or location['name']
+
+
+def fare_barangays(route_data) -> Tuple[str, str]:
+    """Origin and destination barangay of a stored quote ('' where unknown)"""
+    endpoints = route_endpoints(route_data)
+    if endpoints is None:
+        return '', ''
+    origin, destination = endpoints
+    return (
+        barangay_name(boundary_resolver.resolve(origin)),
+        barangay_name(boundary_resolver.resolve(destination))
+    )
+
+
+boundary_resolver = BoundaryResolver()
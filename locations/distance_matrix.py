@@ -0,0 +1,150 @@
+"""
+All-pairs road distance/fare matrix for active locations
+
+Cells are computed through the Google Distance Matrix API in batches that
+respect the per-request limits. Rebuilds are incremental: only locations
+with missing cells (newly added, or moved - see signals.py) have their row
+and column recomputed.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from fares.fare_calculator import FareCalculator, GoogleMapsService
+from .models import Location, LocationDistance
+
+
+def matrix_locations() -> List[Location]:
+    """Active locations that have coordinates"""
+    return list(
+        Location.objects.filter(
+            is_active=True,
+            latitude__isnull=False,
+            longitude__isnull=False
+        ).order_by('id')
+    )
+
+
+def stale_location_ids(locations: List[Location]) -> Set[int]:
+    """
+    Ids of locations whose row and column need recomputing
+
+    Picks the smallest covering set greedily, so a single new or moved
+    location yields just that location rather than every location that
+    is missing a cell towards it.
+    """
+    ids = {location.id for location in locations}
+    existing = defaultdict(set)
+    for origin_id, destination_id in LocationDistance.objects.filter(
+        origin_id__in=ids, destination_id__in=ids
+    ).values_list('origin_id', 'destination_id'):
+        existing[origin_id].add(destination_id)
+
+    missing = {
+        (origin_id, destination_id)
+        for origin_id in ids
+        for destination_id in ids - {origin_id} - existing[origin_id]
+    }
+
+    stale = set()
+    while missing:
+        incidence = defaultdict(int)
+        for origin_id, destination_id in missing:
+            incidence[origin_id] += 1
+            incidence[destination_id] += 1
+        worst = max(incidence, key=lambda location_id: (incidence[location_id], -location_id))
+        stale.add(worst)
+        missing = {pair for pair in missing if worst not in pair}
+    return stale
+
+
+def chunk_block(
+    origins: List[Location],
+    destinations: List[Location]
+) -> Iterable[Tuple[List[Location], List[Location]]]:
+    """Split an origins x destinations block into API-sized requests"""
+    max_dim = GoogleMapsService.MAX_MATRIX_DIMENSION
+    max_elements = GoogleMapsService.MAX_MATRIX_ELEMENTS
+
+    origin_step = min(max_dim, max(1, len(origins)))
+    destination_step = min(max_dim, max(1, max_elements // origin_step))
+    for i in range(0, len(origins), origin_step):
+        for j in range(0, len(destinations), destination_step):
+            yield origins[i:i + origin_step], destinations[j:j + destination_step]
+
+
+def build_matrix(
+    full: bool = False,
+    location_ids: Optional[Iterable[int]] = None,
+    service: Optional[GoogleMapsService] = None
+) -> Dict:
+    """
+    Compute missing (or all) matrix cells and store them
+
+    Args:
+        full: Recompute every cell instead of only stale rows/columns
+        location_ids: Recompute the row and column of these locations
+        service: GoogleMapsService to use (created if not given)
+
+    Returns:
+        Dict with counts of requests made and cells written/unreachable
+    """
+    locations = matrix_locations()
+    if full:
+        dirty_ids = {location.id for location in locations}
+    elif location_ids is not None:
+        dirty_ids = set(location_ids)
+    else:
+        dirty_ids = stale_location_ids(locations)
+
+    dirty = [location for location in locations if location.id in dirty_ids]
+    clean = [location for location in locations if location.id not in dirty_ids]
+    stats = {'locations': len(dirty), 'requests': 0, 'cells': 0, 'unreachable': 0}
+    if not dirty:
+        return stats
+
+    service = service or GoogleMapsService()
+
+    # Rows of the dirty locations, then their columns from every other origin
+    for origins, destinations in list(chunk_block(dirty, locations)) + list(chunk_block(clean, dirty)):
+        grid = service.get_distance_matrix(
+            [location_point(location) for location in origins],
+            [location_point(location) for location in destinations]
+        )
+        stats['requests'] += 1
+        if grid is None:
+            raise RuntimeError("Distance Matrix request failed; matrix left partially built")
+
+        for origin, row in zip(origins, grid):
+            for destination, element in zip(destinations, row):
+                if origin.id == destination.id:
+                    continue
+                if element is None:
+                    stats['unreachable'] += 1
+                    continue
+                store_cell(origin, destination, element['meters'], element['seconds'])
+                stats['cells'] += 1
+
+    return stats
+
+
+def store_cell(
+    origin: Location,
+    destination: Location,
+    distance_meters: int,
+    duration_seconds: Optional[int]
+) -> LocationDistance:
+    fare = FareCalculator.calculate_fare(distance_meters / 1000.0)['fare']
+    cell, _ = LocationDistance.objects.update_or_create(
+        origin=origin,
+        destination=destination,
+        defaults={
+            'distance_meters': distance_meters,
+            'duration_seconds': duration_seconds,
+            'fare': fare,
+        }
+    )
+    return cell
+
+
+def location_point(location: Location) -> Tuple[float, float]:
+    return (float(location.latitude), float(location.longitude))
@@ -0,0 +1,131 @@
+"""
+Simplified boundary geometry for map clients
+
+Boundary polygons are simplified with Douglas-Peucker at about one screen
+pixel for the requested zoom level and encoded as Google polylines. A map
+screen then gets every barangay outline in one small response instead of
+the full boundary_data of each location. Encoded responses are cached per
+zoom level, keyed on the boundaries' shared version token (boundaries.py),
+so an edit to a Location's boundary is served by every worker at once.
+"""
+import hashlib
+import json
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.core.cache import cache
+from googlemaps.convert import encode_polyline
+
+from bfg.versions import shared_version
+from fares.route_cache import METERS_PER_DEGREE
+
+from .boundaries import BoundaryResolver, polygons
+from .models import Location
+
+
+# Ground metres per pixel at zoom 0 on the equator (256 px Web Mercator tiles)
+EQUATOR_METERS_PER_PIXEL = 156543.03392
+
+CACHE_PREFIX = 'location-geometry:v1'
+CACHE_TIMEOUT = 24 * 3600
+
+
+def tolerance_for_zoom(zoom: int, latitude: float = 0.0) -> float:
+    """Ground metres covered by one pixel at zoom level and latitude"""
+    return EQUATOR_METERS_PER_PIXEL * math.cos(math.radians(latitude)) / 2 ** zoom
+
+
+def simplify(points: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """
+    Douglas-Peucker simplification of an (N, 2) latitude/longitude line
+
+    Points are projected onto a local plane in metres, so the tolerance is
+    the same in every direction. The first and last points are always kept,
+    which keeps closed rings closed.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) <= 2:
+        return points
+    latitude = float(np.mean(points[:, 0]))
+    xy = points * np.array([1.0, math.cos(math.radians(latitude))]) * METERS_PER_DEGREE
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        inner = xy[start + 1:end]
+        chord = xy[end] - xy[start]
+        length = math.hypot(*chord)
+        offsets = inner - xy[start]
+        if length:
+            distances = np.abs(chord[0] * offsets[:, 1] - chord[1] * offsets[:, 0]) / length
+        else:
+            # Closed ring: measure from the shared first/last point
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return points[keep]
+
+
+def simplify_polygon(rings: List[np.ndarray], tolerance_m: float) -> List[np.ndarray]:
+    """Simplified rings of a polygon; rings that collapse below a triangle are dropped"""
+    result = []
+    for ring in rings:
+        if not np.array_equal(ring[0], ring[-1]):
+            ring = np.vstack([ring, ring[:1]])
+        ring = simplify(ring, tolerance_m)
+        if len(ring) >= 4:
+            result.append(ring)
+        elif not result:
+            # Without its exterior ring the polygon is gone
+            return []
+    return result
+
+
+def build_geometry(zoom: int) -> dict:
+    """Simplified, polyline-encoded outlines of active locations with boundaries"""
+    locations = Location.objects.filter(is_active=True, boundary_data__isnull=False).order_by('id')
+    features = []
+    max_tolerance = 0.0
+    for location in locations.only('id', 'name', 'type', 'barangay', 'boundary_data'):
+        encoded = []
+        for rings in polygons(location.boundary_data):
+            tolerance = tolerance_for_zoom(zoom, float(rings[0][0, 0]))
+            max_tolerance = max(max_tolerance, tolerance)
+            simplified = simplify_polygon(rings, tolerance)
+            if simplified:
+                encoded.append([encode_polyline(ring.tolist()) for ring in simplified])
+        if encoded:
+            features.append({
+                'id': location.id,
+                'name': location.name,
+                'type': location.type,
+                'barangay': location.barangay,
+                'polygons': encoded,
+            })
+    return {
+        'zoom': zoom,
+        'tolerance_m': round(max_tolerance, 2),
+        'encoding': 'polyline',
+        'count': len(features),
+        'locations': features,
+    }
+
+
+def geometry_response(zoom: int) -> Tuple[str, bytes]:
+    """(ETag, JSON body) of build_geometry(zoom), built once per boundary version"""
+    key = f"{CACHE_PREFIX}:{shared_version(BoundaryResolver.VERSION_KEY)}:{zoom}"
+    cached: Optional[Tuple[str, bytes]] = cache.get(key)
+    if cached is None:
+        body = json.dumps(build_geometry(zoom), separators=(',', ':')).encode()
+        cached = (f'"{hashlib.sha1(body).hexdigest()}"', body)
+        cache.set(key, cached, timeout=CACHE_TIMEOUT)
+    return cached
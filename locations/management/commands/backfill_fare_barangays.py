@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fares.road_multipliers import route_endpoints
+from locations.boundaries import barangay_name, boundary_resolver
+from users.models import FareCalculation
+
+
+class Command(BaseCommand):
+    help = "Tag fare history with the barangays of each route's origin and destination"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Re-resolve rows that are already tagged (e.g. after boundaries changed)'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows resolved per batch')
+
+    def handle(self, *args, **options):
+        if not boundary_resolver.boundaries().records:
+            raise CommandError("No active location has boundary_data to resolve against")
+
+        rows = FareCalculation.objects.filter(route_data__isnull=False)
+        if not options['all']:
+            rows = rows.filter(origin_barangay='', destination_barangay='')
+        rows = rows.only('id', 'route_data', 'origin_barangay', 'destination_barangay').order_by('id')
+
+        started = time.perf_counter()
+        stats = {'rows': 0, 'located': 0, 'tagged': 0}
+        batch = []
+        for calculation in rows.iterator(chunk_size=options['batch_size']):
+            batch.append(calculation)
+            if len(batch) >= options['batch_size']:
+                self.tag(batch, stats)
+                batch = []
+        if batch:
+            self.tag(batch, stats)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {stats['rows']} fare calculation(s) in {time.perf_counter() - started:.1f} s: "
+            f"{stats['located']} with route endpoints, {stats['tagged']} tagged"
+        ))
+
+    @staticmethod
+    def tag(batch, stats):
+        located, points = [], []
+        for calculation in batch:
+            endpoints = route_endpoints(calculation.route_data)
+            if endpoints is not None:
+                located.append(calculation)
+                points.extend(endpoints)
+
+        stats['rows'] += len(batch)
+        stats['located'] += len(located)
+        if not located:
+            return
+
+        names = [barangay_name(location) for location in boundary_resolver.resolve_many(points)]
+        changed = []
+        for calculation, origin, destination in zip(located, names[0::2], names[1::2]):
+            if (origin, destination) != (calculation.origin_barangay, calculation.destination_barangay):
+                calculation.origin_barangay, calculation.destination_barangay = origin, destination
+                changed.append(calculation)
+        FareCalculation.objects.bulk_update(changed, ['origin_barangay', 'destination_barangay'])
+        stats['tagged'] += sum(
+            1 for calculation in changed
+            if calculation.origin_barangay or calculation.destination_barangay
+        )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from locations.distance_matrix import build_matrix
+
+
+class Command(BaseCommand):
+    help = "Precompute road distance, duration and fare between all active locations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every cell instead of only new or moved locations'
+        )
+        parser.add_argument(
+            '--location',
+            type=int,
+            action='append',
+            dest='location_ids',
+            help='Recompute the row and column of this location id (repeatable)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            stats = build_matrix(
+                full=options['full'],
+                location_ids=options['location_ids']
+            )
+        except (RuntimeError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if not stats['locations']:
+            self.stdout.write("Distance matrix is up to date.")
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed {stats['locations']} location(s): {stats['cells']} cells "
+            f"in {stats['requests']} request(s), {stats['unreachable']} unreachable"
+        ))
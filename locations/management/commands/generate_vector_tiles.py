@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from locations.vector_tiles import MAX_ZOOM, generate
+
+
+class Command(BaseCommand):
+    help = "Pre-generate vector tiles of location boundaries and points into an MBTiles file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-zoom', type=int, default=10)
+        parser.add_argument('--max-zoom', type=int, default=16)
+        parser.add_argument(
+            '--output', default=None,
+            help='MBTiles file to write (default: VECTOR_TILES_PATH)'
+        )
+
+    def handle(self, *args, **options):
+        min_zoom, max_zoom = options['min_zoom'], options['max_zoom']
+        if not 0 <= min_zoom <= max_zoom <= MAX_ZOOM:
+            raise CommandError(f"Zoom range must be within 0-{MAX_ZOOM} with --min-zoom <= --max-zoom")
+        path = options['output'] or settings.VECTOR_TILES_PATH
+
+        try:
+            stats = generate(path, min_zoom, max_zoom)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {stats['tiles']:,} tiles for zoom {min_zoom}-{max_zoom} "
+            f"({stats['bytes'] / 1024:,.0f} KiB gzipped) in {stats['seconds']:.1f} s -> {path}"
+        ))
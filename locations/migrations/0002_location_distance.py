@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("locations", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LocationDistance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("distance_meters", models.IntegerField()),
+                ("duration_seconds", models.IntegerField(blank=True, null=True)),
+                (
+                    "fare",
+                    models.DecimalField(
+                        decimal_places=2,
+                        help_text="Regular (undiscounted) fare for this distance",
+                        max_digits=8,
+                    ),
+                ),
+                ("computed_at", models.DateTimeField(auto_now=True)),
+                (
+                    "destination",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="distances_to",
+                        to="locations.location",
+                    ),
+                ),
+                (
+                    "origin",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="distances_from",
+                        to="locations.location",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["origin", "destination"],
+                "unique_together": {("origin", "destination")},
+            },
+        ),
+    ]
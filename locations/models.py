@@ -48,3 +48,32 @@ class Location(models.Model):
                 'lng': float(self.longitude)
             }
         return None
+
+
+class LocationDistance(models.Model):
+    """Precomputed road distance, duration and regular fare between two locations"""
+    origin = models.ForeignKey(
+        Location,
+        on_delete=models.CASCADE,
+        related_name='distances_from'
+    )
+    destination = models.ForeignKey(
+        Location,
+        on_delete=models.CASCADE,
+        related_name='distances_to'
+    )
+    distance_meters = models.IntegerField()
+    duration_seconds = models.IntegerField(null=True, blank=True)
+    fare = models.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        help_text="Regular (undiscounted) fare for this distance"
+    )
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['origin', 'destination']
+        unique_together = ['origin', 'destination']
+
+    def __str__(self):
+        return f"{self.origin} to {self.destination} - {self.distance_meters} m"
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Location
+from .models import Location, LocationType
 
 
 class LocationSerializer(serializers.ModelSerializer):
@@ -23,3 +23,40 @@ class LocationListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Location
         fields = ['id', 'name', 'type', 'barangay', 'latitude', 'longitude', 'coordinates', 'is_active']
+
+
+class PointQuerySerializer(serializers.Serializer):
+    """Latitude/longitude query parameters"""
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+
+
+class NearestLocationQuerySerializer(PointQuerySerializer):
+    """Query parameters of the nearest-location lookup"""
+    k = serializers.IntegerField(min_value=1, max_value=50, default=1)
+    max_distance_km = serializers.FloatField(min_value=0, required=False)
+    type = serializers.MultipleChoiceField(choices=LocationType.choices, required=False)
+
+
+class BatchResolveSerializer(serializers.Serializer):
+    """Points to resolve to barangays in one request"""
+    MAX_POINTS = 10000
+
+    points = serializers.ListField(
+        child=serializers.ListField(child=serializers.FloatField(), min_length=2, max_length=2),
+        min_length=1,
+        max_length=MAX_POINTS,
+        help_text="Coordinates [[latitude, longitude], ...]"
+    )
+
+
+class GeometryQuerySerializer(serializers.Serializer):
+    """Query parameters of the simplified geometry endpoint"""
+    zoom = serializers.IntegerField(min_value=8, max_value=18, default=14)
+
+
+class AutocompleteQuerySerializer(serializers.Serializer):
+    """Query parameters of the location autocomplete"""
+    q = serializers.CharField(max_length=100, trim_whitespace=True)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+    type = serializers.MultipleChoiceField(choices=LocationType.choices, required=False)
@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from bfg.conditional import invalidate_stamp
+
+from .autocomplete import location_autocomplete
+from .boundaries import boundary_resolver
+from .models import Location, LocationDistance
+from .spatial_index import location_index
+
+
+@receiver(pre_save, sender=Location)
+def remember_previous_position(sender, instance, **kwargs):
+    """Stash the stored coordinates/status so post_save can detect a move"""
+    instance._previous_position = None
+    if instance.pk:
+        instance._previous_position = (
+            Location.objects.filter(pk=instance.pk)
+            .values_list('latitude', 'longitude', 'is_active')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Location)
+def invalidate_distance_matrix(sender, instance, created, **kwargs):
+    """Drop the matrix row and column of a moved or deactivated location"""
+    previous = getattr(instance, '_previous_position', None)
+    if created or previous is None:
+        return
+    if previous != (instance.latitude, instance.longitude, instance.is_active):
+        LocationDistance.objects.filter(
+            Q(origin=instance) | Q(destination=instance)
+        ).delete()
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def invalidate_location_index(sender, **kwargs):
+    """Rebuild the in-memory location indexes once the change is committed"""
+    transaction.on_commit(location_index.invalidate)
+    transaction.on_commit(boundary_resolver.invalidate)
+    transaction.on_commit(location_autocomplete.invalidate)
+    transaction.on_commit(lambda: invalidate_stamp(Location))
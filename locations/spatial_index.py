@@ -0,0 +1,208 @@
+"""
+In-memory spatial index over active Locations
+
+Locations with coordinates are bucketed on a grid of LOCATION_INDEX_CELL_METERS.
+A nearest-location query measures the buckets in rings around the point and
+stops once no unvisited bucket can hold anything closer, so it touches a
+handful of locations instead of the whole table. Results carry the location
+as LocationListSerializer renders it, so answering needs no database query.
+
+The index is built on first use in each process. Saving or deleting a
+Location replaces its version token in the shared cache (bfg/versions.py),
+which each process checks at most once a second before rebuilding.
+"""
+import math
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from bfg.versions import VersionedValue
+from fares.fare_calculator import GPSDistanceCalculator
+from fares.road_multipliers import cell_of, to_cells
+from fares.route_cache import METERS_PER_DEGREE
+
+from .models import Location
+from .serializers import LocationListSerializer
+
+
+Cell = Tuple[int, int]
+
+KM_PER_DEGREE = math.radians(1) * GPSDistanceCalculator.EARTH_RADIUS_KM
+
+
+class _Snapshot:
+    """Locations, their coordinates and grid buckets as of one build"""
+
+    def __init__(self, records: List[Dict], cell_meters: int):
+        self.records = records
+        self.cell_meters = cell_meters
+        self.positions = {record['id']: i for i, record in enumerate(records)}
+        self.ids = np.array([record['id'] for record in records], dtype=np.int64)
+        self.types = np.array([record['type'] for record in records], dtype=object)
+        self.points = np.array(
+            [(float(record['latitude']), float(record['longitude'])) for record in records],
+            dtype=np.float64
+        ).reshape(-1, 2)
+
+        self.buckets: Dict[Cell, np.ndarray] = {}
+        self.max_abs_lat = 0.0
+        self.cell_range = (0, 0, 0, 0)
+        if records:
+            cells = to_cells(self.points, cell_meters)
+            order = np.lexsort((cells[:, 1], cells[:, 0]))
+            unique, starts = np.unique(cells[order], axis=0, return_index=True)
+            for cell, indices in zip(unique.tolist(), np.split(order, starts[1:])):
+                self.buckets[tuple(cell)] = indices
+            self.max_abs_lat = float(np.max(np.abs(self.points[:, 0])))
+            low, high = cells.min(axis=0), cells.max(axis=0)
+            self.cell_range = (int(low[0]), int(high[0]), int(low[1]), int(high[1]))
+
+
+def _ring(radius: int) -> Iterator[Cell]:
+    """Cell offsets at Chebyshev distance radius"""
+    if radius == 0:
+        yield 0, 0
+        return
+    for dlng in range(-radius, radius + 1):
+        yield -radius, dlng
+        yield radius, dlng
+    for dlat in range(-radius + 1, radius):
+        yield dlat, -radius
+        yield dlat, radius
+
+
+class LocationIndex:
+    """Nearest-location lookups over active Locations with coordinates"""
+
+    VERSION_KEY = 'location-index:version'
+
+    def __init__(self):
+        self._snapshot = VersionedValue(
+            self.VERSION_KEY,
+            lambda: _Snapshot(self.build(), settings.LOCATION_INDEX_CELL_METERS),
+            local=lambda: settings.LOCATION_INDEX_CELL_METERS
+        )
+
+    def snapshot(self) -> _Snapshot:
+        return self._snapshot.get()
+
+    @staticmethod
+    def build() -> List[Dict]:
+        """Serialized active locations that have coordinates"""
+        locations = Location.objects.filter(
+            is_active=True, latitude__isnull=False, longitude__isnull=False
+        ).order_by('id')
+        return [dict(record) for record in LocationListSerializer(locations, many=True).data]
+
+    def invalidate(self) -> None:
+        """Drop this process' index and tell other processes to rebuild"""
+        self._snapshot.invalidate()
+
+    def get(self, location_id: int) -> Optional[Dict]:
+        """Indexed location by id (None if inactive or without coordinates)"""
+        snapshot = self.snapshot()
+        position = snapshot.positions.get(location_id)
+        return None if position is None else snapshot.records[position]
+
+    def nearest(
+        self,
+        point: Tuple[float, float],
+        k: int = 1,
+        max_km: Optional[float] = None,
+        types: Optional[Iterable[str]] = None
+    ) -> List[Tuple[Dict, float]]:
+        """
+        Up to k (location, straight-line km) pairs closest to point, nearest
+        first (ties by id)
+
+        Args:
+            point: (latitude, longitude)
+            k: Most locations to return
+            max_km: Leave out locations further away than this
+            types: Only consider locations of these Location.type values
+        """
+        snapshot = self.snapshot()
+        if k < 1 or not snapshot.records:
+            return []
+        lat, lng = float(point[0]), float(point[1])
+        allowed = np.isin(snapshot.types, list(types)) if types else None
+
+        # Unvisited buckets after ring r are at least r cells away in
+        # latitude or longitude; a longitude cell is narrowest at the
+        # highest latitude involved
+        cos_min = math.cos(math.radians(min(90.0, max(snapshot.max_abs_lat, abs(lat)))))
+        ring_km = snapshot.cell_meters / METERS_PER_DEGREE * KM_PER_DEGREE * cos_min * 0.999
+        lat_cell, lng_cell = cell_of((lat, lng), snapshot.cell_meters)
+        low_lat, high_lat, low_lng, high_lng = snapshot.cell_range
+        reach = max(lat_cell - low_lat, high_lat - lat_cell, lng_cell - low_lng, high_lng - lng_cell)
+
+        found = []
+        found_km = np.empty(0)
+        for radius in range(reach + 1):
+            if (2 * radius + 1) ** 2 > len(snapshot.records):
+                # Far from everything: walking empty buckets costs more
+                # than measuring every location
+                found = [np.arange(len(snapshot.records))]
+                found_km = self._distances(snapshot, (lat, lng), found[0], allowed)
+                break
+
+            indices = [
+                snapshot.buckets[cell] for cell in (
+                    (lat_cell + dlat, lng_cell + dlng) for dlat, dlng in _ring(radius)
+                ) if cell in snapshot.buckets
+            ]
+            if indices:
+                indices = np.concatenate(indices)
+                found.append(indices)
+                found_km = np.concatenate([
+                    found_km, self._distances(snapshot, (lat, lng), indices, allowed)
+                ])
+
+            bound = radius * ring_km
+            if max_km is not None and bound > max_km:
+                break
+            if (np.count_nonzero(np.isfinite(found_km)) >= k
+                    and np.partition(found_km, k - 1)[k - 1] <= bound):
+                break
+
+        if not found:
+            return []
+        indices = np.concatenate(found)
+        keep = np.isfinite(found_km)
+        if max_km is not None:
+            keep &= found_km <= max_km
+        indices, found_km = indices[keep], found_km[keep]
+        order = np.lexsort((snapshot.ids[indices], found_km))[:k]
+        return [(snapshot.records[i], float(km)) for i, km in zip(indices[order].tolist(), found_km[order])]
+
+    @staticmethod
+    def _distances(snapshot: _Snapshot, point, indices: np.ndarray, allowed) -> np.ndarray:
+        """Straight-line km to the indexed locations (inf where filtered out)"""
+        km = GPSDistanceCalculator.straight_line_distances(point, snapshot.points[indices])
+        if allowed is not None:
+            km[~allowed[indices]] = np.inf
+        return km
+
+    def match(self, point: Tuple[float, float], location_id: Optional[int] = None) -> Optional[Dict]:
+        """
+        Location a quote endpoint belongs to, with its distance_km from point
+
+        The given location id wins when it is indexed; otherwise the nearest
+        location within LOCATION_MATCH_MAX_METERS, or None.
+        """
+        if location_id:
+            record = self.get(location_id)
+            if record is not None:
+                km = GPSDistanceCalculator.straight_line_distances(
+                    point, (float(record['latitude']), float(record['longitude']))
+                )
+                return {**record, 'distance_km': round(float(km), 3)}
+        matches = self.nearest(point, 1, max_km=settings.LOCATION_MATCH_MAX_METERS / 1000)
+        if not matches:
+            return None
+        record, km = matches[0]
+        return {**record, 'distance_km': round(km, 3)}
+
+
+location_index = LocationIndex()
@@ -1,3 +1,693 @@
-from django.test import TestCase
+import gzip
+import json
+import math
+import random
+import struct
+import tempfile
+import time
+from io import StringIO
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from googlemaps.convert import decode_polyline, encode_polyline
+from rest_framework.test import APIClient
+
+from bfg.testing import LOCAL_CACHES
+from bfg.versions import VersionedValue, bump_shared_version, shared_version
+from fares.fare_calculator import GPSDistanceCalculator, calculate_route_with_fare
+from users.models import FareCalculation, User
+
+from .autocomplete import AutocompleteIndex, fold, location_autocomplete
+from .boundaries import BoundaryResolver, boundary_resolver, polygons
+from .distance_matrix import build_matrix
+from .geometry import simplify, tolerance_for_zoom
+from .models import Location, LocationDistance, LocationType
+from .spatial_index import location_index
+from .vector_tiles import TileSource, tile_bounds, vector_tiles
+
+
+class FakeMatrixService:
+    """Stands in for GoogleMapsService; distance grows with latitude gap"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_distance_matrix(self, origins, destinations):
+        self.calls.append((len(origins), len(destinations)))
+        return [
+            [
+                {'meters': round(abs(o[0] - d[0]) * 1000000) + 1000, 'seconds': 60}
+                for d in destinations
+            ]
+            for o in origins
+        ]
+
+
+class DistanceMatrixTests(TestCase):
+    def setUp(self):
+        self.locations = [
+            Location.objects.create(
+                name=f"Location {i}",
+                latitude=Decimal('11.280000') + Decimal(i) / 1000,
+                longitude=Decimal('125.060000')
+            )
+            for i in range(3)
+        ]
+
+    def test_full_build_then_incremental_after_move(self):
+        service = FakeMatrixService()
+        stats = build_matrix(service=service)
+        self.assertEqual(stats['cells'], 6)
+        self.assertEqual(LocationDistance.objects.count(), 6)
+
+        moved = self.locations[0]
+        moved.latitude = Decimal('11.290000')
+        moved.save()
+        self.assertEqual(LocationDistance.objects.count(), 2)
+
+        service = FakeMatrixService()
+        stats = build_matrix(service=service)
+        self.assertEqual(stats['locations'], 1)
+        self.assertEqual(stats['cells'], 4)
+        self.assertEqual(service.calls, [(1, 3), (2, 1)])
+        cell = LocationDistance.objects.get(origin=moved, destination=self.locations[2])
+        self.assertEqual(cell.distance_meters, 9000)
+        self.assertEqual(cell.fare, Decimal('33.00'))
+
+    def test_up_to_date_matrix_makes_no_requests(self):
+        build_matrix(service=FakeMatrixService())
+        service = FakeMatrixService()
+        self.assertEqual(build_matrix(service=service)['requests'], 0)
+        self.assertEqual(service.calls, [])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class LocationIndexTests(TestCase):
+    def setUp(self):
+        location_index.invalidate()
+        self.addCleanup(location_index.invalidate)
+        rng = random.Random(105)
+        self.locations = [
+            Location.objects.create(
+                name=f"Location {i}",
+                type=LocationType.LANDMARK if i % 4 == 0 else LocationType.BARANGAY,
+                latitude=Decimal(f"{rng.uniform(11.15, 11.50):.6f}"),
+                longitude=Decimal(f"{rng.uniform(124.95, 125.25):.6f}")
+            )
+            for i in range(200)
+        ]
+        Location.objects.create(name='Unmapped')
+        Location.objects.create(name='Closed', latitude=Decimal('11.3'), longitude=Decimal('125.1'),
+                                is_active=False)
+
+    def brute_force(self, point, k, types=None):
+        candidates = [
+            location for location in self.locations
+            if not types or location.type in types
+        ]
+        km = GPSDistanceCalculator.straight_line_distances(
+            point, [(float(location.latitude), float(location.longitude)) for location in candidates]
+        )
+        ranked = sorted(zip(km.tolist(), [location.id for location in candidates]))
+        return [location_id for _, location_id in ranked[:k]]
+
+    @override_settings(LOCATION_INDEX_CELL_METERS=500)
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        points = [(rng.uniform(11.1, 11.55), rng.uniform(124.9, 125.3)) for _ in range(50)]
+        points.append((14.6, 121.0))  # far outside the index
+        for point in points:
+            for k in (1, 5):
+                found = [location['id'] for location, _ in location_index.nearest(point, k)]
+                self.assertEqual(found, self.brute_force(point, k))
+            found = [
+                location['id'] for location, _ in
+                location_index.nearest(point, 3, types=[LocationType.LANDMARK])
+            ]
+            self.assertEqual(found, self.brute_force(point, 3, [LocationType.LANDMARK]))
+
+    def test_max_distance(self):
+        location = self.locations[0]
+        point = (float(location.latitude), float(location.longitude))
+        matches = location_index.nearest(point, 10, max_km=0.001)
+        self.assertEqual([(match['id'], km) for match, km in matches], [(location.id, 0.0)])
+
+    def test_endpoint(self):
+        location_index.nearest((11.3, 125.1))
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/v2/locations/nearest/', {'lat': 11.3, 'lng': 125.1, 'k': 3, 'type': 'LANDMARK'}
+            )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['id'] for result in results],
+                         self.brute_force((11.3, 125.1), 3, ['LANDMARK']))
+        self.assertEqual(set(results[0]), {
+            'id', 'name', 'type', 'barangay', 'latitude', 'longitude',
+            'coordinates', 'is_active', 'distance_km'
+        })
+        self.assertLessEqual(results[0]['distance_km'], results[1]['distance_km'])
+
+        response = self.client.get('/v2/locations/nearest/', {'lat': 91, 'k': 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'lat', 'lng', 'k'})
+
+    def test_rebuilt_after_save_and_delete(self):
+        point = (11.6, 125.4)
+        self.assertNotEqual(location_index.nearest(point)[0][0]['name'], 'New pier')
+        with self.captureOnCommitCallbacks(execute=True):
+            pier = Location.objects.create(name='New pier', latitude=Decimal('11.6'), longitude=Decimal('125.4'))
+        self.assertEqual(location_index.nearest(point)[0][0]['name'], 'New pier')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pier.delete()
+        self.assertIsNone(location_index.get(pier.id))
+
+    def test_quotes_are_tagged_with_locations(self):
+        origin, destination = self.locations[:2]
+        result = calculate_route_with_fare(
+            (float(origin.latitude) + 0.001, float(origin.longitude)),
+            (14.6, 121.0),
+            use_google_maps=False
+        )
+        self.assertEqual(result['origin_location']['id'], origin.id)
+        self.assertAlmostEqual(result['origin_location']['distance_km'], 0.111, places=3)
+        self.assertIsNone(result['destination_location'])
+
+        result = calculate_route_with_fare(
+            (11.3, 125.1), (14.6, 121.0), use_google_maps=False,
+            destination_location_id=destination.id
+        )
+        self.assertEqual(result['destination_location']['id'], destination.id)
+
+
+def square(lat, lng, size):
+    """Closed GeoJSON ring ([lng, lat] positions) of a square"""
+    return [[lng, lat], [lng + size, lat], [lng + size, lat + size], [lng, lat + size], [lng, lat]]
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class BoundaryResolverTests(TestCase):
+    def setUp(self):
+        boundary_resolver.invalidate()
+        self.addCleanup(boundary_resolver.invalidate)
+        # Two neighbouring barangays; Loyo has a lake (hole) and a sitio
+        self.loyo = Location.objects.create(
+            name='Loyo', type=LocationType.BARANGAY,
+            boundary_data={
+                'type': 'Polygon',
+                'coordinates': [square(11.20, 125.00, 0.10), square(11.28, 125.08, 0.01)]
+            }
+        )
+        self.guintigui = Location.objects.create(
+            name='Guintigui-an', type=LocationType.BARANGAY,
+            boundary_data={'type': 'Feature', 'geometry': {
+                'type': 'MultiPolygon',
+                'coordinates': [[square(11.20, 125.10, 0.10)], [square(11.40, 125.10, 0.05)]]
+            }}
+        )
+        self.sitio = Location.objects.create(
+            name='Sitio Ilaya', type=LocationType.SITIO, barangay='Loyo',
+            boundary_data=[square(11.22, 125.02, 0.02)]
+        )
+        Location.objects.create(name='Malformed', boundary_data={'type': 'Polygon', 'coordinates': [[1, 2]]})
+        Location.objects.create(
+            name='Closed', is_active=False, boundary_data={'type': 'Polygon', 'coordinates': [square(11.2, 125.0, 1)]}
+        )
+
+    def test_resolve(self):
+        cases = [
+            ((11.25, 125.05), 'Loyo'),
+            ((11.285, 125.085), None),           # in the hole
+            ((11.23, 125.03), 'Sitio Ilaya'),    # smaller area wins
+            ((11.25, 125.15), 'Guintigui-an'),
+            ((11.42, 125.12), 'Guintigui-an'),   # second polygon
+            ((11.35, 125.12), None),             # between the two polygons
+            ((11.25, 125.30), None),
+        ]
+        for point, name in cases:
+            location = boundary_resolver.resolve(point)
+            self.assertEqual(location and location['name'], name, point)
+
+    def test_batch_matches_single(self):
+        rng = random.Random(105)
+        points = [(rng.uniform(11.15, 11.50), rng.uniform(124.95, 125.25)) for _ in range(2000)]
+        self.assertEqual(
+            boundary_resolver.resolve_many(points),
+            [boundary_resolver.resolve(point) for point in points]
+        )
+
+    def test_geojson_forms(self):
+        ring = square(11.0, 125.0, 1)
+        self.assertEqual(len(polygons(ring)), 1)
+        self.assertEqual(len(polygons({'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [ring]}},
+            {'type': 'Feature', 'geometry': None},
+        ]})), 1)
+        self.assertEqual(polygons({'type': 'Point', 'coordinates': [125.0, 11.0]}), [])
+        self.assertEqual(polygons('not geojson'), [])
+        self.assertEqual(polygons(ring)[0][0][0].tolist(), [11.0, 125.0])
+
+    def test_endpoints(self):
+        boundary_resolver.resolve((11.25, 125.05))
+        with self.assertNumQueries(0):
+            response = self.client.get('/v2/locations/resolve/', {'lat': 11.23, 'lng': 125.03})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['location']['id'], self.sitio.id)
+        self.assertEqual(response.json()['barangay'], 'Loyo')
+
+        response = self.client.post(
+            '/v2/locations/resolve/batch/',
+            {'points': [[11.25, 125.15], [11.25, 125.30]]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['barangay'] for result in response.json()['results']], ['Guintigui-an', None]
+        )
+
+        self.assertEqual(self.client.get('/v2/locations/resolve/', {'lat': 11.2}).status_code, 400)
+        response = self.client.post(
+            '/v2/locations/resolve/batch/', {'points': [[11.2]]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_rebuilt_after_save(self):
+        self.assertIsNone(boundary_resolver.resolve((11.25, 125.30)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.guintigui.boundary_data = {'type': 'Polygon', 'coordinates': [square(11.20, 125.10, 0.30)]}
+            self.guintigui.save()
+        self.assertEqual(boundary_resolver.resolve((11.25, 125.30))['name'], 'Guintigui-an')
+
+    def test_fare_history_is_tagged(self):
+        route_data = {'route': {'polyline': encode_polyline([(11.23, 125.03), (11.42, 125.12)])}}
+        user = User.objects.create_user(username='commuter', password='x')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/v2/fare-calculations/', {
+            'from_location': 'Sitio Ilaya', 'to_location': 'Guintigui-an', 'distance': '25.00',
+            'calculated_fare': '60.00', 'calculation_type': 'Google Maps Route Planner',
+            'route_data': route_data
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            (response.json()['origin_barangay'], response.json()['destination_barangay']),
+            ('Loyo', 'Guintigui-an')
+        )
+
+        untagged = FareCalculation.objects.create(
+            from_location='A', to_location='B', distance=Decimal('5.00'),
+            calculated_fare=Decimal('20.00'), calculation_type='GPS',
+            route_data={'origin': [11.25, 125.05], 'destination': [11.25, 125.30]}
+        )
+        FareCalculation.objects.create(
+            from_location='A', to_location='B', distance=Decimal('5.00'),
+            calculated_fare=Decimal('20.00'), calculation_type='GPS', route_data={'method': 'gps'}
+        )
+        call_command('backfill_fare_barangays', stdout=StringIO())
+        untagged.refresh_from_db()
+        self.assertEqual((untagged.origin_barangay, untagged.destination_barangay), ('Loyo', ''))
+
+
+def wobbly_ring(lat, lng, radius, count=2000):
+    """Closed GeoJSON ring of a noisy circle with many vertices"""
+    rng = random.Random(count)
+    ring = [
+        [lng + radius * (1 + 0.002 * rng.random()) * math.cos(2 * math.pi * i / count),
+         lat + radius * (1 + 0.002 * rng.random()) * math.sin(2 * math.pi * i / count)]
+        for i in range(count)
+    ]
+    return ring + ring[:1]
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class GeometryTests(TestCase):
+    def setUp(self):
+        boundary_resolver.invalidate()
+        self.addCleanup(boundary_resolver.invalidate)
+        self.location = Location.objects.create(
+            name='Loyo', type=LocationType.BARANGAY,
+            boundary_data={'type': 'Polygon', 'coordinates': [
+                wobbly_ring(11.25, 125.05, 0.03), wobbly_ring(11.25, 125.05, 0.005, 300)
+            ]}
+        )
+        Location.objects.create(name='Tiny', boundary_data=[square(11.4, 125.2, 0.00001)])
+
+    def test_simplify_stays_within_tolerance(self):
+        ring = np.array(wobbly_ring(11.25, 125.05, 0.03))[:, ::-1]
+        tolerance = tolerance_for_zoom(12, 11.25)
+        simplified = simplify(ring, tolerance)
+        self.assertLess(len(simplified), len(ring) / 10)
+        self.assertEqual(simplified[0].tolist(), simplified[-1].tolist())
+
+        # Every original vertex lies within the tolerance of the simplified ring
+        scale = np.array([1.0, math.cos(math.radians(11.25))]) * 111320.0
+        points, line = ring * scale, simplified * scale
+        starts, ends = line[:-1], line[1:]
+        segment = ends - starts
+        t = np.clip(np.einsum('psk,sk->ps', points[:, None] - starts, segment)
+                    / np.einsum('sk,sk->s', segment, segment), 0, 1)
+        nearest = starts + t[..., None] * segment
+        deviation = np.linalg.norm(points[:, None] - nearest, axis=-1).min(axis=1)
+        self.assertLessEqual(deviation.max(), tolerance * 1.0001)
+
+    def test_boundary_edit_in_another_worker_is_served(self):
+        before = self.client.get('/v2/locations/geometry/', {'zoom': 12})
+        # Another worker saved the location: the row and the shared token
+        # change, no signal fires here
+        Location.objects.filter(pk=self.location.pk).update(name='Loyo Proper')
+        bump_shared_version(BoundaryResolver.VERSION_KEY)
+        after = self.client.get('/v2/locations/geometry/', {'zoom': 12})
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        self.assertEqual(after.json()['locations'][0]['name'], 'Loyo Proper')
+
+    def test_endpoint(self):
+        response = self.client.get('/v2/locations/geometry/', {'zoom': 12})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age=300', response['Cache-Control'])
+        data = response.json()
+        self.assertEqual([location['name'] for location in data['locations']], ['Loyo'])
+        exterior, hole = data['locations'][0]['polygons'][0]
+        exterior = decode_polyline(exterior)
+        self.assertEqual(exterior[0], exterior[-1])
+        self.assertLess(len(exterior), 200)
+        self.assertLess(len(response.content), len(json.dumps(self.location.boundary_data)) / 10)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(
+                '/v2/locations/geometry/', {'zoom': 12}, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+        detailed = self.client.get('/v2/locations/geometry/', {'zoom': 17})
+        self.assertGreater(len(detailed.content), len(response.content))
+        self.assertEqual(self.client.get('/v2/locations/geometry/', {'zoom': 30}).status_code, 400)
+
+    def test_boundary_edit_changes_etag(self):
+        etag = self.client.get('/v2/locations/geometry/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.boundary_data = [square(11.2, 125.0, 0.1)]
+            self.location.save()
+        response = self.client.get('/v2/locations/geometry/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+def read_fields(data):
+    """(field number, value) pairs of a protobuf message"""
+    fields, position = [], 0
+
+    def varint():
+        nonlocal position
+        value = shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                return value
+
+    while position < len(data):
+        key = varint()
+        wire_type = key & 7
+        if wire_type == 0:
+            value = varint()
+        elif wire_type == 1:
+            value = struct.unpack('<d', data[position:position + 8])[0]
+            position += 8
+        else:
+            length = varint()
+            value = data[position:position + length]
+            position += length
+        fields.append((key >> 3, value))
+    return fields
+
+
+def read_packed(data):
+    values, position = [], 0
+    while position < len(data):
+        value = shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        values.append(value)
+    return values
+
+
+def decode_tile(data):
+    """{layer name: [feature dicts]} of an encoded vector tile"""
+    layers = {}
+    for number, layer in read_fields(data):
+        assert number == 3
+        fields = read_fields(layer)
+        keys = [value.decode() for number, value in fields if number == 3]
+        values = []
+        for number, value in fields:
+            if number == 4:
+                (kind, raw), = read_fields(value)
+                values.append(raw.decode() if kind == 1 else raw)
+        features = []
+        for number, value in fields:
+            if number != 2:
+                continue
+            feature = dict(read_fields(value))
+            tags = read_packed(feature.get(2, b''))
+            features.append({
+                'id': feature[1],
+                'type': feature[3],
+                'properties': {keys[k]: values[v] for k, v in zip(tags[0::2], tags[1::2])},
+                'rings': decode_geometry(read_packed(feature[4])),
+            })
+        name = next(value.decode() for number, value in fields if number == 1)
+        assert dict(fields)[15] == 2 and dict(fields)[5] == 4096
+        layers[name] = features
+    return layers
+
+
+def decode_geometry(commands):
+    """Absolute tile coordinates of each MoveTo...ClosePath sequence"""
+    rings, x, y, position = [], 0, 0, 0
+    while position < len(commands):
+        command, count = commands[position] & 7, commands[position] >> 3
+        position += 1
+        if command == 7:
+            continue
+        for _ in range(count):
+            dx, dy = commands[position], commands[position + 1]
+            x += (dx >> 1) ^ -(dx & 1)
+            y += (dy >> 1) ^ -(dy & 1)
+            position += 2
+            if command == 1:
+                rings.append([])
+            rings[-1].append((x, y))
+    return rings
+
+
+def ring_area(ring):
+    return sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]))
+
+
+class VectorTileTests(TestCase):
+    # Tile 14/13882/7677 covers roughly 11.23-11.25 N, 125.02-125.05 E
+    TILE = (14, 13882, 7677)
+
+    def setUp(self):
+        boundary_resolver.invalidate()
+        self.addCleanup(boundary_resolver.invalidate)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f"{directory.name}/locations.mbtiles"
+        override = override_settings(VECTOR_TILES_PATH=self.path)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.loyo = Location.objects.create(
+            name='Loyo', type=LocationType.BARANGAY,
+            latitude=Decimal('11.240000'), longitude=Decimal('125.030000'),
+            boundary_data={
+                'type': 'Polygon',
+                'coordinates': [square(11.20, 125.00, 0.10), square(11.235, 125.025, 0.01)]
+            }
+        )
+        Location.objects.create(
+            name='Pier', type=LocationType.LANDMARK, barangay='Loyo',
+            latitude=Decimal('11.400000'), longitude=Decimal('125.200000')
+        )
+
+    def test_tile_contents(self):
+        west, south, east, north = tile_bounds(*self.TILE)
+        self.assertTrue(south < 11.24 < north and west < 125.03 < east)
+
+        layers = decode_tile(gzip.decompress(vector_tiles.get(*self.TILE)))
+        self.assertEqual(
+            [(feature['properties']['name'], feature['properties']['type']) for feature in layers['locations']],
+            [('Loyo', 'BARANGAY')]
+        )
+        (point,), = layers['locations'][0]['rings']
+        expected_x = ((125.03 + 180) / 360 * 2 ** 14 - self.TILE[1]) * 4096
+        self.assertAlmostEqual(point[0], expected_x, delta=1)
+
+        boundary, = layers['boundaries']
+        self.assertEqual(boundary['id'], self.loyo.id)
+        self.assertEqual(boundary['type'], 3)
+        exterior, hole = boundary['rings']
+        self.assertGreater(ring_area(exterior), 0)
+        self.assertLess(ring_area(hole), 0)
+        # The barangay covers the whole tile, so the exterior is clipped to the buffer
+        self.assertEqual({x for x, _ in exterior}, {-64, 4160})
+
+        self.assertIsNone(vector_tiles.get(14, 0, 0))
+
+    def test_on_demand_tiles_follow_boundary_edits_in_other_workers(self):
+        def names():
+            layers = decode_tile(gzip.decompress(vector_tiles.get(*self.TILE)))
+            return [feature['properties']['name'] for feature in layers['locations']]
+
+        self.assertEqual(names(), ['Loyo'])
+        Location.objects.filter(pk=self.loyo.pk).update(name='Loyo Proper')
+        bump_shared_version(BoundaryResolver.VERSION_KEY)
+        self.assertEqual(names(), ['Loyo Proper'])
+
+    @override_settings(VECTOR_TILES_ON_DEMAND_MAX_ZOOM=15)
+    def test_tiles_away_from_the_locations_are_not_built(self):
+        vector_tiles.source()
+        with mock.patch('locations.vector_tiles.cache') as cache, \
+                mock.patch.object(TileSource, 'tile') as tile:
+            self.assertIsNone(vector_tiles.get(14, 0, 0))
+            self.assertIsNone(vector_tiles.get(10, 1000, 1000))
+            # Over the Loyo boundary, but deeper than on-demand tiles go
+            self.assertIsNone(vector_tiles.get(16, 55528, 30708))
+        tile.assert_not_called()
+        cache.get.assert_not_called()
+        cache.set.assert_not_called()
+
+        self.assertIsNotNone(vector_tiles.get(15, 27764, 15354))
+
+    def test_tokens_outlive_the_default_cache(self):
+        version = shared_version(BoundaryResolver.VERSION_KEY)
+        caches['default'].clear()
+        self.assertEqual(shared_version(BoundaryResolver.VERSION_KEY), version)
+        self.assertEqual(caches['shared'].get(BoundaryResolver.VERSION_KEY), version)
+
+    def test_generated_store_is_served(self):
+        out = StringIO()
+        call_command('generate_vector_tiles', '--min-zoom', '12', '--max-zoom', '14', stdout=out)
+        self.assertIn('tiles for zoom 12-14', out.getvalue())
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/v2/tiles/14/13882/7677.mvt', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('max-age=604800', response['Cache-Control'])
+        self.assertIn('boundaries', decode_tile(gzip.decompress(response.content)))
+
+        plain = self.client.get('/v2/tiles/14/13882/7677.mvt')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+        cached = self.client.get('/v2/tiles/14/13882/7677.mvt', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        # Inside the generated zoom range but outside the data
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/v2/tiles/14/0/0.mvt').status_code, 204)
+
+        # Deeper zooms are built on demand
+        response = self.client.get('/v2/tiles/15/27764/15354.mvt')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('boundaries', decode_tile(response.content))
+
+        self.assertEqual(self.client.get('/v2/tiles/2/4/0.mvt').status_code, 404)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        location_autocomplete.invalidate()
+        self.addCleanup(location_autocomplete.invalidate)
+        for name, location_type, barangay in [
+            ('José Rizal Elementary School', LocationType.LANDMARK, 'Poblacion'),
+            ('Rizal', LocationType.BARANGAY, None),
+            ('Basey Public Market', LocationType.LANDMARK, 'Rizal'),
+            ('Sta. Rita', LocationType.BARANGAY, None),
+            ('San Antonio', LocationType.BARANGAY, None),
+            ('Old San Antonio Chapel', LocationType.LANDMARK, 'San Antonio'),
+        ]:
+            Location.objects.create(name=name, type=location_type, barangay=barangay)
+        Location.objects.create(name='Rizal Closed', is_active=False)
+
+    def names(self, query, **kwargs):
+        return [location['name'] for location in location_autocomplete.search(query, **kwargs)]
+
+    def test_rename_in_another_worker_is_searchable(self):
+        self.assertEqual(self.names('sta r'), ['Sta. Rita'])
+        Location.objects.filter(name='Sta. Rita').update(name='Santa Rita')
+        bump_shared_version(AutocompleteIndex.VERSION_KEY)
+        with mock.patch.object(VersionedValue, 'CHECK_SECONDS', 0):
+            self.assertEqual(self.names('santa r'), ['Santa Rita'])
+
+    def test_fold(self):
+        self.assertEqual(fold('  José  RIZAL-Élem. '), 'jose rizal elem')
+        self.assertEqual(fold(None), '')
+
+    def test_ranking(self):
+        self.assertEqual(self.names('rizal'), [
+            'Rizal', 'José Rizal Elementary School', 'Basey Public Market'
+        ])
+        self.assertEqual(self.names('JOSE riz'), ['José Rizal Elementary School'])
+        self.assertEqual(self.names('san ant'), ['San Antonio', 'Old San Antonio Chapel'])
+        self.assertEqual(self.names('sta r'), ['Sta. Rita'])
+        self.assertEqual(self.names('antonio', types=['BARANGAY']), ['San Antonio'])
+        self.assertEqual(self.names('r', limit=1), ['Rizal'])
+        self.assertEqual(self.names('zal'), [])
+        self.assertEqual(self.names('  ...'), [])
+
+    def test_endpoint(self):
+        location_autocomplete.search('warm')
+        with self.assertNumQueries(0):
+            response = self.client.get('/v2/locations/autocomplete/', {'q': 'José riz'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['name'], 'José Rizal Elementary School')
+        self.assertIn('max-age=60', response['Cache-Control'])
+
+        cached = self.client.get(
+            '/v2/locations/autocomplete/', {'q': 'jose riz'}, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.client.get('/v2/locations/autocomplete/').status_code, 400)
+
+    def test_rebuilt_after_save(self):
+        self.assertEqual(self.names('bagacay'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Location.objects.create(name='Bagacay')
+        self.assertEqual(self.names('bagacay'), ['Bagacay'])
+
+    def test_fast_on_many_locations(self):
+        rng = random.Random(105)
+        syllables = ['ba', 'sa', 'ta', 'ri', 'zal', 'an', 'to', 'ni', 'o', 'gu', 'in', 'lo', 'yo']
+        Location.objects.bulk_create([
+            Location(
+                name=' '.join(
+                    ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).title()
+                    for _ in range(rng.randint(1, 3))
+                ) + f' {i}',
+                type=LocationType.LANDMARK
+            )
+            for i in range(5000)
+        ])
+        location_autocomplete.invalidate()
+        location_autocomplete.search('warm')
+
+        started = time.perf_counter()
+        for query in ('b', 'ba', 'sa', 'riza', 'to ni', 'guin lo'):
+            location_autocomplete.search(query)
+        self.assertLess((time.perf_counter() - started) / 6, 0.005)
@@ -0,0 +1,483 @@
+"""
+Mapbox Vector Tiles of Location boundaries and points
+
+Tiles carry two layers: ``boundaries`` (boundary_data polygons, simplified
+to about a pixel for the zoom level) and ``locations`` (one point per
+located Location), each feature tagged with id, name, type and barangay.
+They are encoded here directly; the MVT schema only needs a handful of
+protobuf wire types.
+
+generate_vector_tiles writes gzipped tiles for a zoom range into an
+MBTiles (SQLite) file at VECTOR_TILES_PATH, which the tile view serves
+without touching the database. Zoom levels the file does not cover are
+built on demand and kept in the default cache under the boundaries' shared
+version token (boundaries.py), so a boundary saved in any process retires
+them everywhere. Only tiles over the locations' bounds and up to
+VECTOR_TILES_ON_DEMAND_MAX_ZOOM are built; any other tile is empty without
+being built or cached, so requests cannot fill the cache with empty tiles.
+"""
+import gzip
+import math
+import os
+import sqlite3
+import struct
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from bfg.versions import shared_version
+
+from .boundaries import BoundaryResolver, polygons
+from .geometry import simplify, tolerance_for_zoom
+from .models import Location
+
+
+EXTENT = 4096
+# Tile units drawn beyond each edge so outlines join up across tiles
+BUFFER = 64
+MAX_ZOOM = 20
+MAX_LATITUDE = 85.0511287798
+
+CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+CACHE_PREFIX = 'vector-tile:v1'
+CACHE_TIMEOUT = 24 * 3600
+
+POINT, POLYGON = 1, 3
+MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+
+
+# Protobuf encoding (varint and length-delimited fields only)
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _uint_field(number: int, value: int) -> bytes:
+    return _varint(number << 3) + _varint(value)
+
+
+def _bytes_field(number: int, payload: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _packed_field(number: int, values: Iterable[int]) -> bytes:
+    return _bytes_field(number, b''.join(_varint(value) for value in values))
+
+
+def _zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _command(command: int, count: int) -> int:
+    return (command & 0x7) | (count << 3)
+
+
+def _value(value) -> bytes:
+    """Encoded Layer.Value message"""
+    if isinstance(value, bool):
+        return _uint_field(7, int(value))
+    if isinstance(value, int):
+        return _uint_field(5, value) if value >= 0 else _uint_field(6, _zigzag(value))
+    if isinstance(value, float):
+        return _varint(3 << 3 | 1) + struct.pack('<d', value)
+    return _bytes_field(1, str(value).encode())
+
+
+class _Layer:
+    """Features of one tile layer, with shared key and value tables"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.keys: Dict[str, int] = {}
+        self.values: Dict[tuple, int] = {}
+        self.features: List[bytes] = []
+
+    def add(self, feature_id: int, geom_type: int, geometry: List[int], properties: Dict) -> None:
+        tags = []
+        for key, value in properties.items():
+            if value is None or value == '':
+                continue
+            tags.append(self.keys.setdefault(key, len(self.keys)))
+            tags.append(self.values.setdefault((type(value), value), len(self.values)))
+        self.features.append(
+            _uint_field(1, feature_id) + _packed_field(2, tags)
+            + _uint_field(3, geom_type) + _packed_field(4, geometry)
+        )
+
+    def encode(self) -> bytes:
+        return (
+            _uint_field(15, 2)
+            + _bytes_field(1, self.name.encode())
+            + b''.join(_bytes_field(2, feature) for feature in self.features)
+            + b''.join(_bytes_field(3, key.encode()) for key in self.keys)
+            + b''.join(_bytes_field(4, _value(value)) for _, value in self.values)
+            + _uint_field(5, EXTENT)
+        )
+
+
+# Web Mercator tile geometry
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(west, south, east, north) of a tile in degrees"""
+    n = 2 ** z
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, latitude(y + 1), (x + 1) / n * 360 - 180, latitude(y)
+
+
+def tile_range(z: int, west: float, south: float, east: float, north: float) -> Tuple[int, int, int, int]:
+    """(min x, min y, max x, max y) of the tiles covering a bounding box"""
+    n = 2 ** z
+    left, top = np.floor(_world((north, west), z)).astype(int).tolist()
+    right, bottom = np.floor(_world((south, east), z)).astype(int).tolist()
+    return max(0, left), max(0, top), min(n - 1, right), min(n - 1, bottom)
+
+
+def _world(points, z: int) -> np.ndarray:
+    """(..., 2) latitude/longitude to (x, y) in tiles of zoom z"""
+    points = np.asarray(points, dtype=np.float64)
+    lat = np.radians(np.clip(points[..., 0], -MAX_LATITUDE, MAX_LATITUDE))
+    n = 2 ** z
+    x = (points[..., 1] + 180) / 360 * n
+    y = (1 - np.arcsinh(np.tan(lat)) / math.pi) / 2 * n
+    return np.stack([x, y], axis=-1)
+
+
+def _clip(ring: List[Tuple[float, float]], low: float, high: float) -> List[Tuple[float, float]]:
+    """Sutherland-Hodgman clip of an open ring to the square [low, high]"""
+    for axis, bound, keep_above in ((0, low, True), (0, high, False), (1, low, True), (1, high, False)):
+        if not ring:
+            break
+        clipped = []
+        previous = ring[-1]
+        previous_inside = (previous[axis] >= bound) == keep_above
+        for point in ring:
+            inside = (point[axis] >= bound) == keep_above
+            if inside != previous_inside:
+                t = (bound - previous[axis]) / (point[axis] - previous[axis])
+                clipped.append(tuple(p + t * (q - p) for p, q in zip(previous, point)))
+            if inside:
+                clipped.append(point)
+            previous, previous_inside = point, inside
+        ring = clipped
+    return ring
+
+
+def _ring_commands(ring: np.ndarray, cursor: List[int], exterior: bool) -> List[int]:
+    """MoveTo/LineTo/ClosePath for an integer ring (winding fixed per the spec)"""
+    x, y = ring[:, 0], ring[:, 1]
+    area = np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+    if area == 0:
+        return []
+    if (area > 0) != exterior:
+        ring = ring[::-1]
+    deltas = np.diff(np.vstack([cursor, ring]), axis=0).tolist()
+    cursor[:] = ring[-1].tolist()
+    commands = [_command(MOVE_TO, 1), _zigzag(deltas[0][0]), _zigzag(deltas[0][1])]
+    commands.append(_command(LINE_TO, len(deltas) - 1))
+    for dx, dy in deltas[1:]:
+        commands.extend((_zigzag(dx), _zigzag(dy)))
+    commands.append(_command(CLOSE_PATH, 1))
+    return commands
+
+
+def _tile_ring(ring: np.ndarray) -> Optional[np.ndarray]:
+    """Rounded, clipped ring in tile units without repeated points (None if degenerate)"""
+    if ring.min() < -BUFFER or ring.max() > EXTENT + BUFFER:
+        ring = np.array(_clip([tuple(point) for point in ring.tolist()], -BUFFER, EXTENT + BUFFER))
+        if len(ring) < 3:
+            return None
+    ring = np.rint(ring).astype(np.int64)
+    keep = np.any(ring != np.roll(ring, 1, axis=0), axis=1)
+    ring = ring[keep]
+    return ring if len(ring) >= 3 else None
+
+
+class TileSource:
+    """Active Locations with their geometry, ready to be cut into tiles"""
+
+    def __init__(self):
+        locations = Location.objects.filter(is_active=True).order_by('id').only(
+            'id', 'name', 'type', 'barangay', 'latitude', 'longitude', 'boundary_data'
+        )
+        self.properties: List[Dict] = []
+        self.points: List[Tuple[int, Tuple[float, float]]] = []
+        self.polygons: List[Tuple[int, List[np.ndarray]]] = []
+        for location in locations:
+            index = len(self.properties)
+            self.properties.append({
+                'id': location.id, 'name': location.name,
+                'type': location.type, 'barangay': location.barangay,
+            })
+            if location.latitude is not None and location.longitude is not None:
+                self.points.append((index, (float(location.latitude), float(location.longitude))))
+            for rings in polygons(location.boundary_data):
+                # GeoJSON rings repeat the first point; tiles close rings implicitly
+                rings = [ring[:-1] if np.array_equal(ring[0], ring[-1]) else ring for ring in rings]
+                self.polygons.append((index, rings))
+
+        self.point_array = np.array([point for _, point in self.points], dtype=np.float64).reshape(-1, 2)
+        boxes = [
+            np.concatenate([rings[0].min(axis=0), rings[0].max(axis=0)]) for _, rings in self.polygons
+        ]
+        self.polygon_boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+        self._simplified: Dict[int, List[List[np.ndarray]]] = {}
+        self._bounds: Optional[Tuple[float, ...]] = None
+
+    def bounds(self) -> Optional[Tuple[float, float, float, float]]:
+        """(west, south, east, north) of everything in the source"""
+        if self._bounds is None:
+            self._bounds = self._compute_bounds()
+        return self._bounds or None
+
+    def _compute_bounds(self) -> Tuple[float, ...]:
+        corners = [self.point_array] + [
+            box.reshape(2, 2) for box in self.polygon_boxes
+        ]
+        corners = np.concatenate(corners)
+        if not len(corners):
+            return ()
+        (south, west), (north, east) = corners.min(axis=0), corners.max(axis=0)
+        return float(west), float(south), float(east), float(north)
+
+    def covers(self, z: int, x: int, y: int) -> bool:
+        """Whether tile z/x/y is one tiles() would visit"""
+        bounds = self.bounds()
+        if bounds is None:
+            return False
+        left, top, right, bottom = tile_range(z, *bounds)
+        return left <= x <= right and top <= y <= bottom
+
+    def simplified(self, z: int) -> List[List[np.ndarray]]:
+        """Polygon rings simplified to about a pixel at zoom z"""
+        if z not in self._simplified:
+            result = []
+            for _, rings in self.polygons:
+                tolerance = tolerance_for_zoom(z, float(rings[0][0, 0]))
+                result.append([
+                    simplify(np.vstack([ring, ring[:1]]), tolerance)[:-1] for ring in rings
+                ])
+            self._simplified[z] = result
+        return self._simplified[z]
+
+    def tile(self, z: int, x: int, y: int) -> bytes:
+        """Encoded tile (b'' when nothing falls in it)"""
+        west, south, east, north = tile_bounds(z, x, y)
+        margin_lng = (east - west) * BUFFER / EXTENT
+        margin_lat = (north - south) * BUFFER / EXTENT
+        south, west, north, east = south - margin_lat, west - margin_lng, north + margin_lat, east + margin_lng
+        origin = np.array([x, y], dtype=np.float64)
+
+        def to_tile(points):
+            return (_world(points, z) - origin) * EXTENT
+
+        boundaries = _Layer('boundaries')
+        boxes = self.polygon_boxes
+        hits = np.flatnonzero(
+            (boxes[:, 0] <= north) & (boxes[:, 2] >= south) & (boxes[:, 1] <= east) & (boxes[:, 3] >= west)
+        )
+        if len(hits):
+            simplified = self.simplified(z)
+            for i in hits.tolist():
+                index = self.polygons[i][0]
+                cursor = [0, 0]
+                geometry = []
+                for ring_number, ring in enumerate(simplified[i]):
+                    ring = _tile_ring(to_tile(ring)) if len(ring) >= 3 else None
+                    if ring is None:
+                        if ring_number == 0:
+                            break
+                        continue
+                    commands = _ring_commands(ring, cursor, exterior=ring_number == 0)
+                    if not commands and ring_number == 0:
+                        break
+                    geometry.extend(commands)
+                if geometry:
+                    properties = self.properties[index]
+                    boundaries.add(properties['id'], POLYGON, geometry, properties)
+
+        points = _Layer('locations')
+        inside = np.flatnonzero(
+            (self.point_array[:, 0] >= south) & (self.point_array[:, 0] <= north)
+            & (self.point_array[:, 1] >= west) & (self.point_array[:, 1] <= east)
+        )
+        if len(inside):
+            projected = np.rint(to_tile(self.point_array[inside])).astype(np.int64).tolist()
+            for i, (px, py) in zip(inside.tolist(), projected):
+                properties = self.properties[self.points[i][0]]
+                points.add(
+                    properties['id'], POINT, [_command(MOVE_TO, 1), _zigzag(px), _zigzag(py)], properties
+                )
+
+        return b''.join(
+            _bytes_field(3, layer.encode()) for layer in (boundaries, points) if layer.features
+        )
+
+    def tiles(self, min_zoom: int, max_zoom: int) -> Iterator[Tuple[int, int, int, bytes]]:
+        """(z, x, y, tile) for every non-empty tile over the source's bounds"""
+        bounds = self.bounds()
+        if bounds is None:
+            return
+        for z in range(min_zoom, max_zoom + 1):
+            left, top, right, bottom = tile_range(z, *bounds)
+            for x in range(left, right + 1):
+                for y in range(top, bottom + 1):
+                    data = self.tile(z, x, y)
+                    if data:
+                        yield z, x, y, data
+
+
+def write_mbtiles(
+    path: str,
+    tiles: Iterable[Tuple[int, int, int, bytes]],
+    metadata: Dict[str, str]
+) -> Tuple[int, int]:
+    """
+    Write gzipped tiles to an MBTiles file, replacing path atomically
+
+    Returns (tile count, total gzipped bytes).
+    """
+    partial = f"{path}.partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    count = size = 0
+    connection = sqlite3.connect(partial)
+    try:
+        connection.executescript("""
+            CREATE TABLE metadata (name TEXT, value TEXT);
+            CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+            CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row);
+        """)
+        connection.executemany("INSERT INTO metadata VALUES (?, ?)", metadata.items())
+        for z, x, y, data in tiles:
+            data = gzip.compress(data, mtime=0)
+            # MBTiles rows count from the south (TMS)
+            connection.execute(
+                "INSERT INTO tiles VALUES (?, ?, ?, ?)", (z, x, 2 ** z - 1 - y, data)
+            )
+            count, size = count + 1, size + len(data)
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(partial, path)
+    return count, size
+
+
+class MBTiles:
+    """Read-only access to an MBTiles file, reopened when it is replaced"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> Optional[Tuple[sqlite3.Connection, Dict[str, str]]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        signature = (stat.st_ino, stat.st_mtime_ns)
+        if getattr(self._local, 'signature', None) != signature:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            metadata = dict(connection.execute("SELECT name, value FROM metadata"))
+            self._local.connection, self._local.metadata = connection, metadata
+            self._local.signature = signature
+        return self._local.connection, self._local.metadata
+
+    def covers(self, z: int) -> bool:
+        """Whether the file was generated for zoom level z"""
+        opened = self._connection()
+        if opened is None:
+            return False
+        metadata = opened[1]
+        return int(metadata.get('minzoom', 0)) <= z <= int(metadata.get('maxzoom', -1))
+
+    def get(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """Gzipped tile, or None if it is empty or missing"""
+        opened = self._connection()
+        if opened is None:
+            return None
+        row = opened[0].execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, 2 ** z - 1 - y)
+        ).fetchone()
+        return row[0] if row else None
+
+
+class VectorTiles:
+    """Gzipped tiles from the MBTiles file, or built on demand"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._source: Optional[TileSource] = None
+        self._source_version = None
+        self._store: Optional[MBTiles] = None
+
+    def store(self) -> MBTiles:
+        if self._store is None or self._store.path != settings.VECTOR_TILES_PATH:
+            self._store = MBTiles(settings.VECTOR_TILES_PATH)
+        return self._store
+
+    def source(self) -> TileSource:
+        version = shared_version(BoundaryResolver.VERSION_KEY)
+        with self._lock:
+            if self._source is None or self._source_version != version:
+                self._source = TileSource()
+                self._source_version = version
+            return self._source
+
+    def get(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """Gzipped tile z/x/y (None when empty)"""
+        store = self.store()
+        if store.covers(z):
+            return store.get(z, x, y)
+        if z > settings.VECTOR_TILES_ON_DEMAND_MAX_ZOOM or not self.source().covers(z, x, y):
+            return None
+
+        key = f"{CACHE_PREFIX}:{shared_version(BoundaryResolver.VERSION_KEY)}:{z}/{x}/{y}"
+        data = cache.get(key)
+        if data is None:
+            tile = self.source().tile(z, x, y)
+            data = gzip.compress(tile, mtime=0) if tile else b''
+            cache.set(key, data, timeout=CACHE_TIMEOUT)
+        return data or None
+
+
+def generate(path: str, min_zoom: int, max_zoom: int) -> Dict:
+    """Build every non-empty tile in the zoom range into an MBTiles file"""
+    started = time.perf_counter()
+    source = TileSource()
+    bounds = source.bounds()
+    if bounds is None:
+        raise ValueError("No active location has coordinates or a boundary")
+    west, south, east, north = bounds
+    metadata = {
+        'name': 'locations',
+        'format': 'pbf',
+        'type': 'overlay',
+        'minzoom': str(min_zoom),
+        'maxzoom': str(max_zoom),
+        'bounds': f"{west},{south},{east},{north}",
+        'center': f"{(west + east) / 2},{(south + north) / 2},{min_zoom}",
+        'json': (
+            '{"vector_layers":['
+            '{"id":"boundaries","fields":{"id":"Number","name":"String","type":"String","barangay":"String"}},'
+            '{"id":"locations","fields":{"id":"Number","name":"String","type":"String","barangay":"String"}}]}'
+        ),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    count, size = write_mbtiles(path, source.tiles(min_zoom, max_zoom), metadata)
+    return {'tiles': count, 'bytes': size, 'seconds': time.perf_counter() - started}
+
+
+vector_tiles = VectorTiles()
@@ -1,14 +1,36 @@
-from rest_framework import viewsets, filters
+import gzip
+import hashlib
+import json
+
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_GET
+from django.conf import settings
+from rest_framework import viewsets, filters, status
+from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 
+from bfg.conditional import ConditionalGetMixin, conditional_response
+
 from .models import Location
-from .serializers import LocationSerializer, LocationListSerializer
+from .autocomplete import location_autocomplete
+from .boundaries import barangay_name, boundary_resolver
+from .geometry import geometry_response
+from .serializers import (
+    LocationSerializer, LocationListSerializer, NearestLocationQuerySerializer,
+    PointQuerySerializer, BatchResolveSerializer, GeometryQuerySerializer,
+    AutocompleteQuerySerializer
+)
+from .spatial_index import location_index
+from .vector_tiles import CONTENT_TYPE, MAX_ZOOM, vector_tiles
 
 
-class LocationViewSet(viewsets.ModelViewSet):
+class LocationViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet for Location model"""
     queryset = Location.objects.filter(is_active=True)
+    conditional_models = [Location]
     serializer_class = LocationSerializer
     permission_classes = [AllowAny]  # Locations are public
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -22,3 +44,136 @@ class LocationViewSet(viewsets.ModelViewSet):
         if self.action == 'list':
             return LocationListSerializer
         return LocationSerializer
+    
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        """
+        Locations closest to a point, nearest first
+        GET /v2/locations/nearest/?lat=11.28&lng=125.06&k=3[&max_distance_km=2][&type=BARANGAY]
+        
+        Answered from the in-memory spatial index; distance_km is the
+        straight-line distance from the point.
+        """
+        query = NearestLocationQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        
+        matches = location_index.nearest(
+            (params['lat'], params['lng']),
+            k=params['k'],
+            max_km=params.get('max_distance_km'),
+            types=params.get('type')
+        )
+        results = [{**location, 'distance_km': round(km, 3)} for location, km in matches]
+        return Response({'count': len(results), 'results': results})
+    
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Locations matching what the user has typed, best first
+        GET /v2/locations/autocomplete/?q=jose riz[&limit=10][&type=BARANGAY]
+        
+        Every word of q must start a word of the location's name or
+        barangay; accents and case are ignored. Answered from an in-memory
+        index without database queries.
+        """
+        query = AutocompleteQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        
+        results = location_autocomplete.search(params['q'], params['limit'], params.get('type'))
+        etag = '"%s"' % hashlib.sha1(json.dumps(results, sort_keys=True).encode()).hexdigest()
+        return conditional_response(
+            request, etag, lambda: Response({'count': len(results), 'results': results}), max_age=60
+        )
+    
+    @action(detail=False, methods=['get'])
+    def resolve(self, request):
+        """
+        Barangay containing a point, from Location boundary polygons
+        GET /v2/locations/resolve/?lat=11.28&lng=125.06
+        
+        location is the Location whose boundary contains the point (null if
+        none does); barangay is the barangay it belongs to.
+        """
+        query = PointQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        point = (query.validated_data['lat'], query.validated_data['lng'])
+        
+        location = boundary_resolver.resolve(point)
+        return Response({'location': location, 'barangay': barangay_name(location) or None})
+    
+    @action(detail=False, methods=['post'], url_path='resolve/batch')
+    def resolve_batch(self, request):
+        """
+        resolve for many points at once
+        POST /v2/locations/resolve/batch/
+        {"points": [[latitude, longitude], ...]}
+        
+        Results are in the order of points.
+        """
+        serializer = BatchResolveSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        locations = boundary_resolver.resolve_many(serializer.validated_data['points'])
+        return Response({
+            'count': len(locations),
+            'results': [
+                {'location': location, 'barangay': barangay_name(location) or None}
+                for location in locations
+            ]
+        })
+    
+    @action(detail=False, methods=['get'])
+    def geometry(self, request):
+        """
+        Simplified outlines of every location with a boundary, for maps
+        GET /v2/locations/geometry/?zoom=14
+        
+        Polygons are Douglas-Peucker simplified to about a pixel at zoom
+        (8-18) and encoded as Google polylines (exterior ring first, then
+        holes). Send If-None-Match with the previous ETag to get a 304.
+        """
+        query = GeometryQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        etag, body = geometry_response(query.validated_data['zoom'])
+        return conditional_response(
+            request, etag, lambda: HttpResponse(body, content_type='application/json'), max_age=300
+        )
+
+
+@require_GET
+def vector_tile(request, z, x, y):
+    """
+    Mapbox Vector Tile of location boundaries and points
+    GET /v2/tiles/{z}/{x}/{y}.mvt
+    
+    Layers "boundaries" (polygons) and "locations" (points), served from the
+    MBTiles file written by generate_vector_tiles (or built on demand near the
+    locations, up to VECTOR_TILES_ON_DEMAND_MAX_ZOOM). Empty tiles are 204.
+    Responses may be cached for VECTOR_TILES_MAX_AGE.
+    """
+    if z > MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        raise Http404("No such tile")
+    
+    data = vector_tiles.get(z, x, y)
+    etag = f'"{hashlib.sha1(data).hexdigest()}"' if data else '"empty"'
+    
+    def render():
+        if data is None:
+            return HttpResponse(status=204)
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = HttpResponse(data, content_type=CONTENT_TYPE)
+            response['Content-Encoding'] = 'gzip'
+            return response
+        return HttpResponse(gzip.decompress(data), content_type=CONTENT_TYPE)
+    
+    response = conditional_response(request, etag, render, max_age=settings.VECTOR_TILES_MAX_AGE)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
@@ -0,0 +1,64 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent fare quotes at a running server and report throughput "
+        "and latency (run once against the WSGI and once against the ASGI server)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='e.g. http://127.0.0.1:8000/v2/routes/calculate/')
+        parser.add_argument('--requests', type=int, default=500, help='Total requests')
+        parser.add_argument('--concurrency', type=int, default=100, help='Requests in flight')
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--gps-only', action='store_true', help='Send use_google_maps=false')
+
+    def handle(self, *args, **options):
+        local = threading.local()
+        payload = {
+            'origin': [11.28026, 125.06909],
+            'destination': [11.2768363, 125.0114879],
+            'use_google_maps': not options['gps_only'],
+            'passenger_type': 'REGULAR',
+        }
+
+        def quote(i):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            # Vary the destination so the route cache does not absorb the load
+            body = dict(payload, destination=[payload['destination'][0] + i * 0.001, payload['destination'][1]])
+            started = time.perf_counter()
+            try:
+                response = local.session.post(options['url'], json=body, timeout=options['timeout'])
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            return ok, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(quote, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for ok, latency in results if ok)
+        failures = len(results) - len(latencies)
+        if not latencies:
+            raise CommandError(f"All {failures} requests failed")
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+        self.stdout.write(f"requests    {len(results)} ({failures} failed)")
+        self.stdout.write(f"concurrency {options['concurrency']}")
+        self.stdout.write(f"throughput  {len(latencies) / elapsed:,.1f} req/s")
+        self.stdout.write(
+            f"latency ms  mean {statistics.mean(latencies) * 1000:.0f}  p50 {percentile(50):.0f}  "
+            f"p95 {percentile(95):.0f}  p99 {percentile(99):.0f}"
+        )
@@ -1,3 +1,5 @@
+import math
+
 from rest_framework import serializers
 from .models import Route
 from locations.serializers import LocationListSerializer
@@ -18,21 +20,49 @@ class RouteSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
+class FiniteFloatField(serializers.FloatField):
+    """FloatField that rejects NaN and infinity"""
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if not math.isfinite(value):
+            self.fail('invalid')
+        return value
+
+
+class CoordinatesField(serializers.ListField):
+    """[latitude, longitude] in degrees"""
+
+    def __init__(self, **kwargs):
+        kwargs.update(child=FiniteFloatField(), min_length=2, max_length=2)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if len(value) != 2:
+            return value  # rejected by the length validators
+        latitude, longitude = value
+        if not -90 <= latitude <= 90:
+            raise serializers.ValidationError("Latitude must be between -90 and 90.")
+        if not -180 <= longitude <= 180:
+            raise serializers.ValidationError("Longitude must be between -180 and 180.")
+        return value
+
+
 class RouteCalculationSerializer(serializers.Serializer):
     """Serializer for route calculation requests"""
-    origin = serializers.ListField(
-        child=serializers.FloatField(),
-        min_length=2,
-        max_length=2,
-        help_text="Origin coordinates [latitude, longitude]"
-    )
-    destination = serializers.ListField(
-        child=serializers.FloatField(),
-        min_length=2,
-        max_length=2,
-        help_text="Destination coordinates [latitude, longitude]"
-    )
-    user_id = serializers.IntegerField(required=False, allow_null=True)
+    origin = CoordinatesField(help_text="Origin coordinates [latitude, longitude]")
+    destination = CoordinatesField(help_text="Destination coordinates [latitude, longitude]")
+    origin_location_id = serializers.IntegerField(
+        required=False,
+        allow_null=True,
+        help_text="Origin Location id; with destination_location_id uses the precomputed distance matrix"
+    )
+    destination_location_id = serializers.IntegerField(
+        required=False,
+        allow_null=True,
+        help_text="Destination Location id"
+    )
     use_google_maps = serializers.BooleanField(default=True)
     passenger_type = serializers.ChoiceField(
         choices=['REGULAR', 'SENIOR', 'PWD', 'STUDENT'],
@@ -40,3 +70,82 @@ class RouteCalculationSerializer(serializers.Serializer):
         required=False,
         help_text="Passenger type for discount calculation"
     )
+
+
+class BatchFareCalculationSerializer(serializers.Serializer):
+    """Serializer for batch fare quoting requests"""
+    MAX_QUOTES = 10000
+    # Far beyond any trip in Basey
+    MAX_DISTANCE_KM = 500
+
+    distances = serializers.ListField(
+        child=FiniteFloatField(min_value=0, max_value=MAX_DISTANCE_KM),
+        required=False,
+        min_length=1,
+        max_length=MAX_QUOTES,
+        help_text="Distances in kilometers"
+    )
+    origins = serializers.ListField(
+        child=CoordinatesField(),
+        required=False,
+        min_length=1,
+        max_length=MAX_QUOTES,
+        help_text="Origin coordinates [[latitude, longitude], ...] (GPS estimate instead of distances)"
+    )
+    destinations = serializers.ListField(
+        child=CoordinatesField(),
+        required=False,
+        min_length=1,
+        max_length=MAX_QUOTES,
+        help_text="Destination coordinates, one per origin"
+    )
+    passenger_types = serializers.ListField(
+        child=serializers.ChoiceField(choices=['REGULAR', 'SENIOR', 'PWD', 'STUDENT']),
+        required=False,
+        help_text="Passenger type per distance (overrides passenger_type)"
+    )
+    passenger_type = serializers.ChoiceField(
+        choices=['REGULAR', 'SENIOR', 'PWD', 'STUDENT'],
+        default='REGULAR',
+        required=False,
+        help_text="Passenger type applied to every distance"
+    )
+
+    def validate(self, attrs):
+        distances = attrs.get('distances')
+        origins = attrs.get('origins')
+        destinations = attrs.get('destinations')
+        if distances is None:
+            if origins is None or destinations is None:
+                raise serializers.ValidationError(
+                    "Provide distances, or origins and destinations."
+                )
+            if len(origins) != len(destinations):
+                raise serializers.ValidationError({
+                    'destinations': "Must contain one destination per origin."
+                })
+            count = len(origins)
+        elif origins is not None or destinations is not None:
+            raise serializers.ValidationError(
+                "Provide either distances or origins and destinations, not both."
+            )
+        else:
+            count = len(distances)
+
+        passenger_types = attrs.get('passenger_types')
+        if passenger_types is not None and len(passenger_types) != count:
+            raise serializers.ValidationError({
+                'passenger_types': "Must contain one passenger type per distance."
+            })
+        return attrs
+
+
+class RouteSnapshotSerializer(serializers.ModelSerializer):
+    """Route row of the offline snapshot; endpoints are location ids"""
+
+    class Meta:
+        model = Route
+        fields = [
+            'id', 'origin', 'destination', 'transport_type', 'distance_km',
+            'estimated_duration_minutes'
+        ]
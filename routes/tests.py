@@ -1,3 +1,111 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from bfg.conditional import invalidate_stamp
+from bfg.testing import LOCAL_CACHES, ListQueryCountMixin
+from fares.road_multipliers import road_multipliers
+from locations.models import Location
+from users.models import User
+from .models import Route
+
+
+# The history writer thread would write outside the test transaction
+@override_settings(QUOTE_HISTORY_ENABLED=False, CACHES=LOCAL_CACHES)
+class CalculateRouteAsyncTests(TestCase):
+    PAYLOAD = {
+        'origin': [11.28026, 125.06909],
+        'destination': [11.2768363, 125.0114879],
+        'use_google_maps': False,
+        'passenger_type': 'STUDENT',
+    }
+
+    def setUp(self):
+        # Throttle history would carry over between tests
+        cache.clear()
+
+    async def test_matches_sync_view(self):
+        sync_response = await self.async_client.post(
+            '/v2/routes/calculate/', self.PAYLOAD, content_type='application/json'
+        )
+        async_response = await self.async_client.post(
+            '/v2/routes/calculate/async/', self.PAYLOAD, content_type='application/json'
+        )
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual(async_response.json(), sync_response.json())
+
+    async def test_gps_quote_loads_road_multipliers(self):
+        # First GPS quote in the process: the multiplier table is read from
+        # the database, which must happen off the event loop
+        await sync_to_async(road_multipliers.invalidate)()
+        response = await self.async_client.post(
+            '/v2/routes/calculate/async/', self.PAYLOAD, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['method'], 'gps')
+
+    async def test_invalid_payload(self):
+        response = await self.async_client.post(
+            '/v2/routes/calculate/async/', {'origin': [1]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('destination', response.json())
+
+    async def test_out_of_range_coordinates(self):
+        for path in ('/v2/routes/calculate/', '/v2/routes/calculate/async/'):
+            for origin in ([91, 125.06909], [11.28026, 180.5], [11.28026, 'nan']):
+                response = await self.async_client.post(
+                    path, dict(self.PAYLOAD, origin=origin), content_type='application/json'
+                )
+                self.assertEqual(response.status_code, 400, (path, origin))
+                self.assertIn('origin', response.json())
+
+    async def test_signed_in_callers_get_the_user_rate(self):
+        async def post_twice():
+            return [
+                (await self.async_client.post(
+                    '/v2/routes/calculate/async/', self.PAYLOAD, content_type='application/json'
+                )).status_code
+                for _ in range(2)
+            ]
+
+        rider = await sync_to_async(User.objects.create_user)(username='rider', email='rider@example.com')
+        with mock.patch.object(SimpleRateThrottle, 'THROTTLE_RATES', {'anon': '1/hour', 'user': '5/hour'}):
+            self.assertEqual(await post_twice(), [200, 429])
+            await self.async_client.aforce_login(rider)
+            self.assertEqual(await post_twice(), [200, 200])
+
+    async def test_bad_token_is_rejected(self):
+        response = await self.async_client.post(
+            '/v2/routes/calculate/async/', self.PAYLOAD, content_type='application/json',
+            headers={'Authorization': 'Bearer not-a-token'}
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class RouteListQueryTests(ListQueryCountMixin, TestCase):
+    def setUp(self):
+        for model in (Route, Location):
+            invalidate_stamp(model)
+            self.addCleanup(invalidate_stamp, model)
+
+    def add_routes(self, count):
+        start = Location.objects.count()
+        locations = [
+            Location.objects.create(name=f'Sitio {i}', latitude=11.28, longitude=125.06)
+            for i in range(start, start + count + 1)
+        ]
+        for origin, destination in zip(locations, locations[1:]):
+            Route.objects.create(origin=origin, destination=destination, transport_type='TRICYCLE')
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        # Two version stamps, the page count and the rows
+        page = self.assertListQueries('/v2/routes/', self.add_routes, 4, large=30)
+        self.assertEqual(page['count'], 32)
+
+        details = page['results'][0]['origin_details']
+        self.assertEqual(details['coordinates'], {'lat': 11.28, 'lng': 125.06})
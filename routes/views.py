@@ -1,18 +1,43 @@
+import json
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
 from django_filters.rest_framework import DjangoFilterBackend
 
+from bfg.conditional import ConditionalGetMixin
+from locations.models import Location
 from .models import Route
-from .serializers import RouteSerializer, RouteCalculationSerializer
-from fares.fare_calculator import calculate_route_with_fare
+from .serializers import (
+    RouteSerializer, RouteCalculationSerializer, BatchFareCalculationSerializer
+)
+from fares.fare_calculator import (
+    FareCalculator, GPSDistanceCalculator, acalculate_route_with_fare,
+    calculate_route_with_fare
+)
+from fares.route_cache import route_cache
+from fares.route_geometry import wants_steps, without_steps
 from users.models import DiscountCard
+from users.quote_history import quote_history
 
 
-class RouteViewSet(viewsets.ModelViewSet):
+class RouteViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet for Route model"""
-    queryset = Route.objects.filter(is_active=True)
+    # Both endpoints are nested in every row; their boundaries never are
+    queryset = Route.objects.filter(is_active=True).select_related(
+        'origin', 'destination'
+    ).defer('origin__boundary_data', 'destination__boundary_data')
+    conditional_models = [Route, Location]
     serializer_class = RouteSerializer
     permission_classes = [AllowAny]
     filter_backends = [DjangoFilterBackend]
@@ -28,10 +53,13 @@ def calculate_route(request):
     {
         "origin": [latitude, longitude],
         "destination": [latitude, longitude],
-        "user_id": optional_user_id,
+        "origin_location_id": optional_location_id,
+        "destination_location_id": optional_location_id,
         "use_google_maps": true,
         "passenger_type": "REGULAR|SENIOR|PWD|STUDENT"
     }
+    Turn-by-turn steps are included with ?include=steps. A signed-in
+    caller's quote is recorded with their id and approved discount card.
     """
     serializer = RouteCalculationSerializer(data=request.data)
     
@@ -41,10 +69,14 @@ def calculate_route(request):
     origin = tuple(serializer.validated_data['origin'])
     destination = tuple(serializer.validated_data['destination'])
     use_google_maps = serializer.validated_data.get('use_google_maps', True)
-    user_id = serializer.validated_data.get('user_id')
+    # Only ever the authenticated caller: an id in the body would let anyone
+    # file quotes under, and probe the cards of, another user
+    user_id = request.user.id if request.user.is_authenticated else None
     passenger_type = serializer.validated_data.get('passenger_type', 'REGULAR')
+    origin_location_id = serializer.validated_data.get('origin_location_id')
+    destination_location_id = serializer.validated_data.get('destination_location_id')
     
-    # Get discount card if user is provided (for logging purposes)
+    # Get the caller's discount card (for logging purposes)
     discount_card = None
     if user_id:
         try:
@@ -63,11 +95,156 @@ def calculate_route(request):
             destination=destination,
             discount_card=discount_card,
             use_google_maps=use_google_maps,
-            passenger_type=passenger_type
+            passenger_type=passenger_type,
+            origin_location_id=origin_location_id,
+            destination_location_id=destination_location_id
         )
+        quote_history.record(result, origin, destination, user_id)
+        if not wants_steps(request):
+            result = dict(result, route=without_steps(result['route']))
         return Response(result, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({
             'success': False,
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _authenticate_and_throttle(request):
+    """
+    DRF authentication and rate limiting for a plain Django view
+
+    Sets request.user as the DRF views would (JWT or session) and applies
+    the user rate to signed-in callers and the anonymous one to the rest.
+    Returns the error response, or None to go ahead.
+    """
+    drf_request = Request(
+        request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    try:
+        request.user = drf_request.user
+    except APIException as e:
+        return JsonResponse({'detail': e.detail}, status=e.status_code)
+    
+    throttle = UserRateThrottle() if request.user.is_authenticated else AnonRateThrottle()
+    if not throttle.allow_request(request, None):
+        return JsonResponse({'detail': 'Request was throttled.'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    return None
+
+
+@csrf_exempt
+@require_POST
+async def calculate_route_async(request):
+    """
+    Async-native calculate_route for ASGI (uvicorn) workers
+    POST /v2/routes/calculate/async/
+    
+    Same request and response as calculate_route. The Google Maps call and
+    the discount card query are awaited concurrently, so a worker can hold
+    many in-flight quotes instead of blocking on each one.
+    """
+    # Tokens, sessions and the throttle history may all be database reads
+    error = await sync_to_async(_authenticate_and_throttle)(request)
+    if error is not None:
+        return error
+    
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'detail': 'JSON parse error.'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    serializer = RouteCalculationSerializer(data=data)
+    
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    # request.user was set by _authenticate_and_throttle; see calculate_route
+    user_id = request.user.id if request.user.is_authenticated else None
+    
+    # Get the caller's discount card (for logging purposes)
+    async def find_discount_card():
+        if not user_id:
+            return None
+        try:
+            return await DiscountCard.objects.filter(
+                user_id=user_id,
+                is_active=True,
+                verification_status='APPROVED'
+            ).afirst()
+        except Exception:
+            return None
+    
+    origin = tuple(serializer.validated_data['origin'])
+    destination = tuple(serializer.validated_data['destination'])
+    
+    # Calculate route and fare
+    try:
+        result = await acalculate_route_with_fare(
+            origin=origin,
+            destination=destination,
+            discount_card=find_discount_card(),
+            use_google_maps=serializer.validated_data.get('use_google_maps', True),
+            passenger_type=serializer.validated_data.get('passenger_type', 'REGULAR'),
+            origin_location_id=serializer.validated_data.get('origin_location_id'),
+            destination_location_id=serializer.validated_data.get('destination_location_id')
+        )
+        # Only queued here; written by the history thread
+        quote_history.record(result, origin, destination, user_id)
+        if not wants_steps(request):
+            result = dict(result, route=without_steps(result['route']))
+        return JsonResponse(result, status=status.HTTP_200_OK)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def calculate_fares_batch(request):
+    """
+    Quote fares for many distances at once
+    POST /v2/routes/calculate/batch/
+    {
+        "distances": [km, ...],
+        "passenger_types": ["REGULAR|SENIOR|PWD|STUDENT", ...],
+        "passenger_type": "REGULAR"
+    }
+    Instead of distances, "origins" and "destinations" ([[lat, lng], ...])
+    may be given to quote GPS distance estimates.
+    Results are returned column-wise in request order.
+    """
+    serializer = BatchFareCalculationSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    distances = serializer.validated_data.get('distances')
+    if distances is None:
+        # GPS estimates rounded to whole metres, as for single quotes
+        km = GPSDistanceCalculator.calculate_distances(
+            serializer.validated_data['origins'],
+            serializer.validated_data['destinations']
+        )
+        distances = (np.rint(km * 1000) / 1000).tolist()
+    passenger_types = serializer.validated_data.get('passenger_types') or \
+        serializer.validated_data.get('passenger_type', 'REGULAR')
+    
+    fares = FareCalculator.calculate_fares(distances, passenger_types)
+    return Response({
+        'success': True,
+        'count': len(distances),
+        'distance_km': distances,
+        'fare': fares['fare'].tolist(),
+        'original_fare': fares['original_fare'].tolist(),
+        'discount_applied': fares['discount_applied'].tolist(),
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def route_cache_stats(request):
+    """
+    Route cache hit/miss counters (admin only)
+    GET /v2/routes/cache-stats/
+    """
+    return Response(route_cache.stats(), status=status.HTTP_200_OK)
@@ -10,6 +10,22 @@ echo "========================================="
 echo "Running collectstatic..."
 python manage.py collectstatic --noinput --clear || echo "Collectstatic failed, continuing..."
 
+echo "Creating cache tables (no-op unless a database cache is configured)..."
+python manage.py createcachetable || echo "createcachetable failed, continuing..."
+
+if [ "${ASGI:-false}" = "true" ]; then
+    # Async workers: one uvicorn worker holds many in-flight quotes
+    echo "Starting gunicorn (uvicorn workers) on port ${PORT:-8000}..."
+    export ASYNC_ROUTE_CALCULATION=${ASYNC_ROUTE_CALCULATION:-true}
+    exec gunicorn bfg.asgi:application \
+        --worker-class uvicorn_worker.UvicornWorker \
+        --bind 0.0.0.0:${PORT:-8000} \
+        --workers 3 \
+        --timeout 120 \
+        --access-logfile - \
+        --error-logfile -
+fi
+
 echo "Starting gunicorn on port ${PORT:-8000}..."
 exec gunicorn bfg.wsgi:application \
     --bind 0.0.0.0:${PORT:-8000} \
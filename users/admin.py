@@ -191,7 +191,7 @@ class FareCalculationAdmin(admin.ModelAdmin):
         'distance', 'calculated_fare', 'discount_applied',
         'calculation_type', 'created_at'
     ]
-    list_filter = ['calculation_type', 'created_at']
+    list_filter = ['calculation_type', 'origin_barangay', 'destination_barangay', 'created_at']
     search_fields = ['from_location', 'to_location', 'user__username']
     ordering = ['-created_at']
     raw_id_fields = ['user', 'vehicle', 'discount_card']
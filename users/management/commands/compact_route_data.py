@@ -0,0 +1,54 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from fares.route_geometry import store_geometries
+from users.models import FareCalculation
+
+
+class Command(BaseCommand):
+    help = "Move polylines, bounds and steps of stored fare history into shared RouteGeometry rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows compacted per batch')
+
+    def handle(self, *args, **options):
+        rows = FareCalculation.objects.filter(
+            route_data__isnull=False, route_geometry__isnull=True
+        ).only('id', 'route_data').order_by('id')
+
+        started = time.perf_counter()
+        stats = {'rows': 0, 'compacted': 0, 'before': 0, 'after': 0}
+        batch = []
+        for calculation in rows.iterator(chunk_size=options['batch_size']):
+            batch.append(calculation)
+            if len(batch) >= options['batch_size']:
+                self.compact(batch, stats)
+                batch = []
+        if batch:
+            self.compact(batch, stats)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {stats['rows']} fare calculation(s) in {time.perf_counter() - started:.1f} s: "
+            f"{stats['compacted']} compacted, route_data {stats['before'] / 1024:.0f} KiB -> "
+            f"{stats['after'] / 1024:.0f} KiB"
+        ))
+
+    @staticmethod
+    def compact(batch, stats):
+        stats['rows'] += len(batch)
+        with transaction.atomic():
+            changed = []
+            for calculation, (route_data, digest) in zip(
+                batch, store_geometries([calculation.route_data for calculation in batch])
+            ):
+                if digest is None:
+                    continue
+                stats['before'] += len(json.dumps(calculation.route_data))
+                stats['after'] += len(json.dumps(route_data))
+                calculation.route_data, calculation.route_geometry_id = route_data, digest
+                changed.append(calculation)
+            FareCalculation.objects.bulk_update(changed, ['route_data', 'route_geometry'])
+        stats['compacted'] += len(changed)
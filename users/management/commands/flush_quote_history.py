@@ -0,0 +1,35 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.quote_history import read_spool, write_records
+
+
+class Command(BaseCommand):
+    help = "Load quote history batches spooled to disk into FareCalculation"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--spool-dir',
+            default=settings.QUOTE_HISTORY_SPOOL_DIR,
+            help='Directory of spooled .jsonl batches (default: QUOTE_HISTORY_SPOOL_DIR)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        files = rows = 0
+        for path in sorted(Path(options['spool_dir']).glob('*.jsonl')):
+            records = read_spool(path)
+            # A file is removed only once all of its rows are in
+            with transaction.atomic():
+                rows += write_records(records)
+            path.unlink()
+            files += 1
+            self.stdout.write(f"{path.name}: {len(records)} quote(s)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {rows} quote(s) from {files} spool file(s) in {time.perf_counter() - started:.1f} s"
+        ))
@@ -0,0 +1,85 @@
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from users.partitions import (
+    PARTITIONED_MODELS, add_months, archive_partition, convert_table, ensure_partitions,
+    expired_partitions, is_partitioned, month_start, partitions
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep FareCalculation and DiscountUsageLog in monthly PostgreSQL partitions: "
+        "create upcoming partitions and archive old ones to gzipped CSV"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='Convert the tables to partitioned tables first (once; locks them while rows are copied)'
+        )
+        parser.add_argument(
+            '--ahead',
+            type=int,
+            default=settings.HISTORY_PARTITIONS_AHEAD,
+            help='Months of partitions to create after the current one (default: HISTORY_PARTITIONS_AHEAD)'
+        )
+        parser.add_argument(
+            '--retention-months',
+            type=int,
+            default=settings.HISTORY_RETENTION_MONTHS,
+            help='Archive partitions older than this many months; 0 archives nothing '
+                 '(default: HISTORY_RETENTION_MONTHS)'
+        )
+        parser.add_argument(
+            '--archive-dir',
+            default=settings.HISTORY_ARCHIVE_DIR,
+            help='Directory for archived partitions (default: HISTORY_ARCHIVE_DIR)'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError(f"Partitioning needs PostgreSQL, not {connection.vendor}")
+        if options['ahead'] < 0 or options['retention_months'] < 0:
+            raise CommandError("--ahead and --retention-months cannot be negative")
+
+        current = month_start(timezone.now().astimezone(dt_timezone.utc).date())
+        through = add_months(current, options['ahead'])
+
+        for model in PARTITIONED_MODELS:
+            table = model._meta.db_table
+            with connection.cursor() as cursor:
+                if not is_partitioned(cursor, table):
+                    if not options['convert']:
+                        raise CommandError(f"{table} is not partitioned; run with --convert first")
+                    with transaction.atomic():
+                        try:
+                            stats = convert_table(cursor, table, through)
+                        except ValueError as e:
+                            raise CommandError(str(e))
+                    self.stdout.write(
+                        f"{table}: converted, {stats['rows']} row(s) in {stats['partitions']} partition(s)"
+                    )
+
+                with transaction.atomic():
+                    created = ensure_partitions(cursor, table, current, through)
+                if created:
+                    self.stdout.write(f"{table}: created {', '.join(created)}")
+
+                if options['retention_months']:
+                    before = add_months(current, -options['retention_months'])
+                    for name, _ in expired_partitions(partitions(cursor, table), table, before):
+                        # One transaction per partition: it is dropped only once its file is on disk
+                        try:
+                            with transaction.atomic():
+                                path, rows = archive_partition(cursor, table, name, options['archive_dir'])
+                        except FileExistsError as e:
+                            raise CommandError(f"{e}; move it away to archive {name} again")
+                        self.stdout.write(f"{table}: archived {name} ({rows} row(s)) to {path}")
+
+        self.stdout.write(self.style.SUCCESS("History partitions are up to date"))
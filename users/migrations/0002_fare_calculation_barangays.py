@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="farecalculation",
+            name="destination_barangay",
+            field=models.CharField(blank=True, db_index=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name="farecalculation",
+            name="origin_barangay",
+            field=models.CharField(blank=True, db_index=True, max_length=200),
+        ),
+    ]
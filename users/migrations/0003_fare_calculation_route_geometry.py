@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fares", "0004_route_geometry"),
+        ("users", "0002_fare_calculation_barangays"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="farecalculation",
+            name="route_geometry",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="fare_calculations",
+                to="fares.routegeometry",
+            ),
+        ),
+    ]
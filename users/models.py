@@ -68,6 +68,26 @@ class VerificationStatus(models.TextChoices):
     REJECTED = 'REJECTED', 'Rejected'
 
 
+def currently_valid(prefix: str = '') -> models.Q:
+    """DiscountCard.is_valid() as a condition on the card at prefix (e.g. 'discount_card__')"""
+    from django.utils import timezone
+    now = timezone.now().date()
+    return models.Q(**{
+        f'{prefix}is_active': True,
+        f'{prefix}verification_status': VerificationStatus.APPROVED,
+        f'{prefix}valid_from__lte': now,
+        f'{prefix}valid_until__gte': now,
+    })
+
+
+class DiscountCardQuerySet(models.QuerySet):
+    def with_validity(self):
+        """Annotate is_currently_valid, computed by the database"""
+        return self.annotate(is_currently_valid=models.ExpressionWrapper(
+            currently_valid(), output_field=models.BooleanField()
+        ))
+
+
 class DiscountCard(models.Model):
     """Discount cards for eligible users (20% discount)"""
     user = models.ForeignKey(
@@ -118,6 +138,8 @@ class DiscountCard(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = DiscountCardQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
@@ -325,6 +347,18 @@ class FareCalculation(models.Model):
         blank=True,
         help_text="Stores polyline, barangay info, waypoints, etc."
     )
+    # Polyline, bounds and steps of route_data, shared between identical routes
+    route_geometry = models.ForeignKey(
+        'fares.RouteGeometry',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='fare_calculations'
+    )
+    
+    # Resolved from the route endpoints against barangay boundaries
+    origin_barangay = models.CharField(max_length=200, blank=True, db_index=True)
+    destination_barangay = models.CharField(max_length=200, blank=True, db_index=True)
     
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     
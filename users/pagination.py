@@ -0,0 +1,15 @@
+from rest_framework.pagination import CursorPagination
+
+
+class HistoryCursorPagination(CursorPagination):
+    """
+    Keyset pagination for append-only history tables, newest first
+
+    Pages are cut with WHERE created_at < <cursor position> on the
+    created_at index instead of COUNT(*) plus OFFSET, so a deep page costs
+    the same as the first and no count is returned. id breaks ties between
+    rows created in the same instant.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
@@ -0,0 +1,227 @@
+"""
+Monthly partitioning and archival of history tables (PostgreSQL only)
+
+FareCalculation and DiscountUsageLog are insert-only and read newest first,
+so they are stored as tables partitioned by range of created_at with one
+partition per calendar month (UTC), named <table>_pYYYYMM, plus a DEFAULT
+partition that catches rows outside every monthly range. Queries and the
+(created_at, id) cursor pagination of the history endpoints only touch the
+recent partitions, whose indexes stay small.
+
+Partitions older than the retention period are copied to gzipped CSV files
+(one per partition, with a header row) and then detached and dropped.
+Archived rows are no longer served by the API.
+
+Django knows nothing of this: the models and migrations are unchanged, and
+the partitioned table keeps the same name, columns, indexes and foreign
+keys. The primary key becomes (id, created_at), as PostgreSQL requires the
+partition key in every unique constraint; ids carry on from the last one
+in the old table. The partition_history command converts the tables once
+and is then run periodically to add and archive partitions.
+"""
+import gzip
+import os
+import re
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .models import DiscountUsageLog, FareCalculation
+
+
+PARTITIONED_MODELS = (FareCalculation, DiscountUsageLog)
+PARTITION_KEY = 'created_at'
+DEFAULT_SUFFIX = '_default'
+UNPARTITIONED_SUFFIX = '_unpartitioned'
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def months_between(first: date, last: date) -> Iterator[date]:
+    """First days of the months from first to last, inclusive"""
+    month = month_start(first)
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def partition_month(table: str, name: str) -> Optional[date]:
+    """Month of a partition named by partition_name(), else None"""
+    match = re.fullmatch(re.escape(table) + r'_p(\d{4})(\d{2})', name)
+    if match is None:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def create_partition_sql(table: str, month: date) -> str:
+    end = add_months(month, 1)
+    return (
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(table, month)}" PARTITION OF "{table}" '
+        f"FOR VALUES FROM ('{month:%Y-%m-%d} 00:00:00+00') TO ('{end:%Y-%m-%d} 00:00:00+00')"
+    )
+
+
+def is_partitioned(cursor, table: str) -> bool:
+    cursor.execute(
+        "SELECT c.relkind = 'p' FROM pg_class c "
+        "WHERE c.oid = to_regclass(%s)",
+        [f'"{table}"']
+    )
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def partitions(cursor, table: str) -> List[str]:
+    """Names of the partitions attached to table"""
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+        [f'"{table}"']
+    )
+    return [name for name, in cursor.fetchall()]
+
+
+def convert_table(cursor, table: str, through: date) -> Dict:
+    """
+    Turn a plain table into a monthly partitioned one in place
+
+    Rows are copied into partitions covering every month from the oldest
+    row to through. Must run inside a transaction; the old table is dropped
+    at the end, so a failure leaves the original untouched.
+    """
+    old = f"{table}{UNPARTITIONED_SUFFIX}"
+    cursor.execute(
+        "SELECT c.relname, pg_get_indexdef(i.indexrelid), i.indisprimary, i.indisunique "
+        "FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE i.indrelid = to_regclass(%s)",
+        [f'"{table}"']
+    )
+    indexes = cursor.fetchall()
+    unique = [name for name, _, primary, is_unique in indexes if is_unique and not primary]
+    if unique:
+        raise ValueError(f"{table} has unique indexes without {PARTITION_KEY}: {', '.join(unique)}")
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+        [f'"{table}"']
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute(
+        "SELECT attidentity <> '' FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = 'id'",
+        [f'"{table}"']
+    )
+    identity = cursor.fetchone()[0]
+
+    cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+    # Index names are schema-wide; free them for the new table
+    for name, _, primary, _ in indexes:
+        if primary:
+            cursor.execute(f'ALTER TABLE "{old}" DROP CONSTRAINT "{name}"')
+        else:
+            cursor.execute(f'ALTER INDEX "{name}" RENAME TO "{name[:49]}{UNPARTITIONED_SUFFIX}"')
+
+    cursor.execute(
+        f'CREATE TABLE "{table}" (LIKE "{old}" INCLUDING DEFAULTS INCLUDING IDENTITY '
+        f'INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS) '
+        f'PARTITION BY RANGE ("{PARTITION_KEY}")'
+    )
+    cursor.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY ("id", "{PARTITION_KEY}")')
+    for name, definition, primary, _ in indexes:
+        if not primary:
+            # pg_get_indexdef was read before the rename, so it names table
+            cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+
+    cursor.execute(f'SELECT min("{PARTITION_KEY}") AT TIME ZONE \'UTC\' FROM "{old}"')
+    oldest = cursor.fetchone()[0]
+    first = month_start(oldest.date()) if oldest else month_start(through)
+    for month in months_between(first, through):
+        cursor.execute(create_partition_sql(table, month))
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS "{table}{DEFAULT_SUFFIX}" PARTITION OF "{table}" DEFAULT')
+
+    cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{old}"')
+    rows = cursor.rowcount
+    if identity:
+        # The new identity sequence starts at 1; continue after the copied ids
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+            f'COALESCE((SELECT max("id") FROM "{old}"), 0) + 1, false)',
+            [f'"{table}"']
+        )
+    else:
+        # A serial column's sequence belongs to the old table; keep it
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [f'"{old}"'])
+        cursor.execute(f'ALTER SEQUENCE {cursor.fetchone()[0]} OWNED BY "{table}"."id"')
+    cursor.execute(f'DROP TABLE "{old}"')
+    return {'rows': rows, 'partitions': len(partitions(cursor, table))}
+
+
+def ensure_partitions(cursor, table: str, first: date, through: date) -> List[str]:
+    """Create the missing monthly partitions from first to through; returns their names"""
+    existing = set(partitions(cursor, table))
+    created = []
+    for month in months_between(first, through):
+        name = partition_name(table, month)
+        if name not in existing:
+            # Fails if the DEFAULT partition already holds rows of this month
+            cursor.execute(create_partition_sql(table, month))
+            created.append(name)
+    if f"{table}{DEFAULT_SUFFIX}" not in existing:
+        cursor.execute(f'CREATE TABLE "{table}{DEFAULT_SUFFIX}" PARTITION OF "{table}" DEFAULT')
+    return created
+
+
+def expired_partitions(names: List[str], table: str, before: date) -> List[Tuple[str, date]]:
+    """(name, month) of the monthly partitions of table for months before before"""
+    expired = []
+    for name in names:
+        month = partition_month(table, name)
+        if month is not None and month < before:
+            expired.append((name, month))
+    return sorted(expired, key=lambda item: item[1])
+
+
+def archive_path(directory: Path, partition: str) -> Path:
+    return Path(directory) / f"{partition}.csv.gz"
+
+
+def archive_partition(cursor, table: str, partition: str, directory: Path) -> Tuple[Path, int]:
+    """
+    Copy a partition to a gzipped CSV file, then detach and drop it
+
+    The file is written and synced under a temporary name before the
+    partition is dropped, so a failure never loses rows. Returns the file
+    and the number of rows archived.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = archive_path(directory, partition)
+    if path.exists():
+        raise FileExistsError(f"{path} already exists")
+    partial = path.with_name(path.name + '.partial')
+
+    cursor.execute(f'SELECT count(*) FROM "{partition}"')
+    rows = cursor.fetchone()[0]
+    with gzip.open(partial, 'wt', newline='') as archive:
+        cursor.copy_expert(
+            f'COPY (SELECT * FROM "{partition}" ORDER BY "{PARTITION_KEY}", "id") TO STDOUT WITH CSV HEADER',
+            archive
+        )
+    with open(partial, 'rb') as archive:
+        os.fsync(archive.fileno())
+    os.replace(partial, path)
+
+    cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{partition}"')
+    cursor.execute(f'DROP TABLE "{partition}"')
+    return path, rows
@@ -0,0 +1,303 @@
+"""
+Write-behind recording of quotes as FareCalculation history
+
+Quotes served by /v2/routes/calculate/ are appended to an in-memory buffer
+(a dict append under a lock) and written by a background thread with one
+bulk_create every QUOTE_HISTORY_FLUSH_ROWS quotes or QUOTE_HISTORY_FLUSH_MS
+milliseconds, whichever comes first. Barangays are resolved and route
+geometries stored (see fares/route_geometry.py) for the whole batch at
+flush time, off the request path.
+
+Each batch is written in one transaction. A batch that cannot be written
+(database down, worker shutting down with the database gone) is rolled
+back and spooled to a JSON lines file in QUOTE_HISTORY_SPOOL_DIR instead
+of being dropped, as is one still being written when close() gives up
+waiting; the flush_quote_history command loads spooled files into the
+table. Quotes still in memory when a
+worker is killed outright are lost, at most FLUSH_MS worth.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from fares.route_geometry import store_geometries
+from locations.boundaries import barangay_name, boundary_resolver
+from .models import DiscountCard, FareCalculation, User
+
+
+# Rows written more than this long after their quote get its time back
+# (created_at is auto_now_add, so bulk_create stamps the flush time)
+LATE_WRITE = timedelta(seconds=5)
+
+
+def _endpoint_name(location: Optional[Dict], route: Optional[Dict], address_key: str, point) -> str:
+    """Matched location name, else the route's address, else the coordinates"""
+    if location:
+        return location['name']
+    if route and route.get(address_key):
+        return route[address_key][:500]
+    return f"{point[0]:.6f}, {point[1]:.6f}"
+
+
+def quote_record(result: Dict, origin, destination, user_id: Optional[int] = None) -> Dict:
+    """FareCalculation fields of a calculate_route_with_fare result"""
+    fare = result['fare']
+    discount_info = result.get('discount_info') or {}
+    route = result.get('route')
+    return {
+        'user_id': user_id,
+        'discount_card_id': discount_info.get('card_id'),
+        'from_location': _endpoint_name(result.get('origin_location'), route, 'start_address', origin),
+        'to_location': _endpoint_name(result.get('destination_location'), route, 'end_address', destination),
+        'distance': str(round(Decimal(str(result['distance']['kilometers'])), 2)),
+        'calculated_fare': str(fare['fare']),
+        'original_fare': str(fare['original_fare']),
+        'discount_applied': str(fare['discount_applied']),
+        'discount_type': discount_info.get('discount_type') or discount_info.get('passenger_type', ''),
+        'calculation_type': result['method'],
+        'route_data': route,
+        'origin': [float(origin[0]), float(origin[1])],
+        'destination': [float(destination[0]), float(destination[1])],
+        'created_at': timezone.now(),
+    }
+
+
+def write_records(records: Sequence[Dict]) -> int:
+    """Insert quote records with one bulk_create; returns rows written"""
+    if not records:
+        return 0
+    names = [
+        barangay_name(location) for location in
+        boundary_resolver.resolve_many([point for r in records for point in (r['origin'], r['destination'])])
+    ]
+    # A user or card may have been deleted since the quote (or a spool file
+    # edited by hand); unknown users are not linked, and a card only to its
+    # own user's quotes
+    users = set(User.objects.filter(
+        id__in={r['user_id'] for r in records if r['user_id']}
+    ).values_list('id', flat=True))
+    card_users = dict(DiscountCard.objects.filter(
+        id__in={r['discount_card_id'] for r in records if r['discount_card_id']}
+    ).values_list('id', 'user_id'))
+
+    compacted = store_geometries([record['route_data'] for record in records])
+
+    rows = []
+    for i, record in enumerate(records):
+        fields = {key: value for key, value in record.items() if key not in ('origin', 'destination', 'created_at')}
+        if fields['user_id'] not in users:
+            fields['user_id'] = None
+        if fields['user_id'] is None or card_users.get(fields['discount_card_id']) != fields['user_id']:
+            fields['discount_card_id'] = None
+        fields['route_data'], fields['route_geometry_id'] = compacted[i]
+        rows.append(FareCalculation(
+            origin_barangay=names[2 * i], destination_barangay=names[2 * i + 1], **fields
+        ))
+    FareCalculation.objects.bulk_create(rows)
+
+    late = []
+    for row, record in zip(rows, records):
+        if row.pk is not None and row.created_at - record['created_at'] > LATE_WRITE:
+            row.created_at = record['created_at']
+            late.append(row)
+    FareCalculation.objects.bulk_update(late, ['created_at'])
+    return len(rows)
+
+
+class _Spooled(Exception):
+    """The batch was spooled by close() while it was being written"""
+
+
+def spool(records: Sequence[Dict], directory: Optional[str] = None) -> Path:
+    """Write records to a new JSON lines file in the spool directory"""
+    directory = Path(directory or settings.QUOTE_HISTORY_SPOOL_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"quotes-{os.getpid()}-{time.time_ns()}.jsonl"
+    partial = path.with_suffix('.partial')
+    with open(partial, 'w') as spool_file:
+        for record in records:
+            if isinstance(record.get('created_at'), datetime):
+                # DjangoJSONEncoder would cut it to milliseconds
+                record = dict(record, created_at=record['created_at'].isoformat())
+            spool_file.write(json.dumps(record, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n')
+        spool_file.flush()
+        os.fsync(spool_file.fileno())
+    os.replace(partial, path)
+    return path
+
+
+def read_spool(path: Path) -> List[Dict]:
+    """Records of a spool file written by spool()"""
+    records = []
+    with open(path) as spool_file:
+        for line in spool_file:
+            if line.strip():
+                record = json.loads(line)
+                record['created_at'] = parse_datetime(record['created_at'])
+                records.append(record)
+    return records
+
+
+class QuoteHistoryBuffer:
+    """Per-process buffer of quote records flushed by a background thread"""
+
+    def __init__(self, flush_rows: int, flush_seconds: float):
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._condition = threading.Condition()
+        self._pending: List[Dict] = []
+        # Batch taken by the flusher until written or spooled
+        self._in_flight: Optional[List[Dict]] = None
+        self._committing = False
+        self._first_at = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._closed = False
+
+    def record(self, record: Dict) -> None:
+        """Queue a quote record; never touches the database"""
+        with self._condition:
+            if self._closed:
+                return
+            if self._pid != os.getpid():
+                # First quote in this (possibly forked) worker
+                self._start()
+            if not self._pending:
+                # Wake the flusher to start the batch's clock
+                self._first_at = time.monotonic()
+                self._condition.notify()
+            self._pending.append(record)
+            if len(self._pending) >= self.flush_rows:
+                self._condition.notify()
+
+    def _start(self) -> None:
+        self._pending = []
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='quote-history', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _take(self) -> Optional[List[Dict]]:
+        """Wait for a full or old enough batch; None once closed and drained"""
+        with self._condition:
+            while True:
+                if self._pending and (
+                    self._closed
+                    or len(self._pending) >= self.flush_rows
+                    or time.monotonic() - self._first_at >= self.flush_seconds
+                ):
+                    batch, self._pending = self._pending, []
+                    self._in_flight, self._committing = batch, False
+                    return batch
+                if self._closed:
+                    return None
+                timeout = None
+                if self._pending:
+                    timeout = self.flush_seconds - (time.monotonic() - self._first_at)
+                self._condition.wait(timeout)
+
+    def _run(self) -> None:
+        try:
+            while True:
+                batch = self._take()
+                if batch is None:
+                    return
+                # This thread never sees a request, so do what Django does at
+                # each one: drop a connection that broke (database restart)
+                # or outlived CONN_MAX_AGE, and reconnect for this batch
+                close_old_connections()
+                self.flush_batch(batch, claim=lambda: self._claim(batch))
+                with self._condition:
+                    self._in_flight = None
+        finally:
+            connection.close()
+
+    def _claim(self, batch: List[Dict]) -> bool:
+        """Whether the flusher still owns batch; once it does, close() leaves it alone"""
+        with self._condition:
+            if self._in_flight is not batch:
+                return False
+            self._committing = True
+            return True
+
+    @staticmethod
+    def flush_batch(batch: List[Dict], claim: Optional[Callable[[], bool]] = None) -> None:
+        """
+        Write a batch in one transaction, or spool it if that fails
+
+        claim() is asked before committing or spooling; when it returns
+        False the batch is already spooled and the write is rolled back.
+        """
+        try:
+            with transaction.atomic():
+                write_records(batch)
+                if claim is not None and not claim():
+                    raise _Spooled
+        except _Spooled:
+            pass
+        except Exception as e:
+            if claim is not None and not claim():
+                return
+            try:
+                path = spool(batch)
+            except OSError as spool_error:
+                print(f"Quote history write error ({len(batch)} quotes lost): {e}; spool: {spool_error}")
+            else:
+                print(f"Quote history write error ({len(batch)} quotes spooled to {path}): {e}")
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stop accepting quotes and write (or spool) what is left"""
+        with self._condition:
+            if self._closed or self._pid != os.getpid():
+                # Nothing recorded here (a forked child holds its parent's state)
+                return
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        thread.join(timeout)
+        with self._condition:
+            batch, self._pending = self._pending, []
+            if self._in_flight is not None and not self._committing:
+                # Still being written: spool it too, and the flusher rolls it back
+                batch, self._in_flight = self._in_flight + batch, None
+        if batch:
+            # The flusher did not finish in time; keep the rest on disk
+            spool(batch)
+
+
+class _QuoteHistory:
+    """Module entry point; the buffer is created on first use from settings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffer: Optional[QuoteHistoryBuffer] = None
+
+    def buffer(self) -> QuoteHistoryBuffer:
+        if self._buffer is None:
+            with self._lock:
+                if self._buffer is None:
+                    self._buffer = QuoteHistoryBuffer(
+                        settings.QUOTE_HISTORY_FLUSH_ROWS,
+                        settings.QUOTE_HISTORY_FLUSH_MS / 1000
+                    )
+        return self._buffer
+
+    def record(self, result: Dict, origin, destination, user_id: Optional[int] = None) -> None:
+        """Record a successful quote when QUOTE_HISTORY_ENABLED"""
+        if settings.QUOTE_HISTORY_ENABLED and result.get('success'):
+            self.buffer().record(quote_record(result, origin, destination, user_id))
+
+
+quote_history = _QuoteHistory()
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+
+from fares.route_geometry import expand_route_data, wants_steps
 from .models import (
     Vehicle, DiscountCard, DiscountUsageLog,
     Incident, FareCalculation
@@ -87,7 +89,9 @@ class DiscountCardSerializer(serializers.ModelSerializer):
         ]
     
     def get_is_currently_valid(self, obj):
-        """Check if card is currently valid"""
+        """Check if card is currently valid (annotated by with_validity() when loaded through it)"""
+        if hasattr(obj, 'is_currently_valid'):
+            return obj.is_currently_valid
         return obj.is_valid()
 
 
@@ -156,6 +160,34 @@ class FareCalculationSerializer(serializers.ModelSerializer):
             'from_location', 'to_location', 'distance', 'calculated_fare',
             'actual_fare', 'original_fare', 'discount_applied', 'discount_type',
             'discount_card', 'discount_card_details', 'calculation_type',
-            'route_data', 'created_at'
+            'route_data', 'origin_barangay', 'destination_barangay', 'created_at'
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['id', 'origin_barangay', 'destination_barangay', 'created_at']
+    
+    def to_representation(self, instance):
+        """Stored route_data with its geometry restored; steps only with ?include=steps"""
+        data = super().to_representation(instance)
+        request = self.context.get('request')
+        data['route_data'] = expand_route_data(
+            instance.route_data, instance.route_geometry,
+            include_steps=request is not None and wants_steps(request)
+        )
+        return data
+
+
+class FareCalculationCompactSerializer(serializers.ModelSerializer):
+    """Flat, read-only FareCalculation for history lists (?view=compact)"""
+    username = serializers.CharField(source='user.username', read_only=True, default=None)
+    vehicle_plate_number = serializers.CharField(source='vehicle.plate_number', read_only=True, default=None)
+    discount_card_is_currently_valid = serializers.BooleanField(read_only=True, allow_null=True)
+    
+    class Meta:
+        model = FareCalculation
+        fields = [
+            'id', 'user', 'username', 'vehicle', 'vehicle_plate_number',
+            'from_location', 'to_location', 'origin_barangay', 'destination_barangay',
+            'distance', 'calculated_fare', 'actual_fare', 'original_fare',
+            'discount_applied', 'discount_type', 'discount_card',
+            'discount_card_is_currently_valid', 'calculation_type', 'created_at'
+        ]
+        read_only_fields = fields
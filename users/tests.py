@@ -1,3 +1,510 @@
-from django.test import TestCase
+import gzip
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from googlemaps.convert import encode_polyline
+
+from bfg.testing import LOCAL_CACHES, ListQueryCountMixin
+from fares.fare_calculator import calculate_route_with_fare
+from fares.models import RouteGeometry
+from fares.road_multipliers import route_endpoints
+from .models import DiscountCard, FareCalculation, Incident, User, Vehicle
+from .partitions import (
+    add_months, archive_partition, create_partition_sql, expired_partitions, months_between,
+    partition_month, partition_name
+)
+from .quote_history import QuoteHistoryBuffer, quote_history, quote_record, read_spool, spool, write_records
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class FareCalculationListTests(ListQueryCountMixin, TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', role='ADMIN'
+        )
+        self.client.force_login(self.admin)
+        self.today = date.today()
+
+    def add_calculations(self, count):
+        start = Vehicle.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user(username=f'rider{i}', email=f'rider{i}@example.com')
+            vehicle = Vehicle.objects.create(owner=user, plate_number=f'ABC {i}', vehicle_type='TRICYCLE')
+            card = DiscountCard.objects.create(
+                user=user, discount_type='STUDENT', id_number=f'ID-{i}', id_image='card.png',
+                verification_status='APPROVED' if i % 2 else 'PENDING',
+                valid_from=self.today - timedelta(days=30), valid_until=self.today + timedelta(days=30)
+            )
+            FareCalculation.objects.create(
+                user=user, vehicle=vehicle, discount_card=card, from_location='Mercado',
+                to_location='Amandayehan', distance=Decimal('6.42'), calculated_fare=Decimal('24.00'),
+                route_data={'steps': ['x' * 100]}
+            )
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        # Session and user, rows, and the cards unless compact
+        expected = {'/v2/fare-calculations/': 4, '/v2/fare-calculations/?view=compact': 3}
+        for path, queries in expected.items():
+            FareCalculation.objects.all().delete()
+            page = self.assertListQueries(path, self.add_calculations, queries)
+            self.assertEqual(len(page['results']), 22)
+
+    def test_nested_representation(self):
+        self.add_calculations(2)
+        page, _ = self.list_queries('/v2/fare-calculations/')
+        rows = sorted(page['results'], key=lambda row: row['id'])
+        self.assertEqual(rows[0]['vehicle_details']['owner_details']['username'], 'rider0')
+        self.assertEqual(rows[0]['discount_card_details']['user_details']['username'], 'rider0')
+        self.assertEqual(
+            [row['discount_card_details']['is_currently_valid'] for row in rows], [False, True]
+        )
+        self.assertEqual(rows[0]['route_data'], {'steps': ['x' * 100]})
+
+    def test_compact_representation(self):
+        self.add_calculations(2)
+        FareCalculation.objects.create(
+            from_location='Mercado', to_location='Guirang',
+            distance=Decimal('2.00'), calculated_fare=Decimal('15.00')
+        )
+        page, _ = self.list_queries('/v2/fare-calculations/?view=compact')
+        rows = sorted(page['results'], key=lambda row: row['id'])
+        self.assertEqual(rows[0]['username'], 'rider0')
+        self.assertEqual(rows[0]['vehicle_plate_number'], 'ABC 0')
+        self.assertNotIn('route_data', rows[0])
+        self.assertEqual([row['discount_card_is_currently_valid'] for row in rows], [False, True, None])
+        self.assertIsNone(rows[2]['username'])
+
+        detail = self.client.get(f"/v2/fare-calculations/{rows[1]['id']}/?view=compact").json()
+        self.assertEqual(detail, rows[1])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class HistoryPaginationTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', role='ADMIN'
+        )
+        self.client.force_login(self.admin)
+
+    def test_pages_follow_created_at_without_counting(self):
+        calculations = FareCalculation.objects.bulk_create([
+            FareCalculation(
+                from_location='Mercado', to_location=f'Sitio {i}',
+                distance=Decimal('1.00'), calculated_fare=Decimal('15.00')
+            )
+            for i in range(7)
+        ])
+        # Several rows share a timestamp; id keeps their order stable
+        now = timezone.now()
+        for i, calculation in enumerate(calculations):
+            FareCalculation.objects.filter(pk=calculation.pk).update(
+                created_at=now - timedelta(minutes=i // 3)
+            )
+
+        seen = []
+        url = '/v2/fare-calculations/?page_size=2&view=compact'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.client.get(url).json()
+            self.assertNotIn('count', page)
+            self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+            seen.extend(row['id'] for row in page['results'])
+            url = page['next']
+        self.assertEqual(seen, list(
+            FareCalculation.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        ))
+        self.assertEqual(len(seen), 7)
+
+    def test_incidents_are_paged_by_cursor(self):
+        for i in range(3):
+            Incident.objects.create(
+                user=self.admin, incident_type='OVERCHARGING', description=f'Incident {i}'
+            )
+        page = self.client.get('/v2/incidents/?page_size=2').json()
+        self.assertEqual(len(page['results']), 2)
+        self.assertIn('cursor=', page['next'])
+        self.assertIsNone(page['previous'])
+        rest = self.client.get(page['next']).json()
+        self.assertEqual(
+            [row['description'] for row in page['results'] + rest['results']],
+            ['Incident 2', 'Incident 1', 'Incident 0']
+        )
+
+
+ORIGIN = (11.28026, 125.06909)
+DESTINATION = (11.2768363, 125.0114879)
+
+
+class QuoteHistoryTests(TestCase):
+    def setUp(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_dir = spool_dir.name
+        override = override_settings(QUOTE_HISTORY_SPOOL_DIR=self.spool_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.rider = User.objects.create_user(username='rider', email='rider@example.com')
+        today = timezone.localdate()
+        self.card = DiscountCard.objects.create(
+            user=self.rider, discount_type='STUDENT', id_number='ID-rider', id_image='card.png',
+            verification_status='APPROVED',
+            valid_from=today - timedelta(days=30), valid_until=today + timedelta(days=30)
+        )
+
+    def quote(self, passenger_type='REGULAR'):
+        result = calculate_route_with_fare(
+            ORIGIN, DESTINATION, use_google_maps=False, passenger_type=passenger_type
+        )
+        return quote_record(result, ORIGIN, DESTINATION, self.rider.id)
+
+    def test_records_become_rows(self):
+        record = self.quote('STUDENT')
+        record['user_id'] = 999999  # Unknown users are not linked
+        other = self.quote()
+        self.assertEqual(write_records([record, other]), 2)
+
+        rows = FareCalculation.objects.order_by('id')
+        self.assertIsNone(rows[0].user_id)
+        self.assertEqual(rows[1].user_id, self.rider.id)
+        self.assertEqual(rows[0].calculation_type, 'gps')
+        self.assertEqual(rows[0].discount_type, 'STUDENT')
+        self.assertEqual(rows[0].from_location, '11.280260, 125.069090')
+        self.assertEqual(rows[0].distance, Decimal(record['distance']))
+        self.assertLess(rows[0].calculated_fare, rows[0].original_fare)
+        self.assertEqual(rows[1].calculated_fare, rows[1].original_fare)
+
+    def test_cards_are_only_linked_to_their_own_users_quotes(self):
+        stranger = User.objects.create_user(username='stranger', email='stranger@example.com')
+        records = [
+            dict(self.quote(), discount_card_id=self.card.id),
+            dict(self.quote(), discount_card_id=self.card.id, user_id=stranger.id),
+            dict(self.quote(), discount_card_id=self.card.id, user_id=None),
+        ]
+        write_records(records)
+        self.assertEqual(
+            list(FareCalculation.objects.order_by('id').values_list('discount_card_id', flat=True)),
+            [self.card.id, None, None]
+        )
+
+    def test_buffer_flushes_full_and_old_batches(self):
+        batches, flushed = [], threading.Event()
+
+        def capture(batch, claim=None):
+            batches.append(batch)
+            flushed.set()
+
+        with mock.patch.object(QuoteHistoryBuffer, 'flush_batch', side_effect=capture):
+            buffer = QuoteHistoryBuffer(flush_rows=3, flush_seconds=60)
+            for i in range(3):
+                buffer.record({'n': i})
+            self.assertTrue(flushed.wait(5))
+            self.assertEqual(batches, [[{'n': 0}, {'n': 1}, {'n': 2}]])
+            buffer.close()
+
+            flushed.clear()
+            buffer = QuoteHistoryBuffer(flush_rows=100, flush_seconds=0.05)
+            buffer.record({'n': 3})
+            self.assertTrue(flushed.wait(5))
+            self.assertEqual(batches[-1], [{'n': 3}])
+            buffer.close()
+
+    def test_failed_batches_are_spooled_and_loaded(self):
+        record = self.quote()
+        with mock.patch('users.quote_history.write_records', side_effect=RuntimeError('database is down')), \
+                mock.patch('builtins.print'):
+            QuoteHistoryBuffer.flush_batch([record])
+        [path] = Path(self.spool_dir).glob('*.jsonl')
+        self.assertEqual(read_spool(path)[0]['created_at'], record['created_at'])
+
+        # Replayed rows keep the time of the quote, not of the replay
+        quoted_at = record['created_at'] - timedelta(hours=2)
+        spool([dict(record, created_at=quoted_at)], self.spool_dir)
+        out = StringIO()
+        call_command('flush_quote_history', stdout=out)
+        self.assertIn('Loaded 2 quote(s) from 2 spool file(s)', out.getvalue())
+        self.assertEqual(list(Path(self.spool_dir).iterdir()), [])
+        self.assertEqual(
+            sorted(FareCalculation.objects.values_list('created_at', flat=True))[0], quoted_at
+        )
+
+    def test_close_spools_what_is_left(self):
+        release = threading.Event()
+        with mock.patch.object(QuoteHistoryBuffer, 'flush_batch', side_effect=lambda batch, claim: release.wait(5)):
+            buffer = QuoteHistoryBuffer(flush_rows=1, flush_seconds=60)
+            buffer.record({'n': 0, 'created_at': None})
+            # The flusher is stuck writing the first batch
+            while buffer._pending:
+                pass
+            buffer.record({'n': 1, 'created_at': None})
+            buffer.close(timeout=0.05)
+            release.set()
+        [path] = Path(self.spool_dir).glob('*.jsonl')
+        # The batch in flight too, not only the queued one
+        self.assertIn('"n":0', path.read_text())
+        self.assertIn('"n":1', path.read_text())
+
+    def test_batch_spooled_by_close_is_not_spooled_again(self):
+        writing, release = threading.Event(), threading.Event()
+
+        def slow_failing_write(batch):
+            writing.set()
+            release.wait(5)
+            raise RuntimeError('database is down')
+
+        with mock.patch('users.quote_history.write_records', side_effect=slow_failing_write), \
+                mock.patch('users.quote_history.transaction'), mock.patch('builtins.print'):
+            buffer = QuoteHistoryBuffer(flush_rows=1, flush_seconds=60)
+            buffer.record(self.quote())
+            self.assertTrue(writing.wait(5))
+            buffer.close(timeout=0.05)
+            release.set()
+            buffer._thread.join(5)
+        self.assertEqual(len(list(Path(self.spool_dir).glob('*.jsonl'))), 1)
+
+    def test_batch_spooled_meanwhile_is_rolled_back(self):
+        QuoteHistoryBuffer.flush_batch([self.quote()], claim=lambda: False)
+        self.assertFalse(FareCalculation.objects.exists())
+        self.assertEqual(list(Path(self.spool_dir).glob('*.jsonl')), [])
+
+    def test_failed_batch_is_not_half_written(self):
+        with mock.patch.object(FareCalculation.objects, 'bulk_update', side_effect=RuntimeError('lost')), \
+                mock.patch('builtins.print'):
+            QuoteHistoryBuffer.flush_batch([self.quote()])
+        self.assertFalse(FareCalculation.objects.exists())
+        self.assertEqual(len(list(Path(self.spool_dir).glob('*.jsonl'))), 1)
+
+    def queued_quote(self, path):
+        with mock.patch.object(quote_history, 'buffer') as buffer:
+            response = self.client.post(path, {
+                'origin': list(ORIGIN), 'destination': list(DESTINATION),
+                'use_google_maps': False, 'passenger_type': 'STUDENT', 'user_id': self.rider.id,
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        record = buffer.return_value.record.call_args.args[0]
+        self.assertEqual(record['calculated_fare'], str(response.json()['fare']['fare']))
+        return record
+
+    @override_settings(QUOTE_HISTORY_ENABLED=True)
+    def test_calculate_route_queues_the_quote(self):
+        # The user_id in the body is not trusted
+        record = self.queued_quote('/v2/routes/calculate/')
+        self.assertEqual([record['user_id'], record['discount_card_id']], [None, None])
+
+        self.client.force_login(self.rider)
+        record = self.queued_quote('/v2/routes/calculate/')
+        self.assertEqual([record['user_id'], record['discount_card_id']], [self.rider.id, self.card.id])
+
+    @override_settings(QUOTE_HISTORY_ENABLED=True, CACHES=LOCAL_CACHES)
+    def test_async_calculate_route_queues_the_signed_in_user(self):
+        record = self.queued_quote('/v2/routes/calculate/async/')
+        self.assertEqual([record['user_id'], record['discount_card_id']], [None, None])
+
+        self.client.force_login(self.rider)
+        record = self.queued_quote('/v2/routes/calculate/async/')
+        self.assertEqual([record['user_id'], record['discount_card_id']], [self.rider.id, self.card.id])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class QuoteHistoryFlusherTests(TransactionTestCase):
+    """The flusher thread against the real database (committed, not in a test transaction)"""
+
+    def setUp(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_dir = Path(spool_dir.name)
+        override = override_settings(QUOTE_HISTORY_SPOOL_DIR=spool_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def quote(self):
+        result = calculate_route_with_fare(ORIGIN, DESTINATION, use_google_maps=False)
+        return quote_record(result, ORIGIN, DESTINATION)
+
+    def test_batch_after_a_dropped_connection_is_written(self):
+        DatabaseWrapper = type(connections['default'])
+        flush_batch = QuoteHistoryBuffer.flush_batch
+
+        def flush_then_drop_connection(batch, claim=None):
+            flush_batch(batch, claim)
+            # The database restarts while the flusher waits: the socket is
+            # gone and the last use of it failed, which is what Django
+            # checks before each request
+            connection.connection.close()
+            connection.errors_occurred = True
+
+        # sqlite3 reports a closed connection as usable, and Django never
+        # closes an in-memory database; a network database does both
+        with mock.patch.object(DatabaseWrapper, 'is_usable', return_value=False), \
+                mock.patch.object(DatabaseWrapper, 'is_in_memory_db', return_value=False), \
+                mock.patch.object(QuoteHistoryBuffer, 'flush_batch', side_effect=flush_then_drop_connection), \
+                mock.patch('builtins.print'):
+            buffer = QuoteHistoryBuffer(flush_rows=1, flush_seconds=60)
+            buffer.record(self.quote())
+            deadline = time.monotonic() + 5
+            while not FareCalculation.objects.exists() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            buffer.record(self.quote())
+            buffer.close()
+        self.assertEqual(FareCalculation.objects.count(), 2)
+        self.assertEqual(list(self.spool_dir.glob('*.jsonl')), [])
+
+def directions_route(steps=12):
+    return {
+        'polyline': encode_polyline([ORIGIN, (11.279, 125.04), DESTINATION]),
+        'bounds': {'northeast': {'lat': 11.281, 'lng': 125.07}, 'southwest': {'lat': 11.276, 'lng': 125.01}},
+        'distance': {'meters': 6420, 'kilometers': 6.42, 'text': '6.4 km'},
+        'duration': {'seconds': 720, 'text': '12 mins'},
+        'start_address': 'Basey',
+        'end_address': 'Amandayehan',
+        'steps': [
+            {'distance': '0.5 km', 'duration': '1 min', 'instruction': f'Head <b>west</b> on Road {i}'}
+            for i in range(steps)
+        ],
+    }
+
+
+class RouteGeometryTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', role='ADMIN')
+        self.client.force_login(self.admin)
+
+    def post(self, route_data):
+        response = self.client.post('/v2/fare-calculations/', {
+            'from_location': 'Basey', 'to_location': 'Amandayehan', 'distance': '6.42',
+            'calculated_fare': '24.00', 'calculation_type': 'google_maps', 'route_data': route_data,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_identical_routes_share_one_geometry(self):
+        route = directions_route()
+        created = self.post(route)
+        self.post(route)
+        self.assertEqual(RouteGeometry.objects.count(), 1)
+        self.assertNotIn('steps', created['route_data'])
+
+        stored = FareCalculation.objects.first()
+        self.assertEqual(stored.route_geometry_id, stored.route_data['geometry'])
+        self.assertNotIn('polyline', stored.route_data)
+        self.assertEqual(route_endpoints(stored.route_data), route_endpoints(route))
+
+        listed = self.client.get('/v2/fare-calculations/').json()['results'][0]['route_data']
+        self.assertEqual(listed['polyline'], route['polyline'])
+        self.assertEqual(listed['bounds'], route['bounds'])
+        self.assertNotIn('steps', listed)
+        listed = self.client.get('/v2/fare-calculations/?include=steps').json()['results'][0]['route_data']
+        self.assertEqual(listed['steps'], route['steps'])
+
+    def test_quote_history_stores_geometry(self):
+        result = calculate_route_with_fare(ORIGIN, DESTINATION, use_google_maps=False)
+        result = dict(result, route=directions_route(), method='google_maps')
+        write_records([quote_record(result, ORIGIN, DESTINATION)])
+        row = FareCalculation.objects.get()
+        self.assertIsNotNone(row.route_geometry)
+        self.assertEqual(row.route_data['distance']['meters'], 6420)
+
+    def test_compact_existing_history(self):
+        route = directions_route()
+        legacy = [
+            FareCalculation.objects.create(
+                from_location='Basey', to_location='Amandayehan', distance=Decimal('6.42'),
+                calculated_fare=Decimal('24.00'), calculation_type='google_maps', route_data=route_data
+            )
+            for route_data in (route, {'success': True, 'route': route}, {'method': 'gps'})
+        ]
+        before = self.client.get('/v2/fare-calculations/?include=steps').json()['results']
+
+        out = StringIO()
+        call_command('compact_route_data', stdout=out)
+        self.assertIn('2 compacted', out.getvalue())
+        self.assertEqual(RouteGeometry.objects.count(), 1)
+        self.assertEqual(FareCalculation.objects.filter(route_geometry__isnull=True).get().id, legacy[2].id)
+
+        after = self.client.get('/v2/fare-calculations/?include=steps').json()['results']
+        for old, new in zip(before, after):
+            # Only the derived endpoints are new
+            self.assertEqual(
+                {k: v for k, v in (new['route_data'].get('route') or new['route_data']).items()
+                 if k not in ('origin', 'destination')},
+                old['route_data'].get('route') or old['route_data']
+            )
+        nested = next(row for row in after if row['id'] == legacy[1].id)
+        self.assertNotIn('steps', self.client.get(f'/v2/fare-calculations/{legacy[1].id}/').json()['route_data']['route'])
+        self.assertEqual(nested['route_data']['success'], True)
+
+
+class HistoryPartitionTests(TestCase):
+    """Monthly partitions of history tables (the SQL itself needs PostgreSQL)"""
+
+    def test_month_arithmetic(self):
+        self.assertEqual(add_months(date(2026, 11, 1), 2), date(2027, 1, 1))
+        self.assertEqual(add_months(date(2026, 1, 1), -1), date(2025, 12, 1))
+        self.assertEqual(
+            list(months_between(date(2026, 11, 17), date(2027, 1, 1))),
+            [date(2026, 11, 1), date(2026, 12, 1), date(2027, 1, 1)]
+        )
+
+    def test_partition_names_and_bounds(self):
+        name = partition_name('users_farecalculation', date(2026, 12, 1))
+        self.assertEqual(name, 'users_farecalculation_p202612')
+        self.assertEqual(partition_month('users_farecalculation', name), date(2026, 12, 1))
+        self.assertIsNone(partition_month('users_farecalculation', 'users_farecalculation_default'))
+        self.assertIsNone(partition_month('users_farecalculation', 'users_discountusagelog_p202612'))
+        self.assertEqual(
+            create_partition_sql('users_farecalculation', date(2026, 12, 1)),
+            'CREATE TABLE IF NOT EXISTS "users_farecalculation_p202612" PARTITION OF "users_farecalculation" '
+            "FOR VALUES FROM ('2026-12-01 00:00:00+00') TO ('2027-01-01 00:00:00+00')"
+        )
+
+    def test_expired_partitions_skip_default_and_current(self):
+        table = 'users_discountusagelog'
+        names = [f'{table}_p202610', f'{table}_default', f'{table}_p202509', f'{table}_p202510']
+        self.assertEqual(
+            expired_partitions(names, table, date(2026, 10, 1)),
+            [(f'{table}_p202509', date(2025, 9, 1)), (f'{table}_p202510', date(2025, 10, 1))]
+        )
+
+    def test_archive_writes_file_before_dropping(self):
+        statements = []
+        cursor = mock.Mock()
+        cursor.execute.side_effect = lambda sql, *args: statements.append(sql)
+        cursor.fetchone.return_value = (2,)
+
+        def copy_expert(sql, archive):
+            statements.append(sql)
+            archive.write('id,created_at\n1,2025-09-01\n2,2025-09-02\n')
+        cursor.copy_expert.side_effect = copy_expert
+
+        with tempfile.TemporaryDirectory() as directory:
+            path, rows = archive_partition(cursor, 'users_farecalculation', 'users_farecalculation_p202509', directory)
+            self.assertEqual(rows, 2)
+            self.assertEqual(path.name, 'users_farecalculation_p202509.csv.gz')
+            with gzip.open(path, 'rt') as archive:
+                self.assertEqual(archive.read().splitlines()[1:], ['1,2025-09-01', '2,2025-09-02'])
+            self.assertEqual(list(Path(directory).iterdir()), [path])
+
+            self.assertTrue(statements[1].startswith('COPY'))
+            self.assertEqual(statements[2:], [
+                'ALTER TABLE "users_farecalculation" DETACH PARTITION "users_farecalculation_p202509"',
+                'DROP TABLE "users_farecalculation_p202509"',
+            ])
+
+            # An archive is never overwritten
+            with self.assertRaises(FileExistsError):
+                archive_partition(cursor, 'users_farecalculation', 'users_farecalculation_p202509', directory)
+
+    def test_command_needs_postgresql(self):
+        with self.assertRaisesMessage(CommandError, 'PostgreSQL'):
+            call_command('partition_history', stdout=StringIO())
@@ -4,16 +4,21 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from django.db.models import BooleanField, Case, Prefetch, Value, When
 
 from .models import (
     Vehicle, DiscountCard, DiscountUsageLog,
-    Incident, FareCalculation
+    Incident, FareCalculation, currently_valid
 )
 from .serializers import (
     UserSerializer, VehicleSerializer, DiscountCardSerializer,
     DiscountCardVerificationSerializer, DiscountUsageLogSerializer,
-    IncidentSerializer, IncidentUpdateSerializer, FareCalculationSerializer
+    IncidentSerializer, IncidentUpdateSerializer, FareCalculationSerializer,
+    FareCalculationCompactSerializer
 )
+from .pagination import HistoryCursorPagination
+from fares.route_geometry import store_geometries, wants_steps
+from locations.boundaries import fare_barangays
 
 User = get_user_model()
 
@@ -101,6 +106,7 @@ class DiscountUsageLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = DiscountUsageLog.objects.all()
     serializer_class = DiscountUsageLogSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = HistoryCursorPagination
     
     def get_queryset(self):
         """Filter based on user role"""
@@ -114,6 +120,7 @@ class IncidentViewSet(viewsets.ModelViewSet):
     queryset = Incident.objects.all()
     serializer_class = IncidentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = HistoryCursorPagination
     
     def get_queryset(self):
         """Filter based on user role and query params"""
@@ -169,16 +176,66 @@ class FareCalculationViewSet(viewsets.ModelViewSet):
     queryset = FareCalculation.objects.all()
     serializer_class = FareCalculationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = HistoryCursorPagination
+    
+    def is_compact(self):
+        """Flat rows requested with ?view=compact (reads only)"""
+        return (
+            self.action in ('list', 'retrieve')
+            and self.request.query_params.get('view') == 'compact'
+        )
+    
+    def get_serializer_class(self):
+        if self.is_compact():
+            return FareCalculationCompactSerializer
+        return FareCalculationSerializer
     
     def get_queryset(self):
-        """Filter based on user role"""
+        """Filter based on user role; load everything a page serializes up front"""
         if self.request.user.role in ['ADMIN', 'MODERATOR']:
-            return FareCalculation.objects.all()
-        return FareCalculation.objects.filter(user=self.request.user)
+            queryset = FareCalculation.objects.all()
+        else:
+            queryset = FareCalculation.objects.filter(user=self.request.user)
+        
+        if self.is_compact():
+            return queryset.select_related('user', 'vehicle').defer('route_data').annotate(
+                discount_card_is_currently_valid=Case(
+                    When(discount_card__isnull=True, then=Value(None)),
+                    When(currently_valid('discount_card__'), then=Value(True)),
+                    default=Value(False),
+                    output_field=BooleanField()
+                )
+            )
+        # Cards are fetched in one extra query so their validity can be annotated on them
+        queryset = queryset.select_related('user', 'vehicle__owner', 'route_geometry').prefetch_related(
+            Prefetch('discount_card', queryset=DiscountCard.objects.select_related('user').with_validity())
+        )
+        if not wants_steps(self.request):
+            queryset = queryset.defer('route_geometry__steps')
+        return queryset
+    
+    @staticmethod
+    def route_fields(serializer):
+        """Compacted route_data and its geometry reference, when route_data is written"""
+        if 'route_data' not in serializer.validated_data:
+            return {}
+        [(route_data, digest)] = store_geometries([serializer.validated_data['route_data']])
+        return {'route_data': route_data, 'route_geometry_id': digest}
     
     def perform_create(self, serializer):
-        """Set user to current user if not provided"""
+        """Set user to current user if not provided; tag the barangays of the route"""
+        origin_barangay, destination_barangay = fare_barangays(
+            serializer.validated_data.get('route_data')
+        )
+        extra = {
+            'origin_barangay': origin_barangay,
+            'destination_barangay': destination_barangay,
+            **self.route_fields(serializer)
+        }
         if not serializer.validated_data.get('user'):
-            serializer.save(user=self.request.user)
+            serializer.save(user=self.request.user, **extra)
         else:
-            serializer.save()
+            serializer.save(**extra)
+    
+    def perform_update(self, serializer):
+        serializer.save(**self.route_fields(serializer))